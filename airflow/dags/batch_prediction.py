@@ -0,0 +1,42 @@
+import os
+import pendulum
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+
+# daily scoring of the csv files (one per truck per day) synced from the input bucket, files already scored by the
+# current model are skipped so a rerun only predicts new inputs
+with DAG(
+    'sensor_batch_prediction',
+    default_args={'retries': 2},
+    description='Sensor Fault Detection batch prediction',
+    schedule_interval="@daily",
+    start_date=pendulum.datetime(2022, 12, 11, tz="UTC"),
+    catchup=False,
+    tags=['example'],
+) as dag:
+
+    def download_input_files(**kwargs):
+        bucket_name = os.getenv("BUCKET_NAME")
+        input_dir = "/app/input_files"
+        os.makedirs(input_dir, exist_ok=True)
+        os.system(f"aws s3 sync s3://{bucket_name}/input_files {input_dir}")
+
+    def batch_prediction(**kwargs):
+        from sensor.pipeline.batch_prediction import start_multi_file_batch_prediction
+        input_dir = "/app/input_files"
+        manifest_file_path = start_multi_file_batch_prediction(input_path=input_dir)
+        print(manifest_file_path)
+
+    def sync_prediction_dir_to_s3_bucket(**kwargs):
+        bucket_name = os.getenv("BUCKET_NAME")
+        os.system(f"aws s3 sync /app/prediction s3://{bucket_name}/prediction_files")
+
+    download_input_files = PythonOperator(task_id="download_file", python_callable=download_input_files)
+
+    generate_prediction_files = PythonOperator(task_id="prediction", python_callable=batch_prediction)
+
+    upload_prediction_files = PythonOperator(task_id="upload_prediction_files",
+                                             python_callable=sync_prediction_dir_to_s3_bucket)
+
+    # defining order of execution
+    download_input_files >> generate_prediction_files >> upload_prediction_files
@@ -0,0 +1,11 @@
+# http scoring service of the latest saved model
+# usage: python app.py  (or uvicorn app:app --host 0.0.0.0 --port 8000)
+import uvicorn
+from sensor.entity.config_entity import ScoringServiceConfig
+from sensor.scoring_service import create_app
+
+config = ScoringServiceConfig()
+app = create_app(config)
+
+if __name__=="__main__":
+     uvicorn.run(app, host=config.host, port=config.port)
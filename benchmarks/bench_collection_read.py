@@ -0,0 +1,54 @@
+# compares peak memory and wall time of the old list(find()) read path against the streaming column reader
+# usage: python benchmarks/bench_collection_read.py [database_name] [collection_name] [n_workers]
+# MONGO_DB_URL must point to a mongodb holding the collection (run data_dump.py first)
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sensor import utils
+from sensor.config import mongo_client
+
+
+def read_with_find(database_name:str, collection_name:str)->pd.DataFrame:
+    # path used before the streaming reader: one python dict per document, then object columns
+    df = pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
+    if "_id" in df.columns:
+        df.drop("_id", axis=1, inplace=True)
+    df.replace(to_replace="na", value=np.nan, inplace=True)
+    return df
+
+
+def read_with_stream(database_name:str, collection_name:str)->pd.DataFrame:
+    return utils.get_collection_as_dataframe(database_name=database_name, collection_name=collection_name)
+
+
+def read_with_partitions(n_workers:int):
+    def read_fn(database_name:str, collection_name:str)->pd.DataFrame:
+        return utils.get_collection_as_dataframe(database_name=database_name, collection_name=collection_name, 
+                                                 n_workers=n_workers)
+    return read_fn
+
+
+def measure(name:str, read_fn, database_name:str, collection_name:str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = read_fn(database_name, collection_name)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    df_size = df.memory_usage(deep=True).sum()
+    print(f"{name:<10} rows: {df.shape[0]:>8} time: {elapsed:8.2f}s rows/s: {df.shape[0]/elapsed:12.0f} "
+          f"peak: {peak/2**20:9.1f} MiB dataframe: {df_size/2**20:9.1f} MiB")
+
+
+if __name__ == "__main__":
+    database_name = sys.argv[1] if len(sys.argv) > 1 else "aps"
+    collection_name = sys.argv[2] if len(sys.argv) > 2 else "sensor"
+    measure("find", read_with_find, database_name, collection_name)
+    n_workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    measure("stream", read_with_stream, database_name, collection_name)
+    # peak memory of the partitioned read only covers the parent process
+    measure(f"parts={n_workers}", read_with_partitions(n_workers), database_name, collection_name)
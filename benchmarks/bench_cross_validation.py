@@ -0,0 +1,33 @@
+# wall time of k-fold cross validation with the folds trained concurrently against a single fit
+# usage: python benchmarks/bench_cross_validation.py [rows] [folds] [workers,workers,...]
+# synthetic data with 170 features like the APS dataset, written to .npy files as data transformation saves them
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from sklearn.datasets import make_classification
+from xgboost import XGBClassifier
+from sensor import cross_validation
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    n_folds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    worker_counts = [int(workers) for workers in sys.argv[3].split(",")] if len(sys.argv) > 3 else [1, n_folds]
+    x, y = make_classification(n_samples=rows, n_features=170, n_informative=30, weights=[0.9], random_state=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        x_file_path, y_file_path = os.path.join(tmp_dir, "x.npy"), os.path.join(tmp_dir, "y.npy")
+        np.save(x_file_path, x.astype(np.float32))
+        np.save(y_file_path, y.astype(np.int8))
+
+        start = time.perf_counter()
+        XGBClassifier(n_jobs=os.cpu_count()).fit(x.astype(np.float32), y)
+        print(f"single fit on {rows} rows, {os.cpu_count()} cores: {time.perf_counter() - start:7.2f}s")
+        for n_workers in worker_counts:
+            start = time.perf_counter()
+            scores = cross_validation.cross_validate(x_file_path, y_file_path, n_folds=n_folds, n_workers=n_workers,
+                                                     random_state=1)
+            print(f"{n_folds} folds, {n_workers:>2} workers: {time.perf_counter() - start:7.2f}s "
+                  f"validation f1 {np.mean(scores['f1_validation']):.4f} +/- {np.std(scores['f1_validation']):.4f}")
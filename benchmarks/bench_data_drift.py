@@ -0,0 +1,69 @@
+# compares the per column scipy.stats.ks_2samp loop used before with the batched drift engine
+# usage: python benchmarks/bench_data_drift.py [rows] [n_workers]
+# synthetic data shaped like the APS dataset: 170 float columns with missing values and drift in a few columns
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+from sensor import drift, schema
+
+
+def make_dataset(rows:int, shift:float, seed:int)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=3.0, sigma=1.5, size=(rows, len(schema.FEATURE_COLUMNS)))
+    values[:, :10] *= 1 + shift
+    # sensor readings are integers, so ties are common
+    values = np.round(values).astype(schema.FEATURE_DTYPE)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    return pd.DataFrame(values, columns=schema.FEATURE_COLUMNS)
+
+
+def legacy_pvalues(base_df:pd.DataFrame, current_df:pd.DataFrame)->pd.Series:
+    # missing values are dropped explicitly, as the engine does with nan_policy="omit"
+    return pd.Series({column: ks_2samp(base_df[column].dropna(), current_df[column].dropna()).pvalue
+                      for column in base_df.columns})
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 36000
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    base_df = make_dataset(rows, shift=0.0, seed=1)
+    train_df = make_dataset(int(rows * 0.8), shift=0.1, seed=2)
+    test_df = make_dataset(int(rows * 0.2), shift=0.1, seed=3)
+
+    start = time.perf_counter()
+    expected = [legacy_pvalues(base_df, train_df), legacy_pvalues(base_df, test_df)]
+    legacy_seconds = time.perf_counter() - start
+
+    for workers in sorted({1, n_workers}):
+        start = time.perf_counter()
+        reference = drift.DriftReference(base_df)
+        results = [drift.ks_2samp_columns(reference, current_df, n_workers=workers)["pvalue"]
+                   for current_df in (train_df, test_df)]
+        engine_seconds = time.perf_counter() - start
+        for result, legacy in zip(results, expected):
+            np.testing.assert_allclose(result.to_numpy(), legacy.to_numpy(), rtol=1e-6, atol=1e-12)
+        print(f"workers: {workers:>3} scipy loop: {legacy_seconds:7.2f}s engine: {engine_seconds:7.2f}s "
+              f"speed-up: {legacy_seconds/engine_seconds:5.1f}x (p-values match)")
+
+    # the persisted base dataset profile replaces the base dataframe, p-values are close but not exact once a
+    # column has more distinct values than the profile keeps knots
+    start = time.perf_counter()
+    profile = drift.ReferenceProfile.from_dataframe(base_df)
+    build_seconds = time.perf_counter() - start
+    profile_file_path = os.path.join("benchmarks", "base_profile.npz")
+    profile.save(profile_file_path)
+    start = time.perf_counter()
+    profile = drift.ReferenceProfile.load(profile_file_path)
+    results = [profile.ks_2samp_columns(current_df, columns=list(base_df.columns))
+               for current_df in (train_df, test_df)]
+    profile_seconds = time.perf_counter() - start
+    for result, legacy in zip(results, expected):
+        same_decision = ((result["pvalue"] > 0.05) == (legacy > 0.05)).mean()
+        print(f"profile: build {build_seconds:.2f}s load+check {profile_seconds:.2f}s "
+              f"max |p difference| {np.abs(result['pvalue'] - legacy).max():.2e} same decision {same_decision:.1%}")
+    print(f"profile size: {os.path.getsize(profile_file_path)/2**20:.1f} MiB")
+    os.remove(profile_file_path)
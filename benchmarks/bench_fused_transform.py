@@ -0,0 +1,60 @@
+# parity and per row latency of the fused float32 transformer against the sklearn imputer + scaler pipeline
+# usage: python benchmarks/bench_fused_transform.py [rows]
+# the pipeline is fitted on synthetic data shaped like the APS dataset, including a column without any reading
+
+import sys
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from sensor import schema
+from sensor.components.data_transformation import DataTransformation
+from sensor.fused_transformer import FusedTransformer
+
+
+def make_dataset(rows:int, seed:int)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.lognormal(mean=3.0, sigma=1.5, size=(rows, len(schema.FEATURE_COLUMNS))))
+    values = values.astype(schema.FEATURE_DTYPE)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:, 3] = np.nan
+    return pd.DataFrame(values, columns=schema.FEATURE_COLUMNS)
+
+
+def per_row_microseconds(fn, df:pd.DataFrame, repeat:int)->float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(df)
+    return (time.perf_counter() - start) / repeat / df.shape[0] * 1e6
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 36000
+    warnings.simplefilter("ignore", UserWarning)
+    pipeline = DataTransformation.get_data_transformer_object()
+    pipeline.fit(make_dataset(rows, seed=1))
+    fused = FusedTransformer.from_pipeline(pipeline)
+
+    # parity: same columns, values equal up to float32 rounding
+    df = make_dataset(rows, seed=2)
+    expected = pipeline.transform(df)
+    result = fused.transform(df)
+    assert result.shape == expected.shape and result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-5)
+    # xgboost casts its input to float32, so the features a model sees are compared after that cast
+    same = (result == expected.astype(np.float32)).mean()
+    print(f"parity: max |difference| {np.abs(result - expected).max():.2e}, identical float32 values {same:.4%}")
+
+    for batch_rows in [1, 100, 10000]:
+        batch = df.iloc[:batch_rows]
+        repeat = max(1, 20000 // batch_rows)
+        sklearn_us = per_row_microseconds(pipeline.transform, batch, repeat)
+        fused_us = per_row_microseconds(fused.transform, batch, repeat)
+        print(f"batch {batch_rows:>6} rows: sklearn {sklearn_us:9.2f} us/row fused {fused_us:9.2f} us/row "
+              f"speed-up {sklearn_us/fused_us:5.1f}x")
+
+    # in place on an already contiguous float32 array, no copy at all
+    arr = np.ascontiguousarray(df[list(fused.feature_names_out_)].to_numpy(dtype=np.float32))
+    start = time.perf_counter()
+    fused.transform(arr, copy=False)
+    print(f"in place on {arr.shape}: {(time.perf_counter() - start) / arr.shape[0] * 1e6:.3f} us/row")
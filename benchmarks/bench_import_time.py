@@ -0,0 +1,69 @@
+# cold start regression check of the inference entry points with python -X importtime
+# usage: python benchmarks/bench_import_time.py [--repeats 5] [--budget-ms 400] [module ...]
+# every import runs in a fresh process inside an empty temporary directory. The check fails (exit code 1) when an
+# inference module imports the mongo or training stack, leaves a log file behind, or when the median cumulative
+# import time is over the budget. The budget is machine dependent, the module checks are not.
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# imported by prediction workers and the scoring service before any model is loaded
+INFERENCE_MODULES = ["sensor.pipeline.batch_prediction", "sensor.predictor", "sensor.model_bundle",
+                     "sensor.scoring_service"]
+
+# pulled in only by training, data ingestion or the first model load (xgboost imports sklearn and scipy itself)
+FORBIDDEN_MODULES = ["pymongo", "imblearn", "sklearn", "scipy", "xgboost", "sensor.components",
+                     "sensor.pipeline.training_pipeline"]
+
+
+def import_time(module:str)->tuple:
+    # returns {imported module: cumulative microseconds} of one cold import, and whether it created a log directory
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=work_dir,
+                                env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"import {module} failed:\n{result.stderr[-2000:]}")
+        created_logs = os.path.exists(os.path.join(work_dir, "logs"))
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times, created_logs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=INFERENCE_MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail above this median import time")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        runs, created_logs = zip(*[import_time(module) for _ in range(args.repeats)])
+        total = np.median([times.get(module, 0) for times in runs]) / 1000
+        heaviest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+        top_level = [(name, micros) for name, micros in heaviest if "." not in name and name != module][:3]
+        print(f"{module:<40} {total:8.1f} ms  {len(runs[-1]):5d} modules  heaviest: "
+              + ", ".join(f"{name} {micros / 1000:.0f} ms" for name, micros in top_level))
+        # a submodule import always lists its package too
+        forbidden = [name for name in FORBIDDEN_MODULES if name in runs[-1]]
+        if len(forbidden) > 0:
+            failures.append(f"{module} imports {', '.join(forbidden)}")
+        if any(created_logs):
+            failures.append(f"{module} creates a log file on import")
+        if args.budget_ms is not None and total > args.budget_ms:
+            failures.append(f"{module} imports in {total:.1f} ms, budget {args.budget_ms:.1f} ms")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if len(failures) > 0 else 0)
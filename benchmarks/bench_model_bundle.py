@@ -0,0 +1,55 @@
+# load time and size of a saved version: three dill pickles against the single model bundle
+# usage: python benchmarks/bench_model_bundle.py saved_models/<version> [repeats]
+# every load runs in a fresh process; "imports" is the time to import what the loader needs (xgboost for both, it
+# pulls in sklearn and pandas itself), "load" the time to read and deserialize the artifacts afterwards
+
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+
+DILL_LOAD = """
+import sys, json, time
+start = time.perf_counter()
+import dill, xgboost
+imported = time.perf_counter()
+objects = []
+for name in ["transformer/transformer.pkl", "model/model.pkl", "target_encoder/target_encoder.pkl"]:
+    with open(f"{sys.argv[1]}/{name}", "rb") as file_obj:
+        objects.append(dill.load(file_obj))
+print(json.dumps({"imports": imported - start, "load": time.perf_counter() - imported}))
+"""
+
+BUNDLE_LOAD = """
+import sys, json, time
+start = time.perf_counter()
+from sensor.model_bundle import load_model_bundle
+imported = time.perf_counter()
+transformer, model, target_encoder = load_model_bundle(f"{sys.argv[1]}/bundle/model_bundle.zip")
+print(json.dumps({"imports": imported - start, "load": time.perf_counter() - imported}))
+"""
+
+
+def run(code:str, version_dir:str)->dict:
+    output = subprocess.run([sys.executable, "-c", code, version_dir], capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def size(version_dir:str, names:list)->int:
+    return sum(os.path.getsize(os.path.join(version_dir, name)) for name in names)
+
+
+if __name__ == "__main__":
+    version_dir = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sizes = {"dill": size(version_dir, ["transformer/transformer.pkl", "model/model.pkl",
+                                        "target_encoder/target_encoder.pkl"]),
+             "bundle": size(version_dir, ["bundle/model_bundle.zip"])}
+    for name, code in [("dill", DILL_LOAD), ("bundle", BUNDLE_LOAD)]:
+        results = [run(code, version_dir) for _ in range(repeats)]
+        imports = np.median([result["imports"] for result in results]) * 1000
+        load = np.median([result["load"] for result in results]) * 1000
+        print(f"{name:>6}: {sizes[name] / 1024:8.1f} KiB  imports {imports:7.1f} ms  load {load:7.1f} ms  "
+              f"total {imports + load:7.1f} ms")
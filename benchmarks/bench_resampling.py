@@ -0,0 +1,41 @@
+# wall time and F1 of every resampling strategy as the number of rows grows
+# usage: python benchmarks/bench_resampling.py [rows,rows,...] [n_jobs]
+# imbalanced synthetic data with 170 features and ~2% positives like the APS dataset; the model is scored on an
+# untouched holdout set with the real class ratio, so the strategies are compared on the same data
+
+import os
+import sys
+import time
+import warnings
+import numpy as np
+from sklearn.datasets import make_classification
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from xgboost import XGBClassifier
+from sensor import resampling
+
+
+if __name__ == "__main__":
+    row_counts = [int(rows) for rows in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10000, 40000]
+    n_jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    warnings.simplefilter("ignore", FutureWarning)
+    for rows in row_counts:
+        x, y = make_classification(n_samples=int(rows / 0.8), n_features=170, n_informative=30, weights=[0.98],
+                                   flip_y=0.005, random_state=1)
+        x = x.astype(np.float32)
+        x_train, x_holdout, y_train, y_holdout = train_test_split(x, y, test_size=0.2, stratify=y, random_state=1)
+        for strategy in resampling.RESAMPLING_STRATEGIES:
+            start = time.perf_counter()
+            x_resampled, y_resampled = resampling.resample(x_train, y_train, strategy=strategy, n_jobs=n_jobs,
+                                                           chunk_size=20000, random_state=1)
+            resample_seconds = time.perf_counter() - start
+            scale_pos_weight = None
+            if strategy == "class_weight":
+                scale_pos_weight = resampling.get_scale_pos_weight(y_train)
+            start = time.perf_counter()
+            model = XGBClassifier(scale_pos_weight=scale_pos_weight, n_jobs=n_jobs)
+            model.fit(x_resampled, y_resampled)
+            train_seconds = time.perf_counter() - start
+            score = f1_score(y_holdout, model.predict(x_holdout))
+            print(f"rows {rows:>7} {strategy:>13}: resample {resample_seconds:7.2f}s train {train_seconds:7.2f}s "
+                  f"rows after {x_resampled.shape[0]:>7} holdout f1 {score:.4f}")
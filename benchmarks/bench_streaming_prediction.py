@@ -0,0 +1,41 @@
+# wall time and peak memory of start_batch_prediction on the whole file against the chunked streaming mode
+# usage (from a directory with saved_models): python benchmarks/bench_streaming_prediction.py input.csv [chunk_size,...]
+# every mode runs in its own process so the peak RSS is the one of that mode only, outputs are compared byte by byte
+
+import os
+import sys
+import json
+import filecmp
+import subprocess
+
+CHILD = """
+import sys, json, time, resource
+from sensor.pipeline.batch_prediction import start_batch_prediction
+chunk_size = None if sys.argv[2] == "none" else int(sys.argv[2])
+start = time.perf_counter()
+prediction_file_path = start_batch_prediction(sys.argv[1], chunk_size=chunk_size)
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "prediction_file_path": prediction_file_path}))
+"""
+
+
+def run(input_file_path:str, chunk_size:str)->dict:
+    output = subprocess.run([sys.executable, "-c", CHILD, input_file_path, chunk_size], capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    input_file_path = sys.argv[1]
+    chunk_sizes = sys.argv[2].split(",") if len(sys.argv) > 2 else ["10000", "50000"]
+    print(f"input {os.path.getsize(input_file_path) / 2**20:.0f} MiB")
+    full = run(input_file_path, "none")
+    print(f"whole file         : {full['seconds']:7.2f}s peak rss {full['peak_rss_mib']:7.0f} MiB")
+    for chunk_size in chunk_sizes:
+        streaming = run(input_file_path, chunk_size)
+        same = filecmp.cmp(full["prediction_file_path"], streaming["prediction_file_path"], shallow=False)
+        print(f"chunks of {int(chunk_size):>8} : {streaming['seconds']:7.2f}s peak rss {streaming['peak_rss_mib']:7.0f} MiB "
+              f"same output {same}")
+        os.remove(streaming["prediction_file_path"])
+    os.remove(full["prediction_file_path"])
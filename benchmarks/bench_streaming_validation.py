@@ -0,0 +1,62 @@
+# peak memory and time of the drift check against the base dataset profile, whole dataframe vs streamed chunks
+# usage: python benchmarks/bench_streaming_validation.py [rows] [chunk_size] [storage_format]
+# synthetic data shaped like the APS dataset, written once in the given storage format
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sensor import drift, schema, storage
+from sensor.config import TARGET_COLUMN
+
+
+def make_dataset(rows:int, seed:int)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.lognormal(mean=3.0, sigma=1.5, size=(rows, len(schema.FEATURE_COLUMNS))))
+    values = values.astype(schema.FEATURE_DTYPE)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    df = pd.DataFrame(values, columns=schema.FEATURE_COLUMNS)
+    df.insert(0, TARGET_COLUMN, rng.choice(["neg", "pos"], size=rows, p=[0.98, 0.02]))
+    return df
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    storage_format = sys.argv[3] if len(sys.argv) > 3 else "npy"
+    profile = drift.ReferenceProfile.from_dataframe(make_dataset(36000, seed=1))
+    columns = profile.columns
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, storage.get_file_name("train.csv", storage_format))
+        storage.save_dataframe(file_path, make_dataset(rows, seed=2), cache=False)
+
+        def in_memory():
+            df = storage._read_dataframe(file_path)
+            return profile.ks_2samp_columns(df, columns=columns)
+
+        def streaming():
+            stats = drift.StreamingColumnStats(profile)
+            for chunk in storage.iter_dataframe_chunks(file_path, chunk_size=chunk_size):
+                stats.update(chunk)
+            return stats.ks_2samp_columns(columns=columns)
+
+        expected, memory_seconds, memory_peak = measure(in_memory)
+        result, stream_seconds, stream_peak = measure(streaming)
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"rows: {rows} format: {storage_format} (results match)")
+        print(f"in memory: {memory_seconds:6.2f}s peak {memory_peak:8.1f} MiB")
+        print(f"streaming: {stream_seconds:6.2f}s peak {stream_peak:8.1f} MiB (chunks of {chunk_size} rows)")
@@ -0,0 +1,65 @@
+# fit time and peak memory of the xgboost training modes of ModelTrainer
+# usage: python benchmarks/bench_xgb_training.py [rows] [nthread]
+# every mode runs in its own process so peak resident memory is measured separately
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+import numpy as np
+
+
+def make_arrays(x_file_path:str, y_file_path:str, rows:int, seed:int):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(rows, 170)).astype(np.float32)
+    y = (x[:, :5].sum(axis=1) + rng.normal(scale=2, size=rows) > 0).astype(np.int8)
+    # float32 input features and int8 target in separate files, as written by data transformation
+    np.save(x_file_path, x)
+    np.save(y_file_path, y)
+
+
+def run_mode(mode:str, train_x_path:str, train_y_path:str, test_x_path:str, test_y_path:str, nthread:int,
+             cache_dir:str):
+    from sklearn.metrics import f1_score
+    from xgboost import XGBClassifier
+    from sensor import xgb_training
+    from sensor.utils import load_numpy_array_data
+    train_paths, test_paths = (train_x_path, train_y_path), (test_x_path, test_y_path)
+    start = time.perf_counter()
+    if mode == "default":
+        model = XGBClassifier(n_jobs=nthread)
+        model.fit(load_numpy_array_data(train_x_path, mmap_mode="r"), load_numpy_array_data(train_y_path, mmap_mode="r"))
+        x_test = load_numpy_array_data(test_x_path, mmap_mode="r")
+        y_test = load_numpy_array_data(test_y_path, mmap_mode="r")
+    else:
+        if mode == "quantile":
+            dtrain = xgb_training.get_quantile_matrix(*train_paths, nthread=nthread)
+            dtest = xgb_training.get_quantile_matrix(*test_paths, nthread=nthread, ref_file_paths=train_paths)
+        else:
+            dtrain = xgb_training.get_external_memory_matrix(*train_paths, cache_dir=cache_dir, chunk_rows=20000,
+                                                             nthread=nthread)
+            dtest = xgb_training.get_external_memory_matrix(*test_paths, cache_dir=cache_dir, chunk_rows=20000,
+                                                            nthread=nthread, ref_file_paths=train_paths)
+        model = xgb_training.train_booster(dtrain, nthread=nthread)
+        x_test, y_test = dtest, dtest.get_label()
+    seconds = time.perf_counter() - start
+    score = f1_score(y_test, model.predict(x_test))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:>15}: fit {seconds:6.2f}s peak rss {peak:8.1f} MiB test f1 {score:.4f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--mode":
+        run_mode(*sys.argv[2:7], int(sys.argv[7]), sys.argv[8])
+        sys.exit(0)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nthread = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, file_name) for file_name in ["train_x.npy", "train_y.npy", "test_x.npy", "test_y.npy"]]
+        make_arrays(paths[0], paths[1], rows, seed=1)
+        make_arrays(paths[2], paths[3], rows // 4, seed=2)
+        for mode in ["default", "quantile", "external_memory"]:
+            subprocess.run([sys.executable, __file__, "--mode", mode, *paths, str(nthread),
+                            os.path.join(tmp_dir, "dmatrix_cache")], check=True)
@@ -0,0 +1,56 @@
+# load test of a running scoring service (python app.py)
+# usage: python benchmarks/load_test_scoring_service.py input.csv [url] [concurrency] [requests]
+# every client thread sends single row POST /predict requests over its own keep-alive connection, the client side
+# latencies are printed next to the /metrics of the service (p50/p99, throughput, mean micro batch size)
+
+import sys
+import json
+import time
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import numpy as np
+from sensor import schema
+
+
+def run_client(url:str, records:list, n_requests:int, offset:int)->list:
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+    latencies = []
+    for index in range(n_requests):
+        body = json.dumps(records[(offset + index) % len(records)])
+        start = time.perf_counter()
+        connection.request("POST", "/predict", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise Exception(f"Request failed with status {response.status}")
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies
+
+
+if __name__ == "__main__":
+    input_file_path = sys.argv[1]
+    url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:8000"
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    total_requests = int(sys.argv[4]) if len(sys.argv) > 4 else 5000
+    df = schema.read_csv(input_file_path, columns=schema.FEATURE_COLUMNS, nrows=1000)
+    # missing readings are sent as null
+    records = [{column: (None if np.isnan(value) else float(value)) for column, value in row.items()}
+               for row in df.to_dict(orient="records")]
+
+    n_requests = total_requests // concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_client, url, records, n_requests, client * n_requests)
+                   for client in range(concurrency)]
+        latencies = np.concatenate([future.result() for future in futures])
+    seconds = time.perf_counter() - start
+    print(f"{latencies.shape[0]} requests, {concurrency} clients: {latencies.shape[0] / seconds:8.1f} req/s "
+          f"p50 {np.percentile(latencies, 50) * 1000:7.2f} ms p99 {np.percentile(latencies, 99) * 1000:7.2f} ms")
+
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port)
+    connection.request("GET", "/metrics")
+    print(f"service metrics: {json.loads(connection.getresponse().read())}")
@@ -1,7 +1,9 @@
-import pymongo
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
-import json
 from sensor.config import mongo_client
+from sensor import schema
 
 # Provide the mongodb localhost url to connect python to mongodb.
 #client = pymongo.MongoClient("mongodb://localhost:27017/neurolabDB")
@@ -12,17 +14,62 @@ collection_name = "sensor"
 
 datafile_path = "/config/workspace/aps_failure_training_set1.csv"
 
-if __name__ == "__main__":
-    df = pd.read_csv(datafile_path)
-    print(f"No. of rows, cols: {df.shape}")
-    # convert given df records to json format so that we can dump into mongodb
 
-    df.reset_index(drop=True, inplace=True)
+def dataframe_to_documents(df:pd.DataFrame)->list:
+    # builds documents straight from the typed values: numbers stay numbers and missing readings become null
+    columns = [str(column) for column in df.columns]
+    values = df.to_numpy(dtype=object)
+    values[df.isna().to_numpy()] = None
+    # tolist converts numpy scalars to python int/float which bson can encode
+    return [dict(zip(columns, row)) for row in values.tolist()]
+
+
+def insert_documents(documents:list, database_name:str, collection_name:str)->int:
+    # unordered insert lets the server keep going past a failing document and apply the batch in parallel
+    mongo_client[database_name][collection_name].insert_many(documents, ordered=False)
+    return len(documents)
+
 
-    json_record = list(json.loads(df.T.to_json()).values())
-    # df.T.to_json() returns a string object containing dictionary
-    # json.loads() takes in a string and returns a json object which is a nested dict, so we use .values()
-    print(json_record[1])
+def bulk_load_csv(file_path:str, database_name:str, collection_name:str, chunk_size:int=10000, n_workers:int=4)->int:
+    """
+    Streams a csv file into a collection chunk by chunk
+    ===========================================================================================
+    file_path: csv file to load, "na" readings are stored as null
+    chunk_size: rows parsed and inserted per insert_many call
+    n_workers: number of concurrent insert_many calls, at most 2*n_workers chunks are held in memory
+    ===========================================================================================
+    returns number of inserted rows
+    """
+    start = time.perf_counter()
+    inserted_rows = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, na_values=schema.NA_VALUES):
+            # bound memory: wait for an insert to finish before parsing more chunks
+            while len(pending) >= 2 * n_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    inserted_rows += future.result()
+            documents = dataframe_to_documents(chunk)
+            pending.add(executor.submit(insert_documents, documents, database_name, collection_name))
+            elapsed = time.perf_counter() - start
+            print(f"Inserted rows: {inserted_rows} rows/sec: {inserted_rows/elapsed:.0f}")
+        for future in pending:
+            inserted_rows += future.result()
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {inserted_rows} rows into {database_name}.{collection_name} in {elapsed:.1f}s "
+          f"({inserted_rows/elapsed:.0f} rows/sec)")
+    return inserted_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load sensor csv data into mongodb")
+    parser.add_argument("--file", default=datafile_path, help="csv file to load")
+    parser.add_argument("--database", default=database_name)
+    parser.add_argument("--collection", default=collection_name)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per insert_many batch")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent insert_many calls")
+    args = parser.parse_args()
 
-    # inserting converted json record into mongodb
-    mongo_client[database_name][collection_name].insert_many(json_record)
\ No newline at end of file
+    bulk_load_csv(file_path=args.file, database_name=args.database, collection_name=args.collection,
+                  chunk_size=args.chunk_size, n_workers=args.workers)
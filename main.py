@@ -1,5 +1,5 @@
-from sensor.pipeline.training_pipeline import start_training_pipeline
-from sensor.pipeline.batch_prediction import start_batch_prediction
+# the pipelines are imported where they run: a prediction run does not import the training stack
+# (imblearn, scipy.stats, the components) and the training run does not import the prediction pipeline
 
 # using same dataset as input file for batch prediction
 file_path = "/config/workspace/aps_failure_training_set1.csv"
@@ -8,8 +8,10 @@ print(__name__)
 
 if __name__=="__main__":
      try:
+          #from sensor.pipeline.training_pipeline import start_training_pipeline
           #start_training_pipeline()
+          from sensor.pipeline.batch_prediction import start_batch_prediction
           output_file = start_batch_prediction(input_file_path=file_path)
           print(output_file)
      except Exception as e:
-          print(e)
\ No newline at end of file
+          print(e)
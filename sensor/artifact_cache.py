@@ -0,0 +1,247 @@
+# in-process cache of the artifacts produced by the pipeline stages
+# a stage which saves an artifact keeps it in memory, so the next stage reading the same path is served from
+# memory instead of reading and deserializing the file again. Files are still written for durability,
+# optionally by a background writer thread. Every entry is keyed by the absolute path of its file and is
+# validated by the size and mtime of that file: it is dropped as soon as the file was rewritten (a rewrite
+# within the mtime resolution keeping the same size goes unnoticed). The content hash of a file is only
+# computed when a caller asks for it (get_content_hash), once per written version of the file, so writes
+# never read their file back.
+
+import os, sys
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+
+def file_hash(file_path:str)->str:
+    # content hash of a file, read in 1 MiB blocks
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(2**20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    obj:object
+    # None until get_content_hash is asked for the file
+    content_hash:Optional[str] = None
+    # None while the background writer has not written the file yet
+    file_size:Optional[int] = None
+    file_mtime_ns:Optional[int] = None
+
+
+class ArtifactCache:
+
+    def __init__(self, max_items:int=16, enabled:bool=True, background_writes:bool=False):
+        self.max_items = max_items
+        self.enabled = enabled
+        self.background_writes = background_writes
+        self._entries = OrderedDict()
+        self._pending = dict()
+        self._lock = threading.RLock()
+        self._writer = None
+        self._stage_name = "unknown"
+        self._io_stats = OrderedDict()
+
+    def configure(self, enabled:bool=True, background_writes:bool=False, max_items:int=None):
+        self.flush()
+        self.enabled = enabled
+        self.background_writes = background_writes
+        if max_items is not None:
+            self.max_items = max_items
+        if not enabled:
+            self.clear()
+
+    @contextmanager
+    def stage(self, stage_name:str):
+        # I/O done inside this block is reported under stage_name
+        previous_stage_name = self._stage_name
+        self._stage_name = stage_name
+        try:
+            yield
+        finally:
+            self._stage_name = previous_stage_name
+
+    def _record(self, kind:str, seconds:float=0.0, stage_name:str=None):
+        if stage_name is None:
+            stage_name = self._stage_name
+        with self._lock:
+            stats = self._io_stats.setdefault(stage_name, {"read_seconds": 0.0, "write_seconds": 0.0,
+                                                           "cache_hits": 0, "cache_misses": 0})
+            if kind == "read":
+                stats["read_seconds"] += seconds
+                stats["cache_misses"] += 1
+            elif kind == "write":
+                stats["write_seconds"] += seconds
+            else:
+                stats["cache_hits"] += 1
+
+    def io_report(self)->dict:
+        # per stage seconds spent reading/writing artifacts and number of cache hits and misses
+        with self._lock:
+            return {stage_name: {key: round(value, 4) if isinstance(value, float) else value
+                                 for key, value in stats.items()}
+                    for stage_name, stats in self._io_stats.items()}
+
+    def reset_io_report(self):
+        with self._lock:
+            self._io_stats = OrderedDict()
+
+    def put(self, file_path:str, obj:object, writer:Callable)->None:
+        """
+        Writes obj to file_path using writer(file_path, obj) and keeps obj in memory
+        file_path: location of the artifact
+        obj: artifact object, must not be modified by the caller afterwards
+        writer: function writing the object to disk
+        """
+        try:
+            key = os.path.abspath(file_path)
+            if not self.enabled:
+                self._write(key, obj, writer)
+                return
+            # a newer version of the same path replaces the old entry and waits for its pending write
+            self._wait_for(key)
+            with self._lock:
+                self._entries[key] = CacheEntry(obj=obj)
+                self._entries.move_to_end(key)
+                self._evict()
+                if self.background_writes:
+                    if self._writer is None:
+                        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+                    self._pending[key] = self._writer.submit(self._write, key, obj, writer, self._stage_name)
+                    return
+            self._write(key, obj, writer)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get(self, file_path:str, loader:Callable, keep:bool=True)->object:
+        """
+        Returns the artifact at file_path from memory, or loads it with loader(file_path)
+        keep: keep a freshly loaded object in memory (False for partial reads of an artifact)
+        """
+        try:
+            key = os.path.abspath(file_path)
+            if self.enabled:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and self._is_valid(key, entry):
+                        self._entries.move_to_end(key)
+                        self._record("hit")
+                        return entry.obj
+                    self._entries.pop(key, None)
+            start = time.perf_counter()
+            obj = loader(file_path)
+            self._record("read", time.perf_counter() - start)
+            if self.enabled and keep:
+                with self._lock:
+                    self._entries[key] = self._stat_entry(key, obj, content_hash=None)
+                    self._evict()
+            return obj
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def copy(self, src_file_path:str, dst_file_path:str)->None:
+        # copies an artifact file without deserializing it, the cached object is shared by both paths
+        try:
+            src_key = os.path.abspath(src_file_path)
+            self._wait_for(src_key)
+            start = time.perf_counter()
+            os.makedirs(os.path.dirname(dst_file_path), exist_ok=True)
+            shutil.copyfile(src_file_path, dst_file_path)
+            self._record("write", time.perf_counter() - start)
+            if self.enabled:
+                with self._lock:
+                    entry = self._entries.get(src_key)
+                    if entry is not None:
+                        dst_key = os.path.abspath(dst_file_path)
+                        self._entries[dst_key] = self._stat_entry(dst_key, entry.obj, entry.content_hash)
+                        self._evict()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_content_hash(self, file_path:str)->str:
+        # content hash of the artifact file, computed once per written version of the file
+        try:
+            key = os.path.abspath(file_path)
+            self._wait_for(key)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_valid(key, entry) and entry.content_hash is not None:
+                    return entry.content_hash
+            content_hash = file_hash(key)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_valid(key, entry):
+                    entry.content_hash = content_hash
+            return content_hash
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def flush(self)->None:
+        # blocks until every background write finished, re-raises the first failed write
+        with self._lock:
+            pending = list(self._pending.items())
+        for key, _ in pending:
+            self._wait_for(key)
+
+    def clear(self)->None:
+        self.flush()
+        with self._lock:
+            self._entries = OrderedDict()
+
+    def _write(self, key:str, obj:object, writer:Callable, stage_name:str=None):
+        start = time.perf_counter()
+        writer(key, obj)
+        self._record("write", time.perf_counter() - start, stage_name=stage_name)
+        if self.enabled:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.obj is obj:
+                    self._entries[key] = self._stat_entry(key, obj, content_hash=None)
+
+    def _wait_for(self, key:str):
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None:
+            return
+        try:
+            future.result()
+        finally:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    self._pending.pop(key)
+
+    def _stat_entry(self, key:str, obj:object, content_hash:Optional[str])->CacheEntry:
+        stat = os.stat(key)
+        return CacheEntry(obj=obj, content_hash=content_hash, file_size=stat.st_size, file_mtime_ns=stat.st_mtime_ns)
+
+    def _is_valid(self, key:str, entry:CacheEntry)->bool:
+        if key in self._pending:
+            return True
+        if entry.file_size is None:
+            return False
+        try:
+            stat = os.stat(key)
+        except FileNotFoundError:
+            return False
+        # the file was rewritten by someone else since it was cached
+        return stat.st_size == entry.file_size and stat.st_mtime_ns == entry.file_mtime_ns
+
+    def _evict(self):
+        while len(self._entries) > self.max_items:
+            key, _ = self._entries.popitem(last=False)
+            logging.info(f"Evicted artifact from cache: {key}")
+
+
+# shared by all pipeline stages running in this process
+artifact_cache = ArtifactCache()
@@ -1,11 +1,13 @@
 import os, sys
-import numpy as np
+import shutil
+from datetime import datetime, timedelta, timezone
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sensor import utils
+from sensor import utils, storage
 from sensor.entity import config_entity, artifact_entity
 from sensor.exception import SensorException
 from sensor.logger import logging
+from bson import ObjectId
 
 
 class DataIngestion:
@@ -15,23 +17,25 @@ class DataIngestion:
         try:
             logging.info(f"{'>>'*20} Data Ingestion {'<<'*20}")
             self.data_ingestion_config = data_ingestion_config
+            # upper bound of the incremental mode, fixed once so the stage fingerprint and the read agree
+            self.cutoff_id = None
         except Exception as e:
             raise SensorException(e,sys)
 
-    def initiate_data_ingestion(self) ->artifact_entity.DataIngestionArtifact:
-        # output will be data_ingestion_artifact
+    def export_collection(self) -> pd.DataFrame:
+        # exports the whole collection into this run's feature store
         try:
             logging.info(f"Exporting data from my collection as pandas dataframe.")
             # exporting collection data as pandas dataframe
             df:pd.DataFrame = utils.get_collection_as_dataframe(database_name = self.data_ingestion_config.database_name,
-                                                                collection_name = self.data_ingestion_config.collection_name)
+                                                                collection_name = self.data_ingestion_config.collection_name, 
+                                                                batch_size = self.data_ingestion_config.read_batch_size, 
+                                                                n_workers = self.data_ingestion_config.read_workers, 
+                                                                executor = self.data_ingestion_config.read_executor)
 
-            # now we have to save this dataframe in feature store
+            # now we have to save this dataframe in feature store, "na" readings are already NaN float32 values
             logging.info("Saving data in feature store")
 
-            # replace na with nan
-            df.replace(to_replace="na", value = np.NAN, inplace=True)
-
             # Save data to feature store
             logging.info("Create feature store folder if not present")
 
@@ -41,8 +45,158 @@ class DataIngestion:
             # os.makedirs() method will create all unavailable/missing directory in the specified path.
             os.makedirs(feature_store_dir, exist_ok=True)      
 
-            # save df as csv to feature store folder
-            df.to_csv(path_or_buf = self.data_ingestion_config.feature_store_file_path, header=True, index=False)
+            # save df to feature store folder in the configured storage format
+            storage.save_dataframe(file_path = self.data_ingestion_config.feature_store_file_path, df = df)
+            return df
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def export_new_documents(self) -> int:
+        """
+        Appends documents inserted after the stored watermark to the persistent feature store
+        ===========================================================================================
+        returns number of new rows written to the feature store
+        """
+        try:
+            database_name = self.data_ingestion_config.database_name
+            collection_name = self.data_ingestion_config.collection_name
+            store_dir = self.data_ingestion_config.persistent_feature_store_dir
+            watermark_file_path = self.data_ingestion_config.watermark_file_path
+            os.makedirs(store_dir, exist_ok=True)
+
+            watermark = self.read_watermark()
+            last_id = ObjectId(watermark["last_id"]) if watermark is not None else None
+            logging.info(f"Watermark of feature store: {last_id}")
+
+            # fixing the upper bound first means documents inserted while we read are picked up by the next run
+            latest_id = utils.get_latest_document_id(database_name=database_name, collection_name=collection_name, 
+                                                     before_id=self.get_cutoff_id())
+            if latest_id is None or (last_id is not None and latest_id <= last_id):
+                logging.info("No new documents since last ingestion")
+                return 0
+
+            id_range = {"$lte": latest_id}
+            if last_id is not None:
+                id_range["$gt"] = last_id
+            df = pd.DataFrame(utils.get_collection_as_arrays(database_name=database_name, collection_name=collection_name, 
+                                                             batch_size=self.data_ingestion_config.read_batch_size, 
+                                                             query={"_id": id_range}), copy=False)
+            logging.info(f"Fetched {df.shape[0]} new documents")
+
+            # every run appends one part file, existing parts are never rewritten
+            part_file_paths = self.get_feature_store_part_paths()
+            # rows of every part, stores written before the history was kept are counted once from their parts
+            parts = watermark.get("parts") if watermark is not None else None
+            if parts is None:
+                parts = {os.path.basename(file_path): self.count_part_rows(file_path) for file_path in part_file_paths}
+            if len(part_file_paths) > 0:
+                # keep the column order of the existing store
+                columns = storage.read_columns(part_file_paths[0])
+                df = df.reindex(columns=columns)
+            # numbered after the last existing part, never over one of them
+            part_number = max([int(os.path.basename(file_path)[len("part-"):].split(".")[0]) 
+                               for file_path in part_file_paths], default=-1) + 1
+            part_file_name = storage.get_file_name(f"part-{part_number:05d}.csv", 
+                                                   self.data_ingestion_config.storage_format)
+            part_file_path = os.path.join(store_dir, part_file_name)
+            # write to a temporary directory and rename, so a failed run never leaves a half written part behind
+            temp_dir = os.path.join(store_dir, ".tmp")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            temp_file_path = os.path.join(temp_dir, part_file_name)
+            storage.save_dataframe(file_path=temp_file_path, df=df, cache=False)
+            if storage.get_storage_format(part_file_path) == "npy":
+                # schema sidecar goes first, the part only becomes visible once its matrix is renamed
+                os.replace(storage.get_schema_file_path(temp_file_path), storage.get_schema_file_path(part_file_path))
+            os.replace(temp_file_path, part_file_path)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+            # watermark only moves after the part file is in place
+            parts[os.path.basename(part_file_path)] = int(df.shape[0])
+            utils.write_yaml_file(file_path=f"{watermark_file_path}.tmp", 
+                                  data={"last_id": str(latest_id), "part_file": os.path.basename(part_file_path), 
+                                        "rows": int(df.shape[0]), "parts": parts})
+            os.replace(f"{watermark_file_path}.tmp", watermark_file_path)
+            return df.shape[0]
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_cutoff_id(self) -> ObjectId:
+        # ObjectIds are generated by the clients, so a document committed after this read can still carry an
+        # _id below the newest one seen now. Only documents older than the safety lag are ingested, the
+        # newer ones (and any late commits among them) are picked up by a later run
+        if self.cutoff_id is None:
+            self.cutoff_id = ObjectId.from_datetime(datetime.now(timezone.utc) - 
+                                                    timedelta(seconds=self.data_ingestion_config.ingestion_lag_seconds))
+        return self.cutoff_id
+
+    def get_collection_state(self) -> dict:
+        # summary of the documents this stage reads, fingerprinted by the stage cache
+        # the incremental mode only reads documents below the cutoff, documents inside the lag window must change
+        # the fingerprint once they age past it, even when nothing new is inserted
+        try:
+            before_id = self.get_cutoff_id() if self.data_ingestion_config.ingestion_mode == "incremental" else None
+            return utils.get_collection_state(database_name=self.data_ingestion_config.database_name, 
+                                              collection_name=self.data_ingestion_config.collection_name, 
+                                              before_id=before_id)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_feature_store_part_paths(self) -> list:
+        # part files of the persistent feature store in the order they were appended
+        store_dir = self.data_ingestion_config.persistent_feature_store_dir
+        if not os.path.exists(store_dir):
+            return []
+        # parts of every storage format belong to the store, the storage format may have changed between runs
+        # (part numbers are zero padded, so name order is append order whatever the extension)
+        extensions = tuple(storage.FILE_EXTENSIONS.values())
+        file_names = sorted(file_name for file_name in os.listdir(store_dir) 
+                            if file_name.startswith("part-") and file_name.endswith(extensions))
+        return [os.path.join(store_dir, file_name) for file_name in file_names]
+
+    def read_watermark(self) -> dict:
+        # last ingested _id and rows per part file, None before the first incremental run
+        watermark_file_path = self.data_ingestion_config.watermark_file_path
+        if not os.path.exists(watermark_file_path):
+            return None
+        return utils.read_yaml_file(file_path=watermark_file_path)
+
+    def count_part_rows(self, part_file_path:str) -> int:
+        columns = storage.read_columns(part_file_path)
+        return int(storage.load_dataframe(part_file_path, columns=columns[:1]).shape[0])
+
+    def load_feature_store(self) -> pd.DataFrame:
+        try:
+            part_file_paths = self.get_feature_store_part_paths()
+            if len(part_file_paths) == 0:
+                raise Exception(f"Feature store {self.data_ingestion_config.persistent_feature_store_dir} is empty")
+            logging.info(f"Reading {len(part_file_paths)} part files from persistent feature store")
+            # every part is read with the reader of its own format
+            part_dfs = [storage.load_dataframe(part_file_path) for part_file_path in part_file_paths]
+
+            # a part missing, skipped or cut short would silently drop data from training for good
+            watermark = self.read_watermark()
+            if watermark is not None and watermark.get("parts") is not None:
+                rows = {os.path.basename(part_file_path): int(part_df.shape[0]) 
+                        for part_file_path, part_df in zip(part_file_paths, part_dfs)}
+                if rows != watermark["parts"]:
+                    raise Exception(f"Rows of the feature store parts {rows} do not match the watermark history "
+                                    f"{watermark['parts']}")
+            return pd.concat(part_dfs, ignore_index=True)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_data_ingestion(self) ->artifact_entity.DataIngestionArtifact:
+        # output will be data_ingestion_artifact
+        try:
+            if self.data_ingestion_config.ingestion_mode == "incremental":
+                logging.info(f"Appending new documents of my collection to the persistent feature store")
+                new_rows = self.export_new_documents()
+                logging.info(f"Appended {new_rows} rows to feature store")
+                df = self.load_feature_store()
+                feature_store_file_path = self.data_ingestion_config.persistent_feature_store_dir
+            else:
+                df = self.export_collection()
+                feature_store_file_path = self.data_ingestion_config.feature_store_file_path
 
             # splitting dataset into train and test set
             logging.info("Splitting our dataset into train and test set")
@@ -54,13 +208,13 @@ class DataIngestion:
             os.makedirs(dataset_dir, exist_ok = True)
 
             # Now saving df to above created/already present train_file_path
-            logging.info("Save df as csv file in feature store folder")
-            train_df.to_csv(path_or_buf=self.data_ingestion_config.train_file_path, index=False, header=True)
-            test_df.to_csv(path_or_buf=self.data_ingestion_config.test_file_path, index=False, header=True)
+            logging.info(f"Save train and test df as {self.data_ingestion_config.storage_format} files in dataset folder")
+            storage.save_dataframe(file_path=self.data_ingestion_config.train_file_path, df=train_df)
+            storage.save_dataframe(file_path=self.data_ingestion_config.test_file_path, df=test_df)
 
             #Prepare artifact or output
             data_ingestion_artifact = artifact_entity.DataIngestionArtifact(feature_store_file_path = 
-            self.data_ingestion_config.feature_store_file_path, train_file_path = self.data_ingestion_config.train_file_path, 
+            feature_store_file_path, train_file_path = self.data_ingestion_config.train_file_path, 
             test_file_path = self.data_ingestion_config.test_file_path)
 
             logging.info(f"Data ingestion artifact: {data_ingestion_artifact}")
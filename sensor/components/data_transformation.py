@@ -5,13 +5,14 @@ from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.entity import config_entity, artifact_entity
 from sklearn.pipeline import Pipeline
-from sensor import utils
+from sensor import utils, storage
 from typing import Optional
 from sklearn.preprocessing import LabelEncoder
 from sklearn.impute import SimpleImputer     # populate some values for the missing rows
 from sklearn.preprocessing import RobustScaler    # scaling to minimize the effect of outliers
-from imblearn.combine import SMOTETomek    # to generate some data for the minority class
+from sensor import resampling    # to generate some data for the minority class
 from sensor.config import TARGET_COLUMN
+from sensor.fused_transformer import FusedTransformer, save_fused_transformer
 
 
 class DataTransformation:
@@ -41,8 +42,8 @@ class DataTransformation:
     def initiate_data_transformation(self,)->artifact_entity.DataTransformationArtifact:
         try:
             # reading training and testing file
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            train_df = storage.load_dataframe(self.data_ingestion_artifact.train_file_path)
+            test_df = storage.load_dataframe(self.data_ingestion_artifact.test_file_path)
 
             # selecting input feature for train and test dataframe
             input_feature_train_df = train_df.drop(columns=TARGET_COLUMN)
@@ -68,38 +69,68 @@ class DataTransformation:
             input_feature_train_arr = transformation_pipeline.transform(input_feature_train_df)
             input_feature_test_arr = transformation_pipeline.transform(input_feature_test_df)
 
-            # using library to balance our dataset as "neg" class is around 35K and "pos" class are only 1K
-            smt = SMOTETomek()   # generates new data to balance ratio of minority and majority class
-            logging.info(f"Before resampling in training set Input: {input_feature_train_arr.shape} Target: {target_feature_train_arr.shape}")
-            input_feature_train_arr, target_feature_train_arr = smt.fit_resample(input_feature_train_arr, target_feature_train_arr)
-            logging.info(f"After resampling in training set Input: {input_feature_train_arr.shape} Target: {target_feature_train_arr.shape}")
-
-
-            logging.info(f"Before resampling in testing set Input: {input_feature_test_arr.shape} Target: {target_feature_test_arr.shape}")
-            input_feature_test_arr, target_feature_test_arr = smt.fit_resample(input_feature_test_arr, target_feature_test_arr)
-            logging.info(f"After resampling in testing set Input: {input_feature_test_arr.shape} Target: {target_feature_test_arr.shape}")
-
-            # concatenate input and target feature arrays using numpy.c_ so that we can save it as a single array 
-            # numpy.c_ translates slice objects to concatenation along the second axis.
-
-            train_arr = np.c_[input_feature_train_arr, target_feature_train_arr]
-            test_arr = np.c_[input_feature_test_arr, target_feature_test_arr]
-            
-            # save numpy array
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_train_path, array=train_arr)
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_test_path, array=test_arr)
+            # balancing our dataset as "neg" class is around 35K and "pos" class are only 1K,
+            # SMOTETomek generates new data for the minority class unless another strategy is configured
+            config = self.data_transformation_config
+            resampling_kwargs = dict(strategy=config.resampling_strategy, n_jobs=config.resampling_n_jobs,
+                                     chunk_size=config.resampling_chunk_size, random_state=config.resampling_random_state)
+            # cross validation folds are cut from the train arrays before resampling, synthetic rows built from
+            # a fold's training rows would otherwise land in its validation rows (without resampling they are the
+            # saved train arrays)
+            unsampled_train_x_path, unsampled_train_y_path = config.transformed_train_x_path, config.transformed_train_y_path
+            resampling_params = None
+            if config.resampling_strategy != "class_weight":
+                unsampled_train_x_path = config.unsampled_train_x_path
+                unsampled_train_y_path = config.unsampled_train_y_path
+                utils.save_numpy_array_data(file_path=unsampled_train_x_path,
+                                            array=np.ascontiguousarray(input_feature_train_arr, dtype=np.float32))
+                utils.save_numpy_array_data(file_path=unsampled_train_y_path,
+                                            array=np.asarray(target_feature_train_arr, dtype=np.int8))
+                resampling_params = dict(strategy=config.resampling_strategy, chunk_size=config.resampling_chunk_size,
+                                         random_state=config.resampling_random_state)
+
+            input_feature_train_arr, target_feature_train_arr = resampling.resample(
+                x=input_feature_train_arr, y=target_feature_train_arr, **resampling_kwargs)
+            input_feature_test_arr, target_feature_test_arr = resampling.resample(
+                x=input_feature_test_arr, y=target_feature_test_arr, **resampling_kwargs)
+
+            scale_pos_weight = None
+            if config.resampling_strategy == "class_weight":
+                scale_pos_weight = resampling.get_scale_pos_weight(target_feature_train_arr)
+                logging.info(f"No resampling, positive class weight: {scale_pos_weight}")
+
+            # input and target arrays are saved separately, the input features as one contiguous float32 array
+            # (what xgboost trains on) and the target as int8, so both can be memory mapped without any copy
+            utils.save_numpy_array_data(file_path=config.transformed_train_x_path,
+                                        array=np.ascontiguousarray(input_feature_train_arr, dtype=np.float32))
+            utils.save_numpy_array_data(file_path=config.transformed_train_y_path,
+                                        array=np.asarray(target_feature_train_arr, dtype=np.int8))
+            utils.save_numpy_array_data(file_path=config.transformed_test_x_path,
+                                        array=np.ascontiguousarray(input_feature_test_arr, dtype=np.float32))
+            utils.save_numpy_array_data(file_path=config.transformed_test_y_path,
+                                        array=np.asarray(target_feature_test_arr, dtype=np.int8))
 
             # saving transformation pipeline for future use
             utils.save_object(file_path=self.data_transformation_config.transform_object_path, obj=transformation_pipeline)
+            # fused float32 version of the pipeline for batch prediction and model evaluation
+            save_fused_transformer(file_path=self.data_transformation_config.fused_transform_object_path,
+                                   transformer=FusedTransformer.from_pipeline(transformation_pipeline))
 
             # saving target encoder
             utils.save_object(file_path=self.data_transformation_config.target_encoder_path, obj=label_encoder)
 
             data_transformation_artifact = artifact_entity.DataTransformationArtifact(
                                            transform_object_path=self.data_transformation_config.transform_object_path, 
-                                           transformed_train_path=self.data_transformation_config.transformed_train_path, 
-                                           transformed_test_path=self.data_transformation_config.transformed_test_path, 
-                                           target_encoder_path=self.data_transformation_config.target_encoder_path)
+                                           transformed_train_x_path=self.data_transformation_config.transformed_train_x_path,
+                                           transformed_train_y_path=self.data_transformation_config.transformed_train_y_path,
+                                           transformed_test_x_path=self.data_transformation_config.transformed_test_x_path,
+                                           transformed_test_y_path=self.data_transformation_config.transformed_test_y_path,
+                                           target_encoder_path=self.data_transformation_config.target_encoder_path,
+                                           fused_transform_object_path=self.data_transformation_config.fused_transform_object_path,
+                                           scale_pos_weight=scale_pos_weight,
+                                           unsampled_train_x_path=unsampled_train_x_path,
+                                           unsampled_train_y_path=unsampled_train_y_path,
+                                           resampling_params=resampling_params)
 
             logging.info(f"Data transformation object {data_transformation_artifact}")
             return data_transformation_artifact
@@ -6,8 +6,10 @@ from sensor.exception import SensorException
 from sensor.logger import logging
 from scipy.stats import ks_2samp
 from typing import Optional
-from sensor import utils
+from sensor import utils, storage, schema, drift
+from pandas.api.types import is_numeric_dtype
 from sensor.config import TARGET_COLUMN
+from sensor.predictor import ModelResolver
 
 
 class DataValidation:
@@ -21,6 +23,9 @@ class DataValidation:
             self.data_ingestion_artifact = data_ingestion_artifact
             # creating a dictionary to update all validation error messages
             self.validation_error = dict()
+            # sorted base dataframe, built once and reused for the train and the test drift check
+            self.drift_reference = None
+            self.drift_reference_source = None
         except Exception as e:
             raise SensorException(e, sys)
         
@@ -54,11 +59,16 @@ class DataValidation:
             raise SensorException(e, sys)
 
 
-    def whether_required_cols_exists(self, base_df:pd.DataFrame, current_df:pd.DataFrame, report_key_name:str)->bool:
+    def whether_required_cols_exists(self, base_df:Optional[pd.DataFrame], current_df:Optional[pd.DataFrame],
+                                     report_key_name:str, base_columns:Optional[list]=None,
+                                     current_columns:Optional[list]=None)->bool:
         # check whether all cols are available in dataset or not
+        # column lists can be given instead of the dataframes (base dataset profile, streaming validation)
         try:
-            base_columns = base_df.columns
-            current_columns = current_df.columns
+            if base_columns is None:
+                base_columns = base_df.columns
+            if current_columns is None:
+                current_columns = current_df.columns
 
             missing_columns = []
             for base_col in base_columns:
@@ -76,26 +86,82 @@ class DataValidation:
             raise SensorException(e, sys)
 
 
+    def get_base_profile_source(self)->str:
+        # profile of the latest saved model if there is one, else the base dataset file it has to be built from
+        try:
+            if not self.data_validation_config.rebuild_base_profile:
+                model_resolver = ModelResolver(model_registry=self.data_validation_config.saved_models_dir)
+                profile_path = model_resolver.get_latest_profile_path()
+                if profile_path is not None:
+                    return profile_path
+            return self.data_validation_config.base_file_path
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_base_profile(self)->drift.ReferenceProfile:
+        """
+        Loads the base dataset profile, building it from the base dataset only when no saved model has one
+        the profile is written to base_profile_file_path, so the model pusher can version it with the model
+        """
+        try:
+            source_path = self.get_base_profile_source()
+            profile_file_path = self.data_validation_config.base_profile_file_path
+            if source_path != self.data_validation_config.base_file_path:
+                logging.info(f"Loading base dataset profile: {source_path}")
+                utils.copy_object(src_file_path=source_path, dst_file_path=profile_file_path)
+                return drift.ReferenceProfile.load(profile_file_path)
+
+            logging.info(f"Building base dataset profile from {source_path}")
+            # "na" values are parsed as NaN and readings as float32 while reading, only schema columns are parsed
+            base_df = schema.read_csv(source_path, columns=schema.COLUMNS)
+            base_df = utils.convert_columns_to_float(df=base_df, exclude_columns=[TARGET_COLUMN])
+            profile = drift.ReferenceProfile.from_dataframe(df=base_df,
+                                                            n_knots=self.data_validation_config.base_profile_knots)
+            profile.save(profile_file_path)
+            return profile
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_drift_reference(self, base_df:pd.DataFrame)->drift.DriftReference:
+        # numeric base columns are sorted only once per base dataframe
+        if self.drift_reference is None or self.drift_reference_source is not base_df:
+            numeric_columns = [column for column in base_df.columns if is_numeric_dtype(base_df[column].dtype)]
+            self.drift_reference = drift.DriftReference(base_df=base_df, columns=numeric_columns)
+            self.drift_reference_source = base_df
+        return self.drift_reference
+
     def data_drift(self, base_df:pd.DataFrame, current_df:pd.DataFrame, report_key_name:str):
         # to prepare data drift report, doesn't returns anything
         try:
             drift_report = dict()
 
-            base_columns = base_df.columns
-            current_columns = current_df.columns
+            reference = self.get_drift_reference(base_df=base_df)
+            numeric_columns = [column for column in reference.columns if is_numeric_dtype(current_df[column].dtype)]
+            if numeric_columns != reference.columns:
+                reference = drift.DriftReference(base_df=base_df, columns=numeric_columns)
 
-            for base_col in base_columns:
-                base_data, current_data = base_df[base_col], current_df[base_col]
-                # Null Hypothesis is that both the columns are drawn from the same distribution
-                logging.info(f"Hypothesis {base_col}: {base_data.dtype},{current_data.dtype}")
-                same_distribution = ks_2samp(base_data, current_data)
+            # Null Hypothesis is that both the columns are drawn from the same distribution
+            logging.info(f"Running KS test on {len(numeric_columns)} numeric columns with "
+                         f"{self.data_validation_config.drift_workers} workers")
+            ks_results = drift.ks_2samp_columns(reference=reference, current_df=current_df,
+                                                n_workers=self.data_validation_config.drift_workers,
+                                                nan_policy=self.data_validation_config.drift_nan_policy)
+            pvalues = ks_results["pvalue"].to_dict()
 
-                if same_distribution.pvalue > 0.05:
+            # non numeric columns (e.g. the target column) are compared one by one as before
+            for base_col in base_df.columns:
+                if base_col not in pvalues:
+                    logging.info(f"Hypothesis {base_col}: {base_df[base_col].dtype},{current_df[base_col].dtype}")
+                    pvalues[base_col] = ks_2samp(base_df[base_col], current_df[base_col]).pvalue
+
+            for base_col in base_df.columns:
+                pvalue = float(pvalues[base_col])
+                if pvalue > 0.05:
                     # We will accept the Null Hypothesis
-                    drift_report[base_col] = {"pvalues":float(same_distribution.pvalue),"same_distribution":True}
+                    drift_report[base_col] = {"pvalues":pvalue,"same_distribution":True}
                 else:
                     # We have to reject the Null Hypothesis
-                    drift_report[base_col] = {"pvalues":float(same_distribution.pvalue),"same_distribution":False}
+                    drift_report[base_col] = {"pvalues":pvalue,"same_distribution":False}
 
             self.validation_error[report_key_name] = drift_report
 
@@ -104,18 +170,100 @@ class DataValidation:
 
 
 
+    def profile_data_drift(self, profile:drift.ReferenceProfile, base_columns:list, current_df:pd.DataFrame,
+                           report_key_name:str):
+        # same report as data_drift, with the base dataset replaced by its profile
+        try:
+            logging.info(f"Running KS test on {len(base_columns)} columns against the base dataset profile")
+            ks_results = profile.ks_2samp_columns(current_df=current_df, columns=base_columns)
+            self.write_drift_report(pvalues=ks_results["pvalue"], report_key_name=report_key_name)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def write_drift_report(self, pvalues:pd.Series, report_key_name:str):
+        drift_report = dict()
+        for base_col, pvalue in pvalues.items():
+            pvalue = float(pvalue)
+            # Null Hypothesis is accepted above 0.05
+            drift_report[base_col] = {"pvalues":pvalue,"same_distribution":pvalue > 0.05}
+        self.validation_error[report_key_name] = drift_report
+
+
+    def get_streaming_stats(self, file_path:str, profile:drift.ReferenceProfile)->drift.StreamingColumnStats:
+        # null counts, columns and drift sketches of a dataset in one chunked pass
+        try:
+            chunk_size = self.data_validation_config.validation_chunk_size
+            logging.info(f"Streaming {file_path} in chunks of {chunk_size} rows")
+            stats = drift.StreamingColumnStats(profile=profile)
+            for chunk in storage.iter_dataframe_chunks(file_path=file_path, chunk_size=chunk_size):
+                stats.update(chunk)
+            logging.info(f"Streamed {stats.rows} rows of {file_path}")
+            return stats
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_streaming_data_validation(self)->artifact_entity.DataValidationArtifact:
+        # same checks and report as initiate_data_validation, without holding train/test in memory
+        try:
+            threshold = self.data_validation_config.missing_threshold
+            profile = self.get_base_profile()
+            base_columns = profile.kept_columns(missing_threshold=threshold)
+            self.validation_error["missing_values_within_base_dataset"] = [
+                column for column in profile.columns if column not in base_columns]
+
+            for dataset_name, file_path in [("train", self.data_ingestion_artifact.train_file_path),
+                                            ("test", self.data_ingestion_artifact.test_file_path)]:
+                stats = self.get_streaming_stats(file_path=file_path, profile=profile)
+                null_report = stats.null_ratio()
+                drop_column_names = list(null_report[null_report>threshold].index)
+                logging.info(f"Columns to drop from {dataset_name} dataframe: {drop_column_names}")
+                self.validation_error[f"missing_values_within_{dataset_name}_dataset"] = drop_column_names
+                current_columns = [column for column in stats.columns if column not in drop_column_names]
+
+                logging.info(f"Checking whether all required columns present in {dataset_name} dataframe")
+                columns_status = self.whether_required_cols_exists(base_df=None, current_df=None,
+                    report_key_name=f"missing_columns_within_{dataset_name}_dataset", base_columns=base_columns,
+                    current_columns=current_columns)
+                if columns_status:
+                    logging.info(f"Since all columns are present in {dataset_name} dataframe, hence detecting data drift")
+                    ks_results = stats.ks_2samp_columns(columns=base_columns)
+                    self.write_drift_report(pvalues=ks_results["pvalue"],
+                                            report_key_name=f"data_drift_within_{dataset_name}_dataset")
+
+            logging.info("Writing report in validation yaml file")
+            utils.write_yaml_file(file_path = self.data_validation_config.report_file_path, data=self.validation_error)
+            data_validation_artifact = artifact_entity.DataValidationArtifact(
+                report_file_path=self.data_validation_config.report_file_path,
+                base_profile_path=self.data_validation_config.base_profile_file_path)
+            logging.info(f"Data validation artifact: {data_validation_artifact}")
+            return data_validation_artifact
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
     def initiate_data_validation(self)->artifact_entity.DataValidationArtifact:
         try:
-            logging.info(f"Reading base dataframe")
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-            base_df.replace({"na":np.NAN}, inplace=True)
-            logging.info("Replace na values with NAN in the base dataframe")
-            base_df = self.drop_cols_with_missing_values(df=base_df, report_key_name="missing_values_within_base_dataset")
+            if self.data_validation_config.validation_mode == "streaming":
+                return self.initiate_streaming_data_validation()
+            elif self.data_validation_config.validation_mode != "in_memory":
+                raise Exception(f"Unsupported validation mode: {self.data_validation_config.validation_mode}")
+            base_df, base_columns, profile = None, None, None
+            if self.data_validation_config.use_base_profile:
+                profile = self.get_base_profile()
+                threshold = self.data_validation_config.missing_threshold
+                base_columns = profile.kept_columns(missing_threshold=threshold)
+                self.validation_error["missing_values_within_base_dataset"] = [
+                    column for column in profile.columns if column not in base_columns]
+            else:
+                logging.info(f"Reading base dataframe")
+                # "na" values are parsed as NaN and readings as float32 while reading, only schema columns are parsed
+                base_df = schema.read_csv(self.data_validation_config.base_file_path, columns=schema.COLUMNS)
+                base_df = self.drop_cols_with_missing_values(df=base_df, report_key_name="missing_values_within_base_dataset")
 
             logging.info("Reading train dataframe")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
+            train_df = storage.load_dataframe(self.data_ingestion_artifact.train_file_path)
             logging.info("Reading test dataframe")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            test_df = storage.load_dataframe(self.data_ingestion_artifact.test_file_path)
 
             logging.info("Drop columns having null values from train dataframe")
             train_df = self.drop_cols_with_missing_values(df=train_df, report_key_name="missing_values_within_train_dataset")
@@ -123,30 +271,38 @@ class DataValidation:
             test_df = self.drop_cols_with_missing_values(df=test_df, report_key_name="missing_values_within_test_dataset")
 
             exclude_columns = [TARGET_COLUMN]
-            base_df = utils.convert_columns_to_float(df=base_df, exclude_columns=exclude_columns)
+            if base_df is not None:
+                base_df = utils.convert_columns_to_float(df=base_df, exclude_columns=exclude_columns)
             train_df = utils.convert_columns_to_float(df=train_df, exclude_columns=exclude_columns)
             test_df = utils.convert_columns_to_float(df=test_df, exclude_columns=exclude_columns)
 
             logging.info("Checking whether all required columns present in train dataframe")
             train_df_columns_status = self.whether_required_cols_exists(base_df=base_df, current_df=train_df, 
-            report_key_name = "missing_columns_within_train_dataset")
+            report_key_name = "missing_columns_within_train_dataset", base_columns=base_columns)
             logging.info("Checking whether all required columns present in test dataframe")
             test_df_columns_status = self.whether_required_cols_exists(base_df=base_df, current_df=test_df, 
-            report_key_name = "missing_columns_within_test_dataset")
+            report_key_name = "missing_columns_within_test_dataset", base_columns=base_columns)
 
-            if train_df_columns_status:
-                # if above returns True then execute the following
-                logging.info("Since all columns are present in train dataframe, hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=train_df, report_key_name="data_drift_within_train_dataset")
-            if test_df_columns_status:
-                logging.info("Since all columns are present in test dataframe, hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=test_df, report_key_name="data_drift_within_test_dataset")
+            for columns_status, current_df, report_key_name in [
+                (train_df_columns_status, train_df, "data_drift_within_train_dataset"),
+                (test_df_columns_status, test_df, "data_drift_within_test_dataset")]:
+                if not columns_status:
+                    continue
+                # if all columns are present then detect data drift
+                logging.info(f"Since all columns are present, hence detecting {report_key_name}")
+                if profile is not None:
+                    self.profile_data_drift(profile=profile, base_columns=base_columns, current_df=current_df,
+                                            report_key_name=report_key_name)
+                else:
+                    self.data_drift(base_df=base_df, current_df=current_df, report_key_name=report_key_name)
 
             # writing the report in a yaml file created in utils.py
             logging.info("Writing report in validation yaml file")
             utils.write_yaml_file(file_path = self.data_validation_config.report_file_path, data=self.validation_error)
 
-            data_validation_artifact = artifact_entity.DataValidationArtifact(report_file_path=self.data_validation_config.report_file_path)
+            base_profile_path = self.data_validation_config.base_profile_file_path if profile is not None else None
+            data_validation_artifact = artifact_entity.DataValidationArtifact(report_file_path=self.data_validation_config.report_file_path,
+                                                                              base_profile_path=base_profile_path)
             logging.info(f"Data validation artifact: {data_validation_artifact}")
             return data_validation_artifact
 
@@ -1,12 +1,9 @@
 import os, sys
-import pandas as pd
 from sensor.entity import config_entity, artifact_entity
 from sensor.predictor import ModelResolver
 from sensor.exception import SensorException
 from sensor.logger import logging
-from sensor.utils import load_object
-from sensor.config import TARGET_COLUMN
-from sklearn.metrics import f1_score
+from sensor.evaluation import Candidate, EvaluationEngine
 
 class ModelEvaluation:
 
@@ -36,53 +33,31 @@ class ModelEvaluation:
                 logging.info(f"Model evaluation artifact: {model_eval_artifact}")
                 return model_eval_artifact
 
-            # Finding location of transformer model and target encoder
-            logging.info(f"Finding location of currently accepted model, transformer and target encoder")
-            model_path = self.model_resolver.get_latest_model_path()
-            transformer_path = self.model_resolver.get_latest_transformer_path()
-            target_encoder_path = self.model_resolver.get_latest_target_encoder_path()
+            # champions: the latest saved versions and the current (serving) one, which is an older version after a
+            # rollback, challenger: the currently trained model
+            logging.info(f"Finding location of saved and currently trained model, transformer and target encoder")
+            dir_paths = self.model_resolver.get_dir_paths()
+            if self.model_eval_config.champion_versions is not None:
+                dir_paths = dir_paths[-self.model_eval_config.champion_versions:]
+            if latest_dir_path not in dir_paths:
+                dir_paths = [latest_dir_path] + dir_paths
+            champions = [Candidate.from_version_dir(self.model_resolver, dir_path) for dir_path in dir_paths]
+            challenger = Candidate(name="current", model_path=self.model_trainer_artifact.model_path,
+                                   transformer_path=self.data_transformation_artifact.transform_object_path,
+                                   target_encoder_path=self.data_transformation_artifact.target_encoder_path,
+                                   fused_transformer_path=self.data_transformation_artifact.fused_transform_object_path)
 
-            logging.info(f"Previously trained objects of model, transformer and target encoder")
-            # Previously trained objects
-            model = load_object(file_path=model_path)
-            transformer = load_object(file_path=transformer_path)
-            target_encoder = load_object(file_path=target_encoder_path)
+            # the test set is transformed once per distinct transformer, known scores are reused
+            engine = EvaluationEngine(test_file_path=self.data_ingestion_artifact.test_file_path,
+                                      score_cache_file_path=self.model_eval_config.score_cache_file_path,
+                                      n_workers=self.model_eval_config.evaluation_workers,
+                                      use_fused_transformer=self.model_eval_config.use_fused_transformer)
+            scores = engine.score(champions + [challenger])
 
-            # Finding location of transformer model and target encoder
-            logging.info(f"Finding location of currently trained model, transformer and target encoder")
-            current_model_path = self.model_trainer_artifact.model_path
-            current_transformer_path = self.data_transformation_artifact.transform_object_path
-            current_target_encoder_path = self.data_transformation_artifact.target_encoder_path
-
-            logging.info(f"Currently trained objects of model, transformer and target encoder")
-            # Currently trained model objects
-            current_model = load_object(file_path=current_model_path)
-            current_transformer = load_object(file_path=current_transformer_path)
-            current_target_encoder = load_object(file_path=current_target_encoder_path)
-
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            target_df = test_df[TARGET_COLUMN]
-            y_true = target_encoder.transform(target_df)
-
-            # accuracy of previously trained and currently utilised model
-            # as aour transformer obj may have different feature cols as compared to test_df, we extract the input features first
-            input_feature_name = list(transformer.feature_names_in_)        # to get all feature cols present after removing cols having different distributions of that particular train_df
-            input_arr = transformer.transform(test_df[input_feature_name])    # passing only those features for transformation
-            y_pred = model.predict(input_arr)
-            logging.info(f"Fetching first 5 predictions from currently accepted model")
-            print(f"Prediction using previous model: {target_encoder.inverse_transform(y_pred[:5])}")
-            previous_model_score = f1_score(y_true=y_true, y_pred=y_pred)
-            logging.info(f"Accuracy using previous trained model: {previous_model_score}")
-
-            # Accuracy using currently trained model
-            input_feature_name = list(current_transformer.feature_names_in_)
-            # transforming input feature columnms
-            input_arr = current_transformer.transform(test_df[input_feature_name])
-            y_pred_current = current_model.predict(input_arr)
-            y_true_current = current_target_encoder.transform(target_df)
-            logging.info(f"Fetching first 5 predictions from currently trained model")
-            print(f"Prediction using currently trained model: {current_target_encoder.inverse_transform(y_pred[:5])}")
-            current_model_score = f1_score(y_true = y_true_current, y_pred = y_pred_current)
+            champion = max(champions, key=lambda candidate: scores[candidate.name])
+            previous_model_score = scores[champion.name]
+            logging.info(f"Accuracy using previous trained model (version {champion.name}): {previous_model_score}")
+            current_model_score = scores[challenger.name]
             logging.info(f"Accuracy using currently trained model: {current_model_score}")
 
             # Comparing current and previous model scores
@@ -4,7 +4,9 @@ from sensor.predictor import ModelResolver
 from sensor.exception import SensorException
 from sensor.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
 from sensor.logger import logging
-from sensor.utils import load_object, save_object
+from sensor.utils import copy_object, load_object
+from sensor.fused_transformer import load_fused_transformer
+from sensor.model_bundle import save_model_bundle
 from sensor.entity.config_entity import ModelPusherConfig
 
 
@@ -12,12 +14,14 @@ class ModelPusher:
 
     def __init__(self, model_pusher_config:config_entity.ModelPusherConfig, 
     data_transformation_artifact:artifact_entity.DataTransformationArtifact,
-    model_trainer_artifact:artifact_entity.ModelTrainerArtifact):
+    model_trainer_artifact:artifact_entity.ModelTrainerArtifact,
+    data_validation_artifact:artifact_entity.DataValidationArtifact=None):
         try:
             logging.info(f"{'>>'*20} Model Pusher {'<<'*20}")
             self.model_pusher_config = model_pusher_config
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.data_validation_artifact = data_validation_artifact
             self.model_resolver = ModelResolver(model_registry=self.model_pusher_config.saved_models_dir)
         except Exception as e:
             raise SensorException(e, sys)
@@ -25,34 +29,60 @@ class ModelPusher:
 
     def initiate_model_pusher(self,) -> ModelPusherArtifact:
         try:
-            # load object
-            logging.info(f"Loading current trained model, its transformer and target encoder objects")
-            model = load_object(file_path=self.model_trainer_artifact.model_path)
-            transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
-            target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
+            # the saved files are copied as they are, objects are never loaded and dumped again
+            model_path = self.model_trainer_artifact.model_path
+            transformer_path = self.data_transformation_artifact.transform_object_path
+            target_encoder_path = self.data_transformation_artifact.target_encoder_path
+            fused_transformer_path = self.data_transformation_artifact.fused_transform_object_path
 
             # model pusher dir (saving objects inside artifact directory)
             logging.info(f"Saving model inside artifact directory")
-            save_object(file_path=self.model_pusher_config.pusher_model_path, obj=model)
+            copy_object(src_file_path=model_path, dst_file_path=self.model_pusher_config.pusher_model_path)
             # above trained model object will be saved at location artifact/model_pusher/saved_models/model.pkl
-            save_object(file_path=self.model_pusher_config.pusher_transformer_path, obj=transformer)
+            copy_object(src_file_path=transformer_path, dst_file_path=self.model_pusher_config.pusher_transformer_path)
             # similarly transformer obj saved at location artifact/model_pusher/saved_models/transformer.pkl
-            save_object(file_path=self.model_pusher_config.pusher_target_encoder_path, obj=target_encoder)
+            copy_object(src_file_path=target_encoder_path, 
+                        dst_file_path=self.model_pusher_config.pusher_target_encoder_path)
             # similarly target_encoder obj saved at location artifact/model_pusher/saved_models/target_encoder.pkl
+            if fused_transformer_path is not None:
+                copy_object(src_file_path=fused_transformer_path,
+                            dst_file_path=self.model_pusher_config.pusher_fused_transformer_path)
+            # model, fused transformer and label mapping in one file, loaded without dill by the prediction side
+            logging.info(f"Saving model bundle")
+            save_model_bundle(file_path=self.model_pusher_config.pusher_model_bundle_path,
+                              model=load_object(file_path=model_path),
+                              transformer=load_fused_transformer(file_path=fused_transformer_path,
+                                                                 transformer_path=transformer_path),
+                              target_encoder=load_object(file_path=target_encoder_path))
+            # base dataset profile is versioned with the model, so the next validation does not rebuild it
+            base_profile_path = None
+            if self.data_validation_artifact is not None:
+                base_profile_path = self.data_validation_artifact.base_profile_path
+            if base_profile_path is not None:
+                copy_object(src_file_path=base_profile_path, dst_file_path=self.model_pusher_config.pusher_base_profile_path)
 
             # saving objects at root location in saved_models dir
-            # NOTE that we are first getting locations for each object and then we move to the saving step
+            # the files are written into a staging directory first and published as saved_models/{latest_num}+1
+            # in one rename, the version number is taken under the registry lock
             logging.info(f"Saving model in saved_models directory")
-            # model obj to be saved in saved_models/{latest_num}+1/model/model.pkl
-            model_path = self.model_resolver.get_latest_save_model_path()
-            # transformer obj to be saved in saved_models/{latest_num}+1/transformer/transformer.pkl
-            transformer_path = self.model_resolver.get_latest_save_transformer_path()
-            # target_encoder obj to be saved in saved_models/{latest_num}+1/target_encoder/target_encoder.pkl
-            target_encoder_path = self.model_resolver.get_latest_save_target_encoder_path()
-
-            save_object(file_path=model_path, obj=model)
-            save_object(file_path=transformer_path, obj=transformer)
-            save_object(file_path=target_encoder_path, obj=target_encoder)
+            staging_dir = self.model_resolver.registry.create_staging_dir()
+            try:
+                save_paths = self.model_resolver.get_version_paths(staging_dir)
+                copy_object(src_file_path=model_path, dst_file_path=save_paths["model"])
+                copy_object(src_file_path=transformer_path, dst_file_path=save_paths["transformer"])
+                copy_object(src_file_path=target_encoder_path, dst_file_path=save_paths["target_encoder"])
+                if fused_transformer_path is not None:
+                    copy_object(src_file_path=fused_transformer_path, dst_file_path=save_paths["fused_transformer"])
+                copy_object(src_file_path=self.model_pusher_config.pusher_model_bundle_path,
+                            dst_file_path=save_paths["bundle"])
+                # profile to be saved in saved_models/{latest_num}+1/profile/base_profile.npz
+                if base_profile_path is not None:
+                    copy_object(src_file_path=base_profile_path, dst_file_path=save_paths["profile"])
+                saved_version_dir = self.model_resolver.registry.publish(staging_dir)
+            except Exception:
+                self.model_resolver.registry.discard_staging_dir(staging_dir)
+                raise
+            logging.info(f"Saved model in {saved_version_dir}")
 
             model_pusher_artifact = ModelPusherArtifact(pusher_model_dir=self.model_pusher_config.pusher_model_dir, 
             saved_model_dir=self.model_pusher_config.saved_models_dir)
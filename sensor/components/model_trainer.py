@@ -6,6 +6,9 @@ from sensor.exception import SensorException
 from sensor.entity import config_entity, artifact_entity
 from xgboost import XGBClassifier
 from sensor import utils
+from sensor.tuning import SuccessiveHalvingSearch
+from sensor import xgb_training
+from sensor import cross_validation
 from sklearn.metrics import f1_score
 
 
@@ -22,38 +25,161 @@ class ModelTrainer:
         except Exception as e:
             raise SensorException(e, sys)
 
-    def fine_tune(self):
+    def fine_tune(self)->dict:
+        # returns the xgboost parameters (including n_estimators) of the best trial of a successive halving search
+        # the search splits the train arrays before resampling and resamples the fit rows of its split only
         try:
-            # Write code for GridSearchCV
-            pass
-
+            config = self.model_trainer_config
+            artifact = self.data_transformation_artifact
+            if artifact.unsampled_train_x_path is None:
+                raise Exception("Fine tuning needs the train arrays before resampling, run data transformation again")
+            x = utils.load_numpy_array_data(file_path=artifact.unsampled_train_x_path, mmap_mode="r")
+            y = utils.load_numpy_array_data(file_path=artifact.unsampled_train_y_path, mmap_mode="r")
+            search = SuccessiveHalvingSearch(n_trials=config.tuning_trials, min_budget=config.tuning_min_estimators,
+                                             max_budget=config.tuning_max_estimators, eta=config.tuning_eta,
+                                             n_workers=config.tuning_workers,
+                                             validation_size=config.tuning_validation_size,
+                                             early_stopping_rounds=config.tuning_early_stopping_rounds,
+                                             trials_file_path=config.tuning_trials_file_path,
+                                             random_state=config.tuning_random_state)
+            os.makedirs(os.path.dirname(config.tuning_trials_file_path), exist_ok=True)
+            best_trial = search.search(x=x, y=y, scale_pos_weight=artifact.scale_pos_weight,
+                                       resampling_params=artifact.resampling_params)
+            # final model is trained without early stopping, with the number of trees the best trial needed
+            return dict(best_trial["params"], n_estimators=best_trial["n_estimators"])
         except Exception as e:
             raise SensorException(e, sys)
 
-    def train_model(self, x, y):
+    def train_model(self, x, y, params:dict=None):
         try:
-            xgb_clf = XGBClassifier()
+            params = dict(params or {})
+            # set when the minority class was not oversampled during data transformation
+            scale_pos_weight = self.data_transformation_artifact.scale_pos_weight
+            if scale_pos_weight is not None:
+                params["scale_pos_weight"] = scale_pos_weight
+            xgb_clf = XGBClassifier(**params)
             xgb_clf.fit(x,y)
             return xgb_clf
         except Exception as e:
             raise SensorException(e, sys)
 
-    def initiate_model_trainer(self,) -> artifact_entity.ModelTrainerArtifact:
+    def cross_validate(self, params:dict=None)->dict:
+        # trains the folds of the train arrays before resampling concurrently, every fold resamples its own training
+        # rows, returns the fold scores (and models)
         try:
-            logging.info("Loading train and test array")
-            train_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
+            config = self.model_trainer_config
+            artifact = self.data_transformation_artifact
+            if artifact.unsampled_train_x_path is None:
+                raise Exception("Cross validation needs the train arrays before resampling, run data transformation again")
+            params = dict(params or {})
+            scale_pos_weight = artifact.scale_pos_weight
+            if scale_pos_weight is not None:
+                params["scale_pos_weight"] = scale_pos_weight
+            return cross_validation.cross_validate(x_file_path=artifact.unsampled_train_x_path,
+                                                   y_file_path=artifact.unsampled_train_y_path,
+                                                   n_folds=config.cv_folds, n_workers=config.cv_workers, params=params,
+                                                   keep_models=config.cv_ensemble,
+                                                   random_state=config.cv_random_state,
+                                                   resampling_params=artifact.resampling_params,
+                                                   training_mode=config.training_mode, max_bin=config.max_bin)
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            logging.info(f"Splitting input and target feature from both train and test array")
-            x_train, y_train = train_arr[:,:-1], train_arr[:,-1]
-            x_test, y_test = test_arr[:,:-1], test_arr[:,-1]
+    def get_quantized_matrices(self):
+        # train and test matrices of the hist training modes, the test matrix uses the buckets of the train matrix
+        try:
+            config = self.model_trainer_config
+            artifact = self.data_transformation_artifact
+            train_paths = (artifact.transformed_train_x_path, artifact.transformed_train_y_path)
+            test_paths = (artifact.transformed_test_x_path, artifact.transformed_test_y_path)
+            if config.training_mode == "quantile":
+                matrix_kwargs = dict(max_bin=config.max_bin, nthread=config.xgb_nthread)
+                dtrain = xgb_training.get_quantile_matrix(*train_paths, **matrix_kwargs)
+                dtest = xgb_training.get_quantile_matrix(*test_paths, ref_file_paths=train_paths, **matrix_kwargs)
+            else:
+                matrix_kwargs = dict(cache_dir=config.dmatrix_cache_dir, chunk_rows=config.external_memory_chunk_rows,
+                                     max_bin=config.max_bin, nthread=config.xgb_nthread)
+                dtrain = xgb_training.get_external_memory_matrix(*train_paths, **matrix_kwargs)
+                dtest = xgb_training.get_external_memory_matrix(*test_paths, ref_file_paths=train_paths,
+                                                                **matrix_kwargs)
+            return dtrain, dtest
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def train_booster(self, dtrain, params:dict=None)->xgb_training.BoosterClassifier:
+        try:
+            params = dict(params or {})
+            scale_pos_weight = self.data_transformation_artifact.scale_pos_weight
+            if scale_pos_weight is not None:
+                params["scale_pos_weight"] = scale_pos_weight
+            return xgb_training.train_booster(dtrain=dtrain, params=params, max_bin=self.model_trainer_config.max_bin,
+                                              nthread=self.model_trainer_config.xgb_nthread)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def train_score(self, model)->float:
+        # f1 of the train rows before resampling, resampled rows are only used for fitting: their class ratio differs
+        # from the test rows, so the overfitting gate would mostly measure the class balance
+        # rows are predicted in chunks of memory mapped rows, the array is never loaded as a whole
+        try:
+            artifact = self.data_transformation_artifact
+            x_file_path = artifact.unsampled_train_x_path or artifact.transformed_train_x_path
+            y_file_path = artifact.unsampled_train_y_path or artifact.transformed_train_y_path
+            x = utils.load_numpy_array_data(file_path=x_file_path, mmap_mode="r")
+            y = utils.load_numpy_array_data(file_path=y_file_path, mmap_mode="r")
+            chunk_rows = self.model_trainer_config.external_memory_chunk_rows
+            yhat = np.concatenate([model.predict(np.asarray(x[start:start + chunk_rows]))
+                                   for start in range(0, x.shape[0], chunk_rows)])
+            return f1_score(np.asarray(y), yhat)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_model_trainer(self,) -> artifact_entity.ModelTrainerArtifact:
+        try:
+            training_mode = self.model_trainer_config.training_mode
+            if training_mode not in xgb_training.TRAINING_MODES:
+                raise Exception(f"Unsupported training mode: {training_mode}, choose one of {xgb_training.TRAINING_MODES}")
+
+            if training_mode == "external_memory":
+                # the arrays are never loaded as a whole, the matrices stream the files
+                x_train = None
+            else:
+                # input features and target are separate contiguous arrays, mapped instead of read and sliced
+                logging.info("Loading train and test arrays")
+                artifact = self.data_transformation_artifact
+                x_train = utils.load_numpy_array_data(file_path=artifact.transformed_train_x_path, mmap_mode="r")
+                y_train = utils.load_numpy_array_data(file_path=artifact.transformed_train_y_path, mmap_mode="r")
+                x_test = utils.load_numpy_array_data(file_path=artifact.transformed_test_x_path, mmap_mode="r")
+                y_test = utils.load_numpy_array_data(file_path=artifact.transformed_test_y_path, mmap_mode="r")
+
+            params = None
+            if self.model_trainer_config.fine_tune:
+                if x_train is None:
+                    raise Exception("fine_tune needs the train array in memory, it is not available in external_memory mode")
+                logging.info("Searching xgboost parameters")
+                params = self.fine_tune()
+
+            cv_scores = None
+            if self.model_trainer_config.cv_folds > 1:
+                if x_train is None:
+                    raise Exception("cv_folds needs the train array in memory, it is not available in external_memory mode")
+                logging.info(f"Cross validating with {self.model_trainer_config.cv_folds} folds")
+                cv_scores = self.cross_validate(params=params)
 
             logging.info("Train the model after splitting feature and target from array")
-            model = self.train_model(x=x_train, y=y_train)
+            if cv_scores is not None and self.model_trainer_config.cv_ensemble:
+                # the fold models are the model, no refit on the whole train array
+                model = cross_validation.FoldEnsembleClassifier(models=cv_scores["models"])
+            elif training_mode == "default":
+                model = self.train_model(x=x_train, y=y_train, params=params)
+            else:
+                dtrain, dtest = self.get_quantized_matrices()
+                model = self.train_booster(dtrain=dtrain, params=params)
+                # the test score runs on the quantized matrix built for training
+                x_test, y_test = dtest, dtest.get_label()
 
             logging.info("Calculating f1 train score")
-            yhat_train = model.predict(x_train)
-            f1_train_score = f1_score(y_train, yhat_train)
+            f1_train_score = self.train_score(model=model)
 
             logging.info("Calculating f1 test score")
             yhat_test = model.predict(x_test)
@@ -61,15 +187,24 @@ class ModelTrainer:
 
             logging.info(f"train score:{f1_train_score} and test score {f1_test_score}")
 
+            # with cross validation the gates use the mean fold scores instead of the single split
+            f1_cv_mean, f1_cv_std = None, None
+            gate_train_score, gate_test_score = f1_train_score, f1_test_score
+            if cv_scores is not None:
+                f1_cv_mean = float(np.mean(cv_scores["f1_validation"]))
+                f1_cv_std = float(np.std(cv_scores["f1_validation"]))
+                gate_train_score, gate_test_score = float(np.mean(cv_scores["f1_train"])), f1_cv_mean
+                logging.info(f"cross validation score:{f1_cv_mean} +/- {f1_cv_std}")
+
             # check for overfitting, underfitting or expected score(defined by user)
             # dealing underfitting
             logging.info("Checking whether model is underfitting or not by comparing with expected accuracy")
-            if f1_test_score < self.model_trainer_config.expected_score:
-                raise Exception(f"Model is underperforming as obtained accuracy: {f1_test_score} is lower than expected: \
+            if gate_test_score < self.model_trainer_config.expected_score:
+                raise Exception(f"Model is underperforming as obtained accuracy: {gate_test_score} is lower than expected: \
                                {self.model_trainer_config.expected_score}")
 
             logging.info(f"Checking whether model is overfitting or not")
-            diff = abs(f1_train_score-f1_test_score)
+            diff = abs(gate_train_score-gate_test_score)
             
             # dealing overfitting
             if diff > self.model_trainer_config.overfitting_threshold:
@@ -83,7 +218,8 @@ class ModelTrainer:
             # prepare artifact
             logging.info(f"Prepare the artifact")
             model_trainer_artifact = artifact_entity.ModelTrainerArtifact(model_path=self.model_trainer_config.model_path, 
-                                                f1_train_score = f1_train_score, f1_test_score = f1_test_score)
+                                                f1_train_score = f1_train_score, f1_test_score = f1_test_score,
+                                                f1_cv_mean = f1_cv_mean, f1_cv_std = f1_cv_std)
             logging.info(f"Model trainer artifact: {model_trainer_artifact}")
             return model_trainer_artifact
         except Exception as e:
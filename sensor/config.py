@@ -1,6 +1,5 @@
-import pymongo
-import pandas as pd
 import json
+import threading
 from dataclasses import dataclass
 import os
 
@@ -15,5 +14,32 @@ class EnvironmentVariable:
 
 
 env_var = EnvironmentVariable()
-mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
-TARGET_COLUMN = "class"
\ No newline at end of file
+TARGET_COLUMN = "class"
+
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+
+def get_mongo_client():
+    # pymongo is imported and the client created on first use, so modules that never read mongodb
+    # (prediction workers, the scoring service) neither import pymongo nor open a connection pool
+    global _mongo_client
+    if _mongo_client is None:
+        with _mongo_client_lock:
+            if _mongo_client is None:
+                import pymongo
+                _mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
+    return _mongo_client
+
+
+class LazyMongoClient:
+    # stands for the shared client: mongo_client[database][collection] and attribute access create it when needed
+
+    def __getitem__(self, database_name:str):
+        return get_mongo_client()[database_name]
+
+    def __getattr__(self, name:str):
+        return getattr(get_mongo_client(), name)
+
+
+mongo_client = LazyMongoClient()
@@ -0,0 +1,101 @@
+# stratified k-fold training of the model, folds trained concurrently in a process pool
+# every worker maps the transformed input feature and target .npy files itself, so the arrays are never pickled
+# to the workers. Each fold gets cores // workers xgboost threads, with as many workers as folds the wall time is
+# close to a single fit on a machine with enough cores.
+# folds are cut from the train arrays before resampling and only the training rows of a fold are resampled, so
+# no synthetic row built from training rows ends up in the validation rows. Both fold scores are taken on rows
+# before resampling. Fold models are the model kind the
+# training mode saves: XGBClassifier in the default mode, the hist booster in the quantile modes.
+
+import os, sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+from xgboost import XGBClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import StratifiedKFold
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.artifact_cache import artifact_cache
+from sensor import xgb_training
+
+
+class FoldEnsembleClassifier:
+    # averages the positive class probability of the fold models, predict api of XGBClassifier
+
+    def __init__(self, models:list):
+        self.models = models
+
+    def predict_proba(self, X)->np.ndarray:
+        positive = np.mean([model.predict_proba(X)[:, 1] for model in self.models], axis=0)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X)->np.ndarray:
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(np.int64)
+
+
+def _train_fold(x_file_path:str, y_file_path:str, train_rows:np.ndarray, validation_rows:np.ndarray, params:dict,
+                n_jobs:int, keep_model:bool, resampling_params:Optional[dict]=None, training_mode:str="default",
+                max_bin:int=256):
+    x = np.load(x_file_path, mmap_mode="r")
+    y = np.load(y_file_path, mmap_mode="r")
+    x_train, y_train = x[train_rows], y[train_rows]
+    x_validation, y_validation = x[validation_rows], y[validation_rows]
+    x_fit, y_fit = x_train, y_train
+    if resampling_params is not None:
+        # imported here, unpickling a FoldEnsembleClassifier for prediction must not pull in imblearn
+        from sensor import resampling
+        x_fit, y_fit = resampling.resample(x=x_train, y=y_train, n_jobs=n_jobs, **resampling_params)
+    if training_mode == "default":
+        model = XGBClassifier(n_jobs=n_jobs, **params)
+        model.fit(x_fit, y_fit)
+    else:
+        import xgboost as xgb
+        dtrain = xgb.QuantileDMatrix(x_fit, label=y_fit, max_bin=max_bin, nthread=n_jobs)
+        model = xgb_training.train_booster(dtrain=dtrain, params=params, max_bin=max_bin, nthread=n_jobs)
+    # resampled rows are only used for fitting, the train score is taken on the fold's training rows before
+    # resampling so it has the class ratio of the validation rows and the overfitting gate compares like with like
+    return {"f1_train": float(f1_score(y_train, model.predict(x_train))),
+            "f1_validation": float(f1_score(y_validation, model.predict(x_validation))),
+            "model": model if keep_model else None}
+
+
+def cross_validate(x_file_path:str, y_file_path:str, n_folds:int=5, n_workers:int=1, params:dict=None,
+                   keep_models:bool=False, random_state:Optional[int]=None, resampling_params:Optional[dict]=None,
+                   training_mode:str="default", max_bin:int=256)->dict:
+    """
+    x_file_path: saved float32 input feature array, before resampling
+    y_file_path: saved int8 target array, before resampling
+    n_folds: number of stratified folds
+    n_workers: processes training folds at the same time
+    params: XGBClassifier parameters of every fold
+    keep_models: return the fold models (for a FoldEnsembleClassifier)
+    random_state: seed of the fold split
+    resampling_params: resampling.resample parameters applied to the training rows of every fold, None for none
+    training_mode: "default" trains XGBClassifier folds, "quantile" and "external_memory" hist booster folds
+    max_bin: buckets per feature of the hist booster folds
+    ====================================================================
+    returns {"f1_train": [...], "f1_validation": [...], "models": [...] or None}
+    """
+    try:
+        # the workers read the files, pending background writes have to be finished
+        artifact_cache.flush()
+        y = np.load(y_file_path, mmap_mode="r")
+        folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+        splits = list(folds.split(np.zeros(y.shape[0]), y))
+        n_workers = max(1, min(n_workers, n_folds))
+        n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+        logging.info(f"Training {n_folds} folds with {n_workers} workers x {n_jobs} threads")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_train_fold, x_file_path, y_file_path, train_rows, validation_rows,
+                                       dict(params or {}), n_jobs, keep_models, resampling_params, training_mode,
+                                       max_bin)
+                       for train_rows, validation_rows in splits]
+            results = [future.result() for future in futures]
+        scores = {"f1_train": [result["f1_train"] for result in results],
+                  "f1_validation": [result["f1_validation"] for result in results],
+                  "models": [result["model"] for result in results] if keep_models else None}
+        logging.info(f"Fold validation f1 scores: {scores['f1_validation']}")
+        return scores
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,399 @@
+# batched two sample Kolmogorov-Smirnov test for data drift detection
+# every base column is sorted once and reused for each comparison. The current data is sorted column-wise in one
+# call, merged with the sorted base columns and the KS statistic of all columns in a block is computed at once
+# with cumulative sums, instead of one scipy.stats.ks_2samp call (and one more sort of the base data) per column.
+# p-values follow scipy's ks_2samp(mode="auto"): exact distribution for small samples, Smirnov's asymptotic
+# distribution otherwise, so results match the scipy implementation.
+# ReferenceProfile keeps a compact sketch of the base dataset, so the drift check can run without loading it.
+
+import os, sys
+import json
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import ks_2samp, kstwo
+from sensor.exception import SensorException
+
+# scipy's ks_2samp switches from the exact to the asymptotic p-value above this sample size
+MAX_EXACT_SIZE = 10000
+# number of columns merged at once, bounds the memory of the (columns x rows) merge buffers
+BLOCK_SIZE = 32
+
+
+def sort_columns(df:pd.DataFrame, columns:list):
+    # column-wise sort with NaN values moved to the end of every column, plus the count of non NaN values
+    # columns are laid out as rows (columns x rows) so every column is contiguous in memory
+    values = np.sort(df[columns].to_numpy(dtype=np.float64).T, axis=1)
+    counts = (~np.isnan(values)).sum(axis=1)
+    return values, counts
+
+
+class DriftReference:
+    """
+    Sorted base dataset, prepared once and compared against any number of current datasets
+    """
+
+    def __init__(self, base_df:pd.DataFrame, columns:list=None):
+        try:
+            self.columns = list(base_df.columns) if columns is None else list(columns)
+            self.sorted_values, self.counts = sort_columns(base_df, self.columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+def ks_statistics(base_sorted:np.ndarray, base_counts:np.ndarray, current_sorted:np.ndarray,
+                  current_counts:np.ndarray)->np.ndarray:
+    """
+    Two sided KS statistic of every column pair, NaN values are ignored
+    base_sorted, current_sorted: (columns x rows) arrays sorted along rows with NaN values at the end of every row
+    base_counts, current_counts: number of non NaN values per column
+    ===========================================================================================
+    returns array of KS statistics (NaN where one of the samples is empty)
+    """
+    n_base = base_sorted.shape[1]
+    values = np.concatenate([base_sorted, current_sorted], axis=1)
+    # both halves are already sorted, a stable sort only has to merge two runs
+    order = np.argsort(values, axis=1, kind="stable")
+    values = np.take_along_axis(values, order, axis=1)
+    valid = ~np.isnan(values)
+    from_base = order < n_base
+    # n1*n2*(F1 - F2) stays an integer, so the whole difference is computed without divisions
+    base_counts = base_counts.astype(np.int64)
+    current_counts = current_counts.astype(np.int64)
+    differences = (np.cumsum(from_base & valid, axis=1) * current_counts[:, None]
+                   - np.cumsum(~from_base & valid, axis=1) * base_counts[:, None])
+    # with ties only the last occurrence of a value carries the value of both empirical distributions
+    last_of_value = valid
+    last_of_value[:, :-1] &= values[:, :-1] != values[:, 1:]
+    differences[~last_of_value] = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics = (np.maximum(differences.max(axis=1), -differences.min(axis=1))
+                      / (base_counts * current_counts)).astype(np.float64)
+    statistics[(base_counts == 0) | (current_counts == 0)] = np.nan
+    return statistics
+
+
+def ks_pvalues(statistics:np.ndarray, base_counts:np.ndarray, current_counts:np.ndarray)->np.ndarray:
+    # asymptotic p-values of all columns at once, same formula as scipy's ks_2samp for large samples
+    m = np.maximum(base_counts, current_counts).astype(np.float64)
+    n = np.minimum(base_counts, current_counts).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        en = np.round(m * n / (m + n))
+        pvalues = np.clip(kstwo.sf(statistics, en), 0, 1)
+    pvalues[np.isnan(statistics)] = np.nan
+    return pvalues
+
+
+def _ks_block(base_sorted:np.ndarray, base_counts:np.ndarray, current_sorted:np.ndarray,
+              current_counts:np.ndarray):
+    statistics = ks_statistics(base_sorted, base_counts, current_sorted, current_counts)
+    pvalues = ks_pvalues(statistics, base_counts, current_counts)
+    # small samples use the exact distribution in scipy, those few columns are handed to scipy directly
+    exact = (np.maximum(base_counts, current_counts) <= MAX_EXACT_SIZE) & ~np.isnan(statistics)
+    for index in np.flatnonzero(exact):
+        result = ks_2samp(base_sorted[index, :base_counts[index]], current_sorted[index, :current_counts[index]])
+        statistics[index], pvalues[index] = result.statistic, result.pvalue
+    return statistics, pvalues
+
+
+def ks_2samp_columns(reference:DriftReference, current_df:pd.DataFrame, n_workers:int=1,
+                     nan_policy:str="omit")->pd.DataFrame:
+    """
+    KS test of every reference column against the same column of current_df
+    reference: sorted base dataset
+    current_df: dataset to compare, must contain all reference columns
+    n_workers: number of processes the column blocks are spread over
+    nan_policy: "omit" ignores missing values, "propagate" gives a NaN p-value for columns with missing values
+    ===========================================================================================
+    returns dataframe indexed by column with "statistic" and "pvalue"
+    """
+    try:
+        if nan_policy not in ("omit", "propagate"):
+            raise Exception(f"Unknown nan_policy: {nan_policy}, expected 'omit' or 'propagate'")
+        columns = reference.columns
+        current_sorted, current_counts = sort_columns(current_df, columns)
+        blocks = [slice(start, start + BLOCK_SIZE) for start in range(0, len(columns), BLOCK_SIZE)]
+        arguments = [(reference.sorted_values[block], reference.counts[block], current_sorted[block],
+                      current_counts[block]) for block in blocks]
+        if n_workers > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(blocks))) as executor:
+                results = list(executor.map(_ks_block, *zip(*arguments)))
+        else:
+            results = [_ks_block(*argument) for argument in arguments]
+        statistics = np.concatenate([result[0] for result in results])
+        pvalues = np.concatenate([result[1] for result in results])
+        if nan_policy == "propagate":
+            has_nan = (reference.counts < reference.sorted_values.shape[1]) | (current_counts < current_sorted.shape[1])
+            statistics[has_nan] = np.nan
+            pvalues[has_nan] = np.nan
+        return pd.DataFrame({"statistic": statistics, "pvalue": pvalues}, index=columns)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+class ReferenceProfile:
+    """
+    Compact per column statistics of the reference (base) dataset, used instead of the dataset itself
+    numeric columns: null ratio, min, max, count and an ECDF sketch of at most n_knots (value, cdf) points,
+                     exact when the column has fewer distinct values than knots
+    other columns:   null ratio and count of every category (the ECDF of categories is exact)
+    """
+
+    PROFILE_VERSION = 1
+
+    def __init__(self, rows:int, columns:list, null_ratio:dict, numeric:dict, categories:dict, n_knots:int):
+        self.rows = rows
+        self.columns = columns
+        self.null_ratio = null_ratio
+        # column -> {"count", "min", "max", "knot_values", "knot_cdf"}
+        self.numeric = numeric
+        # column -> {category: count}
+        self.categories = categories
+        self.n_knots = n_knots
+
+    @classmethod
+    def from_dataframe(cls, df:pd.DataFrame, n_knots:int=4096):
+        try:
+            null_ratio = (df.isna().sum() / df.shape[0]).astype(float).to_dict()
+            numeric, categories = dict(), dict()
+            for column in df.columns:
+                series = df[column].dropna()
+                if is_numeric_dtype(df[column].dtype):
+                    values = np.sort(series.to_numpy(dtype=np.float64))
+                    numeric[column] = cls._sketch(values, n_knots)
+                else:
+                    categories[column] = {str(key): int(value) for key, value in series.value_counts().items()}
+            return cls(rows=int(df.shape[0]), columns=[str(column) for column in df.columns], null_ratio=null_ratio,
+                       numeric=numeric, categories=categories, n_knots=n_knots)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @staticmethod
+    def _sketch(values:np.ndarray, n_knots:int)->dict:
+        count = values.shape[0]
+        if count == 0:
+            return {"count": 0, "min": np.nan, "max": np.nan, "knot_values": np.empty(0), "knot_cdf": np.empty(0)}
+        knot_values = np.unique(values)
+        if knot_values.shape[0] > n_knots:
+            # evenly spaced ranks, the maximum is always a knot
+            ranks = np.linspace(0, count - 1, n_knots).round().astype(np.int64)
+            knot_values = np.unique(values[ranks])
+        # cdf at every knot is exact, only values between two knots are approximated by the lower knot
+        knot_cdf = np.searchsorted(values, knot_values, side="right") / count
+        return {"count": int(count), "min": float(values[0]), "max": float(values[-1]),
+                "knot_values": knot_values, "knot_cdf": knot_cdf}
+
+    def kept_columns(self, missing_threshold:float)->list:
+        # columns which survive the missing value check of the base dataset
+        return [column for column in self.columns if self.null_ratio[column] <= missing_threshold]
+
+    def save(self, file_path:str)->None:
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            arrays = dict()
+            numeric_meta = dict()
+            for index, (column, sketch) in enumerate(self.numeric.items()):
+                arrays[f"knot_values_{index}"] = sketch["knot_values"]
+                arrays[f"knot_cdf_{index}"] = sketch["knot_cdf"]
+                numeric_meta[column] = {"index": index, "count": sketch["count"], "min": sketch["min"],
+                                        "max": sketch["max"]}
+            metadata = {"profile_version": self.PROFILE_VERSION, "rows": self.rows, "columns": self.columns,
+                        "null_ratio": self.null_ratio, "numeric": numeric_meta, "categories": self.categories,
+                        "n_knots": self.n_knots}
+            # metadata is stored as a json string, so loading never needs pickle
+            arrays["metadata"] = np.array(json.dumps(metadata))
+            with open(file_path, "wb") as file_obj:
+                np.savez(file_obj, **arrays)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load(cls, file_path:str):
+        try:
+            with np.load(file_path, allow_pickle=False) as arrays:
+                metadata = json.loads(str(arrays["metadata"]))
+                if metadata["profile_version"] != cls.PROFILE_VERSION:
+                    raise Exception(f"Unsupported profile version {metadata['profile_version']} in {file_path}")
+                numeric = dict()
+                for column, meta in metadata["numeric"].items():
+                    numeric[column] = {"count": meta["count"], "min": meta["min"], "max": meta["max"],
+                                       "knot_values": arrays[f"knot_values_{meta['index']}"],
+                                       "knot_cdf": arrays[f"knot_cdf_{meta['index']}"]}
+            return cls(rows=metadata["rows"], columns=metadata["columns"], null_ratio=metadata["null_ratio"],
+                       numeric=numeric, categories=metadata["categories"], n_knots=metadata["n_knots"])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def ks_2samp_columns(self, current_df:pd.DataFrame, columns:list)->pd.DataFrame:
+        """
+        KS test of the profiled base columns against current_df, missing values are ignored
+        p-values use the asymptotic distribution (what scipy's ks_2samp uses for samples above 10000 rows)
+        ===========================================================================================
+        returns dataframe indexed by column with "statistic" and "pvalue"
+        """
+        try:
+            statistics, base_counts, current_counts = [], [], []
+            for column in columns:
+                current = current_df[column].dropna()
+                if column in self.numeric:
+                    sketch = self.numeric[column]
+                    statistic = self._numeric_statistic(sketch, np.sort(current.to_numpy(dtype=np.float64)))
+                    base_count = sketch["count"]
+                else:
+                    current_categories = current.astype(str).value_counts().to_dict()
+                    statistic = self._category_statistic(self.categories[column], current_categories)
+                    base_count = sum(self.categories[column].values())
+                statistics.append(statistic)
+                base_counts.append(base_count)
+                current_counts.append(current.shape[0])
+            statistics = np.array(statistics, dtype=np.float64)
+            pvalues = ks_pvalues(statistics, np.array(base_counts), np.array(current_counts))
+            return pd.DataFrame({"statistic": statistics, "pvalue": pvalues}, index=columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @staticmethod
+    def _numeric_statistic(sketch:dict, current_sorted:np.ndarray)->float:
+        if sketch["count"] == 0 or current_sorted.shape[0] == 0:
+            return np.nan
+        knot_values, knot_cdf = sketch["knot_values"], sketch["knot_cdf"]
+        points = np.concatenate([knot_values, current_sorted])
+        knot_index = np.searchsorted(knot_values, points, side="right") - 1
+        cdf_base = np.where(knot_index >= 0, knot_cdf[np.maximum(knot_index, 0)], 0.0)
+        cdf_current = np.searchsorted(current_sorted, points, side="right") / current_sorted.shape[0]
+        differences = cdf_base - cdf_current
+        return float(max(differences.max(), np.clip(-differences.min(), 0, 1)))
+
+    @staticmethod
+    def _category_statistic(base_counts:dict, current_counts:dict)->float:
+        # categories are compared in sorted order, as a KS test on the raw strings does
+        categories = sorted(set(base_counts) | set(current_counts))
+        base = np.cumsum([base_counts.get(category, 0) for category in categories], dtype=np.float64)
+        current = np.cumsum([current_counts.get(category, 0) for category in categories], dtype=np.float64)
+        if len(categories) == 0 or base[-1] == 0 or current[-1] == 0:
+            return np.nan
+        differences = base / base[-1] - current / current[-1]
+        return float(max(differences.max(), np.clip(-differences.min(), 0, 1)))
+
+
+class StreamingColumnStats:
+    """
+    One pass statistics of a dataset read chunk by chunk, compared against a ReferenceProfile
+    keeps row and null counts per column, category counts and for every numeric profile column the number of
+    values below and at each profile knot, so memory depends on the number of columns and never on the rows
+    two instances built against the same profile can be merged (e.g. one per file of a partitioned dataset)
+    """
+
+    def __init__(self, profile:ReferenceProfile):
+        self.profile = profile
+        self.rows = 0
+        self.columns = None
+        self.null_counts = dict()
+        self.category_counts = dict()
+        # column -> counts of values x with exactly i knots < x (at_or_below) and i knots <= x (below)
+        self.at_or_below_counts = dict()
+        self.below_counts = dict()
+
+    def update(self, chunk:pd.DataFrame)->None:
+        try:
+            if self.columns is None:
+                self.columns = [str(column) for column in chunk.columns]
+                self.null_counts = {column: 0 for column in self.columns}
+            self.rows += chunk.shape[0]
+            for column, null_count in chunk.isna().sum().items():
+                self.null_counts[column] += int(null_count)
+            for column in self.columns:
+                if column in self.profile.numeric and is_numeric_dtype(chunk[column].dtype):
+                    knot_values = self.profile.numeric[column]["knot_values"]
+                    values = chunk[column].to_numpy(dtype=np.float64)
+                    values = values[~np.isnan(values)]
+                    n_bins = knot_values.shape[0] + 1
+                    knot_index = np.searchsorted(knot_values, values, side="left")
+                    # knots are distinct, so a value equal to its knot has exactly one knot more <= it
+                    is_knot = np.zeros(values.shape[0], dtype=bool)
+                    if n_bins > 1:
+                        is_knot = knot_values[np.minimum(knot_index, n_bins - 2)] == values
+                    at_or_below = np.bincount(knot_index, minlength=n_bins)
+                    below = np.bincount(knot_index + is_knot, minlength=n_bins)
+                    if column in self.at_or_below_counts:
+                        self.at_or_below_counts[column] += at_or_below
+                        self.below_counts[column] += below
+                    else:
+                        self.at_or_below_counts[column] = at_or_below
+                        self.below_counts[column] = below
+                else:
+                    counts = self.category_counts.setdefault(column, dict())
+                    for key, value in chunk[column].dropna().astype(str).value_counts().items():
+                        counts[key] = counts.get(key, 0) + int(value)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def merge(self, other:"StreamingColumnStats")->None:
+        try:
+            if other.columns is None:
+                return
+            if self.columns is None:
+                self.columns = list(other.columns)
+                self.null_counts = {column: 0 for column in self.columns}
+            self.rows += other.rows
+            for column, null_count in other.null_counts.items():
+                self.null_counts[column] = self.null_counts.get(column, 0) + null_count
+            for column, counts in other.category_counts.items():
+                merged = self.category_counts.setdefault(column, dict())
+                for key, value in counts.items():
+                    merged[key] = merged.get(key, 0) + value
+            for column in other.at_or_below_counts:
+                if column in self.at_or_below_counts:
+                    self.at_or_below_counts[column] += other.at_or_below_counts[column]
+                    self.below_counts[column] += other.below_counts[column]
+                else:
+                    self.at_or_below_counts[column] = other.at_or_below_counts[column].copy()
+                    self.below_counts[column] = other.below_counts[column].copy()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def null_ratio(self)->pd.Series:
+        return pd.Series(self.null_counts, dtype=np.float64) / max(self.rows, 1)
+
+    def ks_2samp_columns(self, columns:list)->pd.DataFrame:
+        """
+        KS test of the profiled base columns against the streamed dataset, missing values are ignored
+        gives the same statistic as ReferenceProfile.ks_2samp_columns on the full dataset
+        ===========================================================================================
+        returns dataframe indexed by column with "statistic" and "pvalue"
+        """
+        try:
+            statistics, base_counts, current_counts = [], [], []
+            for column in columns:
+                if column in self.at_or_below_counts:
+                    sketch = self.profile.numeric[column]
+                    statistic, current_count = self._numeric_statistic(sketch, self.at_or_below_counts[column],
+                                                                       self.below_counts[column])
+                    base_count = sketch["count"]
+                else:
+                    category_counts = self.category_counts.get(column, dict())
+                    statistic = ReferenceProfile._category_statistic(self.profile.categories[column], category_counts)
+                    current_count = sum(category_counts.values())
+                    base_count = sum(self.profile.categories[column].values())
+                statistics.append(statistic)
+                base_counts.append(base_count)
+                current_counts.append(current_count)
+            statistics = np.array(statistics, dtype=np.float64)
+            pvalues = ks_pvalues(statistics, np.array(base_counts), np.array(current_counts))
+            return pd.DataFrame({"statistic": statistics, "pvalue": pvalues}, index=columns)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @staticmethod
+    def _numeric_statistic(sketch:dict, at_or_below:np.ndarray, below:np.ndarray):
+        current_count = int(at_or_below.sum())
+        if sketch["count"] == 0 or current_count == 0:
+            return np.nan, current_count
+        knot_cdf = sketch["knot_cdf"]
+        # current cdf at every knot and just below it, the base cdf is constant between two knots
+        cdf_at = np.cumsum(at_or_below)[:-1] / current_count
+        cdf_below = np.cumsum(below)[:-1] / current_count
+        previous_cdf = np.concatenate([[0.0], knot_cdf[:-1]])
+        statistic = max(np.abs(knot_cdf - cdf_at).max(), np.abs(previous_cdf - cdf_below).max())
+        return float(statistic), current_count
@@ -11,19 +11,36 @@ class DataIngestionArtifact:
 @dataclass
 class DataValidationArtifact:
     report_file_path:str
+    # profile of the base dataset the drift report was computed against
+    base_profile_path:str = None
 
 @dataclass    
 class DataTransformationArtifact:
     transform_object_path:str
-    transformed_train_path:str
-    transformed_test_path:str
+    # float32 input features and int8 encoded target of the train and test set
+    transformed_train_x_path:str
+    transformed_train_y_path:str
+    transformed_test_x_path:str
+    transformed_test_y_path:str
     target_encoder_path:str
+    # transformer compiled for inference, None for artifacts created before it existed
+    fused_transform_object_path:str = None
+    # positive class weight for the model when the arrays are not resampled (class_weight strategy)
+    scale_pos_weight:float = None
+    # train arrays before resampling and the resampling.resample parameters applied to them (None when the
+    # strategy does not resample), cross validation resamples the training rows of each fold only
+    unsampled_train_x_path:str = None
+    unsampled_train_y_path:str = None
+    resampling_params:dict = None
 
 @dataclass
 class ModelTrainerArtifact:
     model_path:str
     f1_train_score:float
     f1_test_score:float
+    # mean and standard deviation of the fold validation scores, None without cross validation
+    f1_cv_mean:float=None
+    f1_cv_std:float=None
 
 @dataclass    
 class ModelEvaluationArtifact:
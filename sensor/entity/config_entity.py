@@ -1,6 +1,7 @@
 import os, sys
 from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor import storage
 from datetime import datetime
 
 FILE_NAME = "sensor.csv"
@@ -9,6 +10,10 @@ TEST_FILE_NAME = "test.csv"
 TRANSFORMER_OBJ_FILE_NAME = "transformer.pkl"
 TARGET_ENCODER_OBJ_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+WATERMARK_FILE_NAME = "watermark.yaml"
+BASE_PROFILE_FILE_NAME = "base_profile.npz"
+FUSED_TRANSFORMER_FILE_NAME = "fused_transformer.npz"
+MODEL_BUNDLE_FILE_NAME = "model_bundle.zip"
 
 class TrainingPipelineConfig:
     # whenever we are running this we are creating a new folder each time with timestamp
@@ -16,6 +21,16 @@ class TrainingPipelineConfig:
     def __init__(self):
         try:
             self.artifact_dir = os.path.join(os.getcwd(), "artifact", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}")
+            # keep produced artifacts in memory so later stages do not read them back from disk
+            self.cache_artifacts = True
+            # write artifact files in a background thread while the next stage runs
+            self.background_artifact_writes = False
+            # per stage artifact I/O time breakdown of the run
+            self.io_report_file_path = os.path.join(self.artifact_dir, "io_report.yaml")
+            # reuse stage outputs of earlier runs when inputs, config and code of a stage did not change
+            self.reuse_stage_outputs = True
+            # index of stage fingerprints -> artifacts, shared by all runs
+            self.stage_cache_dir = os.path.join(os.getcwd(), "artifact", "stage_cache")
         except Exception as e:
             raise SensorException(e,sys)
 
@@ -26,11 +41,32 @@ class DataIngestionConfig:
         try:
             self.database_name = "aps"
             self.collection_name = "sensor"
+            # file format of feature store, train and test files: "npy" (float32 matrix + schema), "parquet" or "csv"
+            self.storage_format = "npy"
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir, "data_ingestion")
-            self.feature_store_file_path = os.path.join(self.data_ingestion_dir, "feature_store", FILE_NAME)
-            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset", TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset", TEST_FILE_NAME)
+            self.feature_store_file_path = os.path.join(self.data_ingestion_dir, "feature_store", 
+                                                        storage.get_file_name(FILE_NAME, self.storage_format))
+            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset", 
+                                                storage.get_file_name(TRAIN_FILE_NAME, self.storage_format))
+            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset", 
+                                               storage.get_file_name(TEST_FILE_NAME, self.storage_format))
             self.test_size = 0.2
+            # number of documents fetched from mongodb per round trip
+            self.read_batch_size = 5000
+            # number of _id range partitions read concurrently, 1 reads the collection through a single cursor
+            self.read_workers = 1
+            # "process" pool for real mongodb, "thread" pool shares the client (e.g. a mongomock stand-in)
+            self.read_executor = "process"
+            # "full" re-exports the whole collection every run, "incremental" only fetches documents newer than the 
+            # stored watermark and appends them to the persistent feature store below
+            self.ingestion_mode = "full"
+            # persistent feature store lives outside the timestamped artifact dir so it outlives every run
+            self.persistent_feature_store_dir = os.path.join(os.getcwd(), "feature_store", self.collection_name)
+            # high-water mark (last ingested _id) of the persistent feature store
+            self.watermark_file_path = os.path.join(self.persistent_feature_store_dir, WATERMARK_FILE_NAME)
+            # only documents whose _id is older than this are ingested: ObjectIds are made by the clients and an
+            # insert can commit after a newer _id was read, the lag has to cover commit delay and client clock skew
+            self.ingestion_lag_seconds = 300
         except Exception as e:
             raise SensorException(e,sys)
 
@@ -49,6 +85,22 @@ class DataValidationConfig:
         self.report_file_path = os.path.join(self.data_validation_dir, "report.yaml") 
         self.missing_threshold:float = 0.2
         self.base_file_path = os.path.join("aps_failure_training_set1.csv")
+        # number of processes the drift (KS test) column blocks are spread over
+        self.drift_workers = os.cpu_count() or 1
+        # "omit" ignores missing values in the drift test, "propagate" reports columns with missing values as drifted
+        self.drift_nan_policy = "omit"
+        # compact statistics of the base dataset, built from base_file_path once and then versioned with the model
+        self.use_base_profile = True
+        self.base_profile_file_path = os.path.join(self.data_validation_dir, "profile", BASE_PROFILE_FILE_NAME)
+        # number of (value, cdf) points kept per numeric column, columns with fewer distinct values are kept exact
+        self.base_profile_knots = 4096
+        # build the profile from base_file_path again instead of reusing the one of the latest saved model
+        self.rebuild_base_profile = False
+        self.saved_models_dir = os.path.join("saved_models")
+        # "in_memory" loads train/test at once, "streaming" reads them in chunks of validation_chunk_size rows
+        # and keeps only per column counts (always validated against the base dataset profile)
+        self.validation_mode = "in_memory"
+        self.validation_chunk_size = 50000
         
 class DataTransformationConfig:
 
@@ -57,10 +109,24 @@ class DataTransformationConfig:
         self.data_transformation_dir = os.path.join(training_pipeline_config.artifact_dir, "data_transformation")
         # storing data transformation object for future use in prediction pipelines
         self.transform_object_path = os.path.join(self.data_transformation_dir, "transformer", TRANSFORMER_OBJ_FILE_NAME)
-        self.transformed_train_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace("csv", "npz"))
-        self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME.replace("csv", "npz"))
+        # same transformer compiled into a single float32 kernel for inference
+        self.fused_transform_object_path = os.path.join(self.data_transformation_dir, "transformer", FUSED_TRANSFORMER_FILE_NAME)
+        # input features (contiguous float32) and encoded target (int8) are saved as separate .npy files
+        self.transformed_train_x_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace(".csv", "_x.npy"))
+        self.transformed_train_y_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace(".csv", "_y.npy"))
+        self.transformed_test_x_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME.replace(".csv", "_x.npy"))
+        self.transformed_test_y_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME.replace(".csv", "_y.npy"))
+        # train arrays before resampling, cross validation resamples the training rows of every fold on its own
+        self.unsampled_train_x_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace(".csv", "_unsampled_x.npy"))
+        self.unsampled_train_y_path = os.path.join(self.data_transformation_dir, "transformed", TRAIN_FILE_NAME.replace(".csv", "_unsampled_y.npy"))
         # file for target encoding
         self.target_encoder_path = os.path.join(self.data_transformation_dir, "target_encoder", TARGET_ENCODER_OBJ_FILE_NAME)
+        # class imbalance handling, one of sensor.resampling.RESAMPLING_STRATEGIES
+        self.resampling_strategy = "smote_tomek"
+        # threads of the nearest neighbour searches, rows per chunk of the chunked_smote strategy
+        self.resampling_n_jobs = os.cpu_count() or 1
+        self.resampling_chunk_size = 20000
+        self.resampling_random_state = None
 
 class ModelTrainerConfig:
 
@@ -70,12 +136,53 @@ class ModelTrainerConfig:
         self.model_path = os.path.join(self.model_trainer_dir, "model", MODEL_FILE_NAME)
         self.expected_score = 0.7
         self.overfitting_threshold = 0.1
+        # successive halving search of the xgboost parameters before the final fit (ModelTrainer.fine_tune)
+        self.fine_tune = False
+        self.tuning_trials = 27
+        self.tuning_min_estimators = 50
+        self.tuning_max_estimators = 450
+        # share of parameter sets kept per round is 1/tuning_eta, the budget grows by tuning_eta
+        self.tuning_eta = 3
+        # processes running trials, threads per trial are the cores divided by the workers
+        self.tuning_workers = os.cpu_count() or 1
+        self.tuning_validation_size = 0.2
+        self.tuning_early_stopping_rounds = 20
+        # seed of the validation split, trials are only reused from earlier runs with the same seed (not with None)
+        self.tuning_random_state = None
+        # trials of all runs, used to skip known trials and to seed the next search
+        self.tuning_trials_file_path = os.path.join(os.getcwd(), "artifact", "tuning", "trials.yaml")
+        # "default" fits XGBClassifier on the arrays, "quantile" and "external_memory" train a hist booster on
+        # quantized matrices (see sensor.xgb_training)
+        self.training_mode = "default"
+        # threads used by xgboost, None lets xgboost use every core
+        self.xgb_nthread = os.cpu_count() or 1
+        self.max_bin = 256
+        self.external_memory_chunk_rows = 100000
+        # external memory pages of the quantized matrices, one directory per data hash, shared by all runs
+        self.dmatrix_cache_dir = os.path.join(os.getcwd(), "artifact", "dmatrix_cache")
+        # stratified k-fold cross validation of the train array (sensor.cross_validation), 0 trains on the single
+        # train/test split only. With folds the accept/overfit gates use the mean fold scores
+        self.cv_folds = 0
+        # processes training folds, threads per fold are the cores divided by the workers
+        self.cv_workers = os.cpu_count() or 1
+        # True saves the average of the fold models as the model instead of refitting on the whole train array
+        self.cv_ensemble = False
+        self.cv_random_state = None
 
 class ModelEvaluationConfig:
 
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
         # if train model is performing better by 1%, then we can accept it
         self.change_threshold = 0.01
+        # transform the test set with the compiled float32 transformers instead of the sklearn pipelines
+        self.use_fused_transformer = False
+        # number of latest saved versions scored as champions (the current version is always one), None scores every
+        # saved version
+        self.champion_versions = 1
+        # threads loading and scoring the candidate models
+        self.evaluation_workers = os.cpu_count() or 1
+        # scores of every version per test set of all runs, versions are never scored twice on the same test set
+        self.score_cache_file_path = os.path.join(os.getcwd(), "artifact", "evaluation", "scores.yaml")
 
 class ModelPusherConfig:
 
@@ -88,4 +195,28 @@ class ModelPusherConfig:
         # above file path is artifact/model_pusher/saved_models
         self.pusher_model_path = os.path.join(self.pusher_model_dir, MODEL_FILE_NAME)
         self.pusher_transformer_path = os.path.join(self.pusher_model_dir, TRANSFORMER_OBJ_FILE_NAME)
-        self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir, TARGET_ENCODER_OBJ_FILE_NAME)
\ No newline at end of file
+        self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir, TARGET_ENCODER_OBJ_FILE_NAME)
+        self.pusher_base_profile_path = os.path.join(self.pusher_model_dir, BASE_PROFILE_FILE_NAME)
+        self.pusher_fused_transformer_path = os.path.join(self.pusher_model_dir, FUSED_TRANSFORMER_FILE_NAME)
+        # model, fused transformer and label mapping in one file, read by ModelResolver.load_artifacts without dill
+        self.pusher_model_bundle_path = os.path.join(self.pusher_model_dir, MODEL_BUNDLE_FILE_NAME)
+
+
+class ScoringServiceConfig:
+
+    def __init__(self):
+        # resident http scoring service of the latest saved model (sensor.scoring_service)
+        self.model_registry = "saved_models"
+        self.host = "0.0.0.0"
+        self.port = 8000
+        # single row requests are coalesced into batches of at most max_batch_size rows, the first row of a
+        # batch waits at most max_wait_ms for more rows
+        self.max_batch_size = 64
+        self.max_wait_ms = 2.0
+        self.use_fused_transformer = False
+        # saved_models is checked for a new version at most this often, new versions are loaded in the background
+        self.refresh_seconds = 30.0
+        # requests the latency percentiles and throughput are computed over
+        self.metrics_window = 10000
+        # records with fewer schema fields are rejected with a 400 instead of being scored on imputed values
+        self.min_fields = 1
@@ -0,0 +1,134 @@
+# champion/challenger scoring of model versions on one test set
+# candidates are grouped by the fingerprint (content hash) of their transformer: the test file is read once with
+# the columns of every transformer, and each distinct transformer transforms it once, whatever the number of
+# versions sharing it. Models are loaded and scored concurrently in threads (xgboost predicts without the GIL).
+# Scores are stored in a yaml file keyed by the content hashes of model, transformer, target encoder and test
+# file, so a version already scored on the same test set is never scored again.
+
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from sklearn.metrics import f1_score
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.artifact_cache import artifact_cache
+from sensor.config import TARGET_COLUMN
+from sensor.fused_transformer import load_fused_transformer
+from sensor.predictor import ModelResolver
+from sensor import storage, utils
+
+
+@dataclass
+class Candidate:
+    name:str
+    model_path:str
+    transformer_path:str
+    target_encoder_path:str
+    fused_transformer_path:Optional[str] = None
+
+    @classmethod
+    def from_version_dir(cls, model_resolver:ModelResolver, dir_path:str):
+        # model, transformer and target encoder of a saved_models/<version> directory
+        paths = model_resolver.get_version_paths(dir_path)
+        return cls(name=os.path.basename(dir_path), model_path=paths["model"], transformer_path=paths["transformer"],
+                   target_encoder_path=paths["target_encoder"], fused_transformer_path=paths["fused_transformer"])
+
+
+class ScoreCache:
+    # score per candidate and test set fingerprint, persisted in a yaml file (written to a temp file then renamed)
+
+    def __init__(self, file_path:Optional[str]=None):
+        self.file_path = file_path
+        self.scores = dict()
+        if file_path is not None and os.path.exists(file_path):
+            self.scores = utils.read_yaml_file(file_path) or dict()
+
+    def get(self, key:str)->Optional[float]:
+        return self.scores.get(key)
+
+    def update(self, scores:dict)->None:
+        self.scores.update(scores)
+        if self.file_path is None:
+            return
+        utils.write_yaml_file(file_path=f"{self.file_path}.tmp", data=self.scores)
+        os.replace(f"{self.file_path}.tmp", self.file_path)
+
+
+class EvaluationEngine:
+
+    def __init__(self, test_file_path:str, score_cache_file_path:Optional[str]=None, n_workers:int=1,
+                 use_fused_transformer:bool=False):
+        self.test_file_path = test_file_path
+        self.score_cache = ScoreCache(file_path=score_cache_file_path)
+        self.n_workers = max(1, n_workers)
+        self.use_fused_transformer = use_fused_transformer
+
+    def _transformer_kind(self)->str:
+        return "fused" if self.use_fused_transformer else "pipeline"
+
+    def _transformer_fingerprint(self, candidate:Candidate)->str:
+        return f"{self._transformer_kind()}:{artifact_cache.get_content_hash(candidate.transformer_path)}"
+
+    def _score_key(self, candidate:Candidate, test_hash:str)->str:
+        return ":".join([artifact_cache.get_content_hash(candidate.model_path), self._transformer_fingerprint(candidate),
+                         artifact_cache.get_content_hash(candidate.target_encoder_path), test_hash])
+
+    def _load_transformer(self, candidate:Candidate):
+        if self.use_fused_transformer:
+            return load_fused_transformer(file_path=candidate.fused_transformer_path,
+                                          transformer_path=candidate.transformer_path)
+        return utils.load_object(file_path=candidate.transformer_path)
+
+    def score(self, candidates:list)->dict:
+        """
+        candidates: list of Candidate, names must be unique
+        ===================================================
+        returns {candidate name: f1 score on the test set}
+        """
+        try:
+            test_hash = artifact_cache.get_content_hash(self.test_file_path)
+            keys = {candidate.name: self._score_key(candidate, test_hash) for candidate in candidates}
+            scores = {candidate.name: self.score_cache.get(keys[candidate.name]) for candidate in candidates}
+            pending = [candidate for candidate in candidates if scores[candidate.name] is None]
+            logging.info(f"Scoring {len(pending)} of {len(candidates)} candidates, "
+                         f"{len(candidates) - len(pending)} scores known from earlier runs")
+            if len(pending) == 0:
+                return scores
+
+            # one transformer and one target encoder per distinct file
+            transformers, encoders = dict(), dict()
+            for candidate in pending:
+                transformers.setdefault(self._transformer_fingerprint(candidate), candidate)
+                encoders.setdefault(artifact_cache.get_content_hash(candidate.target_encoder_path), candidate)
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                loaded_transformers = dict(zip(transformers, executor.map(self._load_transformer, transformers.values())))
+                loaded_encoders = dict(zip(encoders, executor.map(
+                    lambda candidate: utils.load_object(file_path=candidate.target_encoder_path), encoders.values())))
+
+                # the test file is read once, with the columns of every transformer
+                columns = list(dict.fromkeys([name for transformer in loaded_transformers.values()
+                                              for name in transformer.feature_names_in_] + [TARGET_COLUMN]))
+                test_df = storage.load_dataframe(self.test_file_path, columns=columns)
+                logging.info(f"Transforming the test set with {len(loaded_transformers)} distinct transformers")
+                transformed = dict(zip(loaded_transformers, executor.map(
+                    lambda transformer: transformer.transform(test_df[list(transformer.feature_names_in_)]),
+                    loaded_transformers.values())))
+                y_true = {fingerprint: encoder.transform(test_df[TARGET_COLUMN])
+                          for fingerprint, encoder in loaded_encoders.items()}
+
+                def score_candidate(candidate:Candidate)->float:
+                    model = utils.load_object(file_path=candidate.model_path)
+                    y_pred = model.predict(transformed[self._transformer_fingerprint(candidate)])
+                    return float(f1_score(y_true=y_true[artifact_cache.get_content_hash(candidate.target_encoder_path)],
+                                          y_pred=np.asarray(y_pred)))
+
+                new_scores = dict(zip([candidate.name for candidate in pending], executor.map(score_candidate, pending)))
+            for name, score in new_scores.items():
+                logging.info(f"Score of {name}: {score}")
+            scores.update(new_scores)
+            self.score_cache.update({keys[name]: score for name, score in new_scores.items()})
+            return scores
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,140 @@
+# fitted imputer + robust scaler pipeline compiled into a single float32 kernel for inference
+# the sklearn pipeline validates its input, converts it to float64 and copies it once per step. The fused
+# transformer keeps only the fitted parameters (fill value, center and 1/scale per column) and applies
+# NaN -> fill, then (x - center) * inv_scale in place on one contiguous float32 array.
+# xgboost works on float32 features anyway, so the result is the same up to float32 rounding.
+
+import os, sys
+import json
+import numpy as np
+import pandas as pd
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.artifact_cache import artifact_cache
+from sensor.utils import load_object
+from sensor.schema import FEATURE_DTYPE
+
+# rows processed per block, keeps the temporary NaN mask small and in cache
+BLOCK_ROWS = 4096
+
+
+class FusedTransformer:
+
+    def __init__(self, feature_names_in:list, feature_names_out:list, fill_value:np.ndarray, center:np.ndarray,
+                 inv_scale:np.ndarray):
+        # same attribute as the sklearn pipeline, so callers select the input columns the same way
+        self.feature_names_in_ = np.array(feature_names_in, dtype=object)
+        # columns without any observed value while fitting are dropped by the imputer
+        self.feature_names_out_ = np.array(feature_names_out, dtype=object)
+        self.fill_value = np.asarray(fill_value, dtype=FEATURE_DTYPE)
+        self.center = np.asarray(center, dtype=FEATURE_DTYPE)
+        self.inv_scale = np.asarray(inv_scale, dtype=FEATURE_DTYPE)
+        # value a missing reading ends up with after scaling
+        self.scaled_fill_value = (self.fill_value - self.center) * self.inv_scale
+        input_index = {name: index for index, name in enumerate(feature_names_in)}
+        self.output_index = np.array([input_index[name] for name in feature_names_out], dtype=np.int64)
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """
+        Compiles a fitted Pipeline of SimpleImputer(strategy="constant") and RobustScaler
+        """
+        try:
+            # sklearn is only needed to compile, loading and transforming run on numpy alone
+            from sklearn.impute import SimpleImputer
+            from sklearn.preprocessing import RobustScaler
+            if len(pipeline.steps) != 2:
+                raise Exception(f"Expected imputer and scaler steps, got {[name for name, _ in pipeline.steps]}")
+            imputer, scaler = pipeline.steps[0][1], pipeline.steps[1][1]
+            if not isinstance(imputer, SimpleImputer) or imputer.strategy != "constant":
+                raise Exception(f"Only SimpleImputer(strategy='constant') can be fused, got {imputer}")
+            if not isinstance(scaler, RobustScaler):
+                raise Exception(f"Only RobustScaler can be fused, got {scaler}")
+            feature_names_in = [str(name) for name in pipeline.feature_names_in_]
+            feature_names_out = [str(name) for name in imputer.get_feature_names_out()]
+            n_features = len(feature_names_out)
+            fill_value = np.full(n_features, float(imputer.fill_value if imputer.fill_value is not None else 0))
+            center = scaler.center_ if scaler.with_centering else np.zeros(n_features)
+            scale = scaler.scale_ if scaler.with_scaling else np.ones(n_features)
+            return cls(feature_names_in=feature_names_in, feature_names_out=feature_names_out, fill_value=fill_value,
+                       center=center, inv_scale=1.0 / np.asarray(scale, dtype=np.float64))
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def transform(self, X, copy:bool=True)->np.ndarray:
+        """
+        X: pd.DataFrame with the feature_names_in_ columns, or an array with the same columns
+        copy: False transforms a C-contiguous float32 array holding exactly the output columns in place
+        =========================================================================================
+        returns float32 array with the feature_names_out_ columns
+        """
+        try:
+            if isinstance(X, pd.DataFrame):
+                # one copy into the working array, only the columns kept by the imputer are read
+                arr = np.array(X[list(self.feature_names_out_)], dtype=FEATURE_DTYPE, order="C")
+            else:
+                arr = np.asarray(X)
+                if arr.ndim != 2:
+                    raise Exception(f"Expected a 2d array, got shape {arr.shape}")
+                if arr.shape[1] == self.feature_names_in_.shape[0] and arr.shape[1] != self.output_index.shape[0]:
+                    arr = arr[:, self.output_index]
+                elif arr.shape[1] != self.output_index.shape[0]:
+                    raise Exception(f"Expected {self.feature_names_in_.shape[0]} columns, got {arr.shape[1]}")
+                in_place = (not copy and arr.dtype == FEATURE_DTYPE and arr.flags.c_contiguous
+                            and arr.flags.writeable)
+                if not in_place:
+                    arr = np.array(arr, dtype=FEATURE_DTYPE, order="C")
+            for start in range(0, arr.shape[0], BLOCK_ROWS):
+                block = arr[start:start + BLOCK_ROWS]
+                missing = np.isnan(block)
+                block -= self.center
+                block *= self.inv_scale
+                np.copyto(block, self.scaled_fill_value, where=missing)
+            return arr
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def save(self, file_path:str)->None:
+        # pickle free npz with the column names as json
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            columns = {"feature_names_in": list(self.feature_names_in_), "feature_names_out": list(self.feature_names_out_)}
+            with open(file_path, "wb") as file_obj:
+                np.savez(file_obj, columns=np.array(json.dumps(columns)), fill_value=self.fill_value,
+                         center=self.center, inv_scale=self.inv_scale)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load(cls, file_path:str):
+        try:
+            with np.load(file_path, allow_pickle=False) as arrays:
+                columns = json.loads(str(arrays["columns"]))
+                return cls(feature_names_in=columns["feature_names_in"], feature_names_out=columns["feature_names_out"],
+                           fill_value=arrays["fill_value"], center=arrays["center"], inv_scale=arrays["inv_scale"])
+        except Exception as e:
+            raise SensorException(e, sys)
+
+
+def save_fused_transformer(file_path:str, transformer:FusedTransformer)->None:
+    try:
+        artifact_cache.put(file_path, transformer, writer=lambda path, obj: obj.save(path))
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_fused_transformer(file_path:str, transformer_path:str=None)->FusedTransformer:
+    """
+    Loads a fused transformer saved next to the pickled pipeline
+    file_path: location of the fused transformer, may be None or missing for models saved before it existed
+    transformer_path: pickled pipeline compiled on the fly when there is no fused transformer file
+    """
+    try:
+        if file_path is not None and os.path.exists(file_path):
+            return artifact_cache.get(file_path, loader=FusedTransformer.load)
+        if transformer_path is None:
+            raise Exception(f"Fused transformer {file_path} is not available")
+        logging.info(f"Compiling fused transformer from {transformer_path}")
+        return FusedTransformer.from_pipeline(load_object(file_path=transformer_path))
+    except Exception as e:
+        raise SensorException(e, sys)
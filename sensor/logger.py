@@ -8,14 +8,20 @@ LOG_FILE_NAME = f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.log"
 # LOG file directory
 LOG_FILE_DIR = os.path.join(os.getcwd(), "logs")
 
-#create folder if not available
-os.makedirs(LOG_FILE_DIR, exist_ok = True)
-
 # log file path
 LOG_FILE_PATH = os.path.join(LOG_FILE_DIR, LOG_FILE_NAME)
 
+
+class LazyFileHandler(logging.FileHandler):
+    # the log folder and file are created with the first record, importing sensor leaves no empty log behind
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 logging.basicConfig(
-    filename=LOG_FILE_PATH,
+    handlers=[LazyFileHandler(LOG_FILE_PATH, delay=True)],
     format = "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s",
     level = logging.INFO,
 )
\ No newline at end of file
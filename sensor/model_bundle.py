@@ -0,0 +1,103 @@
+# single file bundle of a saved model version, loaded without dill
+# the bundle is an uncompressed zip holding:
+#   bundle.json         -> format version, label classes, transformer column names, number of boosters
+#   booster_<i>.ubj     -> xgboost boosters in the native UBJSON format (one, or one per fold of a fold ensemble)
+#   transformer/*.npy   -> fill value, center and 1/scale of the fused float32 transformer
+# loading reads one file, parses the boosters natively and maps the arrays, instead of three file opens plus
+# the dill deserialization of the XGBClassifier wrapper, the sklearn pipeline and the LabelEncoder.
+# xgboost and the model classes are imported by the functions that need them, importing this module is cheap.
+
+import os, sys
+import json
+import zipfile
+import numpy as np
+from sensor.exception import SensorException
+from sensor.fused_transformer import FusedTransformer
+
+BUNDLE_FORMAT = 1
+TRANSFORMER_ARRAYS = ["fill_value", "center", "inv_scale"]
+
+
+class LabelMapping:
+    # LabelEncoder api over the class labels stored in the bundle
+
+    def __init__(self, classes:list):
+        self.classes_ = np.array(classes, dtype=object)
+
+    def transform(self, y)->np.ndarray:
+        index = {label: code for code, label in enumerate(self.classes_)}
+        return np.array([index[label] for label in y], dtype=np.int64)
+
+    def inverse_transform(self, y)->np.ndarray:
+        return self.classes_[np.asarray(y, dtype=np.int64)]
+
+
+def _get_boosters(model)->list:
+    import xgboost as xgb
+    from sensor.xgb_training import BoosterClassifier
+    from sensor.cross_validation import FoldEnsembleClassifier
+    if isinstance(model, xgb.XGBClassifier):
+        return [model.get_booster()]
+    if isinstance(model, BoosterClassifier):
+        return [model.booster]
+    if isinstance(model, FoldEnsembleClassifier):
+        return [booster for fold_model in model.models for booster in _get_boosters(fold_model)]
+    raise Exception(f"Model of type {type(model).__name__} can not be bundled")
+
+
+def save_model_bundle(file_path:str, model, transformer:FusedTransformer, target_encoder)->None:
+    """
+    file_path: location of the bundle
+    model: XGBClassifier, BoosterClassifier or FoldEnsembleClassifier
+    transformer: fused transformer of the version
+    target_encoder: fitted LabelEncoder
+    """
+    try:
+        from sensor.cross_validation import FoldEnsembleClassifier
+        boosters = _get_boosters(model)
+        metadata = {"format": BUNDLE_FORMAT, "classes": [str(label) for label in target_encoder.classes_],
+                    "feature_names_in": list(transformer.feature_names_in_),
+                    "feature_names_out": list(transformer.feature_names_out_),
+                    "n_boosters": len(boosters), "ensemble": isinstance(model, FoldEnsembleClassifier)}
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with zipfile.ZipFile(file_path, "w", compression=zipfile.ZIP_STORED) as bundle:
+            bundle.writestr("bundle.json", json.dumps(metadata))
+            for index, booster in enumerate(boosters):
+                bundle.writestr(f"booster_{index}.ubj", bytes(booster.save_raw(raw_format="ubj")))
+            for name in TRANSFORMER_ARRAYS:
+                with bundle.open(f"transformer/{name}.npy", "w") as array_file:
+                    np.lib.format.write_array(array_file, getattr(transformer, name), allow_pickle=False)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_model_bundle(file_path:str, nthread:int=None)->tuple:
+    """
+    Loads a bundle saved by save_model_bundle
+    nthread: threads of the boosters, None lets xgboost use every core
+    ===================================================================
+    returns transformer (FusedTransformer), model (predict api of XGBClassifier), target encoder (LabelMapping)
+    """
+    try:
+        import xgboost as xgb
+        from sensor.xgb_training import BoosterClassifier
+        from sensor.cross_validation import FoldEnsembleClassifier
+        with zipfile.ZipFile(file_path, "r") as bundle:
+            metadata = json.loads(bundle.read("bundle.json"))
+            if metadata["format"] > BUNDLE_FORMAT:
+                raise Exception(f"Bundle format {metadata['format']} of {file_path} is newer than {BUNDLE_FORMAT}")
+            models = []
+            for index in range(metadata["n_boosters"]):
+                booster = xgb.Booster()
+                booster.load_model(bytearray(bundle.read(f"booster_{index}.ubj")))
+                models.append(BoosterClassifier(booster=booster, nthread=nthread))
+            arrays = dict()
+            for name in TRANSFORMER_ARRAYS:
+                with bundle.open(f"transformer/{name}.npy") as array_file:
+                    arrays[name] = np.lib.format.read_array(array_file, allow_pickle=False)
+        transformer = FusedTransformer(feature_names_in=metadata["feature_names_in"],
+                                       feature_names_out=metadata["feature_names_out"], **arrays)
+        model = FoldEnsembleClassifier(models=models) if metadata["ensemble"] else models[0]
+        return transformer, model, LabelMapping(classes=metadata["classes"])
+    except Exception as e:
+        raise SensorException(e, sys)
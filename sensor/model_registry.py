@@ -0,0 +1,150 @@
+# versioned model registry (saved_models) backed by a manifest file
+# saved_models/registry.json holds {"format": 1, "versions": [0, 1, ...], "current": 1}. The latest version is one
+# read of this small file (cached per process until the file changes) instead of listing and parsing every
+# directory. A version is published by writing its files into a hidden staging directory, then, under an
+# exclusive file lock, renaming it to the next version number and swapping the manifest with os.replace:
+# concurrent publishers never get the same number and readers never see a half written version.
+# registries written before the manifest are indexed from their numeric directories, other entries are ignored.
+
+import os, sys
+import json
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+MANIFEST_FILE_NAME = "registry.json"
+LOCK_FILE_NAME = ".registry.lock"
+STAGING_DIR_PREFIX = ".staging-"
+MANIFEST_FORMAT = 1
+
+# registry dir -> (manifest file signature, manifest), one stat per lookup while the manifest is unchanged
+_manifest_cache = dict()
+_manifest_cache_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(lock_file_path:str):
+    # exclusive lock held across processes, fcntl on posix and msvcrt on windows
+    with open(lock_file_path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class ModelRegistry:
+
+    def __init__(self, registry_dir:str="saved_models"):
+        self.registry_dir = registry_dir
+        os.makedirs(self.registry_dir, exist_ok=True)
+        self.manifest_file_path = os.path.join(self.registry_dir, MANIFEST_FILE_NAME)
+        self.lock_file_path = os.path.join(self.registry_dir, LOCK_FILE_NAME)
+
+    def _scan_versions(self)->list:
+        # numeric directories of a registry without manifest, stray files and directories are skipped
+        versions = []
+        for name in os.listdir(self.registry_dir):
+            if name.isdigit() and os.path.isdir(os.path.join(self.registry_dir, name)):
+                versions.append(int(name))
+        return sorted(versions)
+
+    def read_manifest(self)->dict:
+        try:
+            key = os.path.abspath(self.registry_dir)
+            try:
+                stat = os.stat(self.manifest_file_path)
+            except FileNotFoundError:
+                versions = self._scan_versions()
+                return {"format": MANIFEST_FORMAT, "versions": versions,
+                        "current": versions[-1] if len(versions) > 0 else None}
+            signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            with _manifest_cache_lock:
+                cached = _manifest_cache.get(key)
+                if cached is not None and cached[0] == signature:
+                    return cached[1]
+            with open(self.manifest_file_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            with _manifest_cache_lock:
+                _manifest_cache[key] = (signature, manifest)
+            return manifest
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def _write_manifest(self, manifest:dict)->None:
+        # written next to the manifest and renamed over it, readers see the old or the new manifest
+        file_descriptor, tmp_file_path = tempfile.mkstemp(prefix=f"{MANIFEST_FILE_NAME}.", dir=self.registry_dir)
+        with os.fdopen(file_descriptor, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(tmp_file_path, self.manifest_file_path)
+
+    def get_versions(self)->list:
+        return list(self.read_manifest()["versions"])
+
+    def get_current_version(self)->Optional[int]:
+        return self.read_manifest()["current"]
+
+    def get_version_dir(self, version:int)->str:
+        return os.path.join(self.registry_dir, f"{version}")
+
+    def get_next_version(self)->int:
+        # above every version of the manifest and every numeric directory, also the ones of older pushers
+        versions = self.get_versions() + self._scan_versions()
+        return max(versions) + 1 if len(versions) > 0 else 0
+
+    def create_staging_dir(self)->str:
+        # hidden directory inside the registry, so publishing is a rename on the same file system
+        return tempfile.mkdtemp(prefix=STAGING_DIR_PREFIX, dir=self.registry_dir)
+
+    def discard_staging_dir(self, staging_dir:str)->None:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def publish(self, staging_dir:str, make_current:bool=True)->str:
+        """
+        Moves a fully written staging directory to the next version and records it in the manifest
+        staging_dir: directory made by create_staging_dir
+        make_current: point the manifest at the new version
+        ===========================================================
+        returns the version directory
+        """
+        try:
+            with _file_lock(self.lock_file_path):
+                manifest = self.read_manifest()
+                version = self.get_next_version()
+                version_dir = self.get_version_dir(version)
+                os.rename(staging_dir, version_dir)
+                manifest = {"format": MANIFEST_FORMAT, "versions": sorted(set(manifest["versions"]) | {version}),
+                            "current": version if make_current else manifest["current"]}
+                self._write_manifest(manifest)
+            logging.info(f"Published {version_dir}")
+            return version_dir
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def set_current_version(self, version:int)->None:
+        # points the registry at an already published version (rollback)
+        try:
+            with _file_lock(self.lock_file_path):
+                manifest = self.read_manifest()
+                if version not in manifest["versions"]:
+                    raise Exception(f"Version {version} is not in {self.registry_dir}")
+                self._write_manifest(dict(manifest, current=version))
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -4,47 +4,264 @@ import numpy as np
 from sensor.logger import logging
 from sensor.exception import SensorException
 from sensor.predictor import ModelResolver
-from sensor.utils import load_object
+from sensor import schema
+import glob
+import json
+import tempfile
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from sensor.artifact_cache import file_hash
 PREDICTION_DIR = "prediction"
+# content hash -> model version and prediction file of every input scored by start_multi_file_batch_prediction
+SCORED_INDEX_FILE_NAME = "scored_files.json"
+RUN_MANIFEST_FILE_NAME = "manifest.json"
+# chunks buffered between the read, compute and write stages of the streaming mode
+STREAMING_QUEUE_CHUNKS = 2
+_END_OF_STREAM = object()
 
 
+def predict_dataframe(df:pd.DataFrame, artifacts)->pd.DataFrame:
+    # input dataframe with the numerical prediction and the categorical label appended
+    input_arr = artifacts.transformer.transform(df[list(artifacts.transformer.feature_names_in_)])
+    prediction = artifacts.model.predict(input_arr)
+    categorical_prediction = artifacts.target_encoder.inverse_transform(prediction)
+    predictions = pd.DataFrame({"prediction": prediction, "categorical_prediction": categorical_prediction},
+                               index=df.index)
+    return pd.concat([df, predictions], axis=1)
 
-def start_batch_prediction(input_file_path):
+
+def _put(stage_queue:queue.Queue, item, stop:threading.Event)->bool:
+    # blocks while the next stage is behind, gives up once another stage failed
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def stream_batch_prediction(input_file_path:str, prediction_file_path:str, artifacts, chunk_size:int=50000)->int:
+    """
+    Predicts a csv file chunk by chunk, memory stays bounded by a few chunks whatever the file size
+    the reader thread parses the next chunks and the writer thread appends the previous ones while the calling
+    thread transforms and predicts the current chunk
+    =========================================================================================
+    returns number of predicted rows
+    """
+    read_queue = queue.Queue(maxsize=STREAMING_QUEUE_CHUNKS)
+    write_queue = queue.Queue(maxsize=STREAMING_QUEUE_CHUNKS)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            for chunk in schema.read_prediction_csv(input_file_path, chunksize=chunk_size):
+                if not _put(read_queue, chunk, stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        _put(read_queue, _END_OF_STREAM, stop)
+
+    def write():
+        try:
+            header = True
+            while not stop.is_set():
+                try:
+                    chunk = write_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if chunk is _END_OF_STREAM:
+                    return
+                chunk.to_csv(prediction_file_path, mode="w" if header else "a", index=False, header=header)
+                header = False
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    reader = threading.Thread(target=read, daemon=True)
+    writer = threading.Thread(target=write, daemon=True)
+    reader.start()
+    writer.start()
+    rows = 0
+    try:
+        while not stop.is_set():
+            try:
+                chunk = read_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is _END_OF_STREAM:
+                break
+            rows += chunk.shape[0]
+            if not _put(write_queue, predict_dataframe(chunk, artifacts), stop):
+                break
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    _put(write_queue, _END_OF_STREAM, stop)
+    writer.join()
+    stop.set()
+    reader.join()
+    if len(errors) > 0:
+        raise errors[0]
+    logging.info(f"Predicted {rows} rows of {input_file_path} in chunks of {chunk_size} rows")
+    return rows
+
+
+def start_batch_prediction(input_file_path, use_fused_transformer:bool=False, chunk_size:int=None):
+    # use_fused_transformer: transform with the compiled float32 kernel instead of the sklearn pipeline
+    # chunk_size: rows per chunk of the streaming mode, None reads and predicts the whole file at once
     try:
         os.makedirs(PREDICTION_DIR, exist_ok=True)
         logging.info(f"Creating model resolver object")
         # creating model_resolver object by passing saved_models because we have saved our model there
         model_resolver = ModelResolver(model_registry="saved_models")
-        logging.info(f"Reading file: {input_file_path}")
-        df = pd.read_csv(input_file_path)
-        df.replace({"na":np.NAN}, inplace=True)
-
-        logging.info(f"Loading transformer to transform input dataset")
-        transformer = load_object(file_path=model_resolver.get_latest_transformer_path())
 
-        # getting feature names
-        input_feature_names = list(transformer.feature_names_in_)
-        input_arr = transformer.transform(df[input_feature_names])
+        # getting location to save our predictions --> prediction/{input_file_name}{timestamp}.csv
+        prediction_file_name = os.path.basename(input_file_path).replace(".csv", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.csv")
+        prediction_file_path = os.path.join(PREDICTION_DIR, prediction_file_name)
 
-        logging.info(f"Loading model to make prediction")
-        model = load_object(file_path=model_resolver.get_latest_model_path())
-        prediction = model.predict(input_arr)
+        if chunk_size is not None:
+            artifacts = model_resolver.load_artifacts(use_fused_transformer=use_fused_transformer)
+            stream_batch_prediction(input_file_path=input_file_path, prediction_file_path=prediction_file_path,
+                                    artifacts=artifacts, chunk_size=chunk_size)
+            return prediction_file_path
 
-        logging.info(f"Loading target encoder to convert our predicted column to categorical")
-        target_encoder = load_object(file_path=model_resolver.get_latest_target_encoder_path())
-        categorical_prediction = target_encoder.inverse_transform(prediction)
+        logging.info(f"Reading file: {input_file_path}")
+        # "na" readings are parsed as NaN and readings as float32 while reading, other columns are kept as they are
+        df = schema.read_prediction_csv(input_file_path)
 
-        # update df with our numerical predictions and corresponding categorical labels
-        df["prediction"] = prediction
-        df["categorical_prediction"] = categorical_prediction
+        # loaded once per process and version, repeated batch jobs in one worker skip the deserialization
+        logging.info(f"Loading transformer, model and target encoder")
+        artifacts = model_resolver.load_artifacts(use_fused_transformer=use_fused_transformer)
 
-        # getting location to save our predictions --> prediction/{input_file_name}{timestamp}.csv
-        prediction_file_name = os.path.basename(input_file_path).replace(".csv", f"{datetime.now().strftime('%m%d%Y__%H%M%S')}.csv")
-        prediction_file_path = os.path.join(PREDICTION_DIR, prediction_file_name)
+        # transform, predict and append the numerical predictions and corresponding categorical labels, the
+        # same code as the streaming mode
+        logging.info(f"Making prediction")
+        df = predict_dataframe(df, artifacts)
 
         # saving pur df in csv format at above file location
         df.to_csv(prediction_file_path, index=False, header = True)
         return prediction_file_path
     except Exception as e:
-        SensorException(error_message=e, error_detail=sys)
\ No newline at end of file
+        raise SensorException(error_message=e, error_detail=sys)
+
+
+# artifacts of the version resolved by the parent, loaded once per worker process by the pool initializer
+_worker_artifacts = None
+
+
+def _init_prediction_worker(model_registry:str, version_dir:str, use_fused_transformer:bool):
+    # every worker loads the version the run recorded, even if a newer one is promoted while the pool starts
+    global _worker_artifacts
+    _worker_artifacts = ModelResolver(model_registry=model_registry).load_artifacts(
+        version_dir=version_dir, use_fused_transformer=use_fused_transformer)
+
+
+def _predict_file(input_file_path:str, prediction_file_path:str, content_hash:str, chunk_size:int=None)->dict:
+    start = time.perf_counter()
+    if chunk_size is not None:
+        rows = stream_batch_prediction(input_file_path=input_file_path, prediction_file_path=prediction_file_path,
+                                       artifacts=_worker_artifacts, chunk_size=chunk_size)
+    else:
+        df = predict_dataframe(schema.read_prediction_csv(input_file_path), _worker_artifacts)
+        df.to_csv(prediction_file_path, index=False, header=True)
+        rows = df.shape[0]
+    return {"input_file_path": input_file_path, "prediction_file_path": prediction_file_path, "rows": rows,
+            "content_hash": content_hash, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def _write_json(file_path:str, data)->None:
+    # written next to the target and renamed over it
+    with open(f"{file_path}.tmp", "w") as file_obj:
+        json.dump(data, file_obj, indent=2)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
+def list_input_files(input_path:str)->list:
+    # csv files of a directory, or the files matching a glob pattern
+    if os.path.isdir(input_path):
+        return sorted(glob.glob(os.path.join(input_path, "*.csv")))
+    return sorted(file_path for file_path in glob.glob(input_path) if os.path.isfile(file_path))
+
+
+def start_multi_file_batch_prediction(input_path:str, n_workers:int=None, use_fused_transformer:bool=False,
+                                      chunk_size:int=None, skip_scored:bool=True, model_registry:str="saved_models"):
+    """
+    Predicts every csv file of a directory (or glob pattern) in a process pool
+    every worker loads the artifacts of the version resolved at the start of the run once and predicts whole files,
+    outputs and the run manifest are written to a new prediction/<run timestamp>_<random suffix>/ folder
+    n_workers: processes, None for one per core
+    chunk_size: rows per chunk of the streaming mode inside each worker, None reads files whole
+    skip_scored: skip files whose content was already scored by the same model version in an earlier run
+    =========================================================================================
+    returns path of the run manifest
+    """
+    try:
+        input_file_paths = list_input_files(input_path)
+        logging.info(f"Found {len(input_file_paths)} input files in {input_path}")
+        version_dir = ModelResolver(model_registry=model_registry).get_latest_dir_path()
+        if version_dir is None:
+            raise Exception(f"Model is not available")
+        # a new folder per run, runs started within the same second never share (and overwrite) one
+        os.makedirs(PREDICTION_DIR, exist_ok=True)
+        run_dir = tempfile.mkdtemp(prefix=f"{datetime.now().strftime('%m%d%Y__%H%M%S')}_", dir=PREDICTION_DIR)
+
+        scored_index_path = os.path.join(PREDICTION_DIR, SCORED_INDEX_FILE_NAME)
+        scored_index = dict()
+        if os.path.exists(scored_index_path):
+            with open(scored_index_path, "r") as file_obj:
+                scored_index = json.load(file_obj)
+
+        n_workers = max(1, min(n_workers or os.cpu_count() or 1, max(1, len(input_file_paths))))
+        manifest = {"run_dir": run_dir, "input_path": input_path, "version_dir": version_dir,
+                    "started_at": datetime.now().isoformat(), "files": []}
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_prediction_worker,
+                                 initargs=(model_registry, version_dir, use_fused_transformer)) as executor:
+            # content hashes are computed in the pool as well, only new inputs are predicted
+            content_hashes = list(executor.map(file_hash, input_file_paths))
+            futures = dict()
+            output_names = set()
+            for input_file_path, content_hash in zip(input_file_paths, content_hashes):
+                scored = scored_index.get(content_hash)
+                if skip_scored and scored is not None and scored["version_dir"] == version_dir \
+                        and os.path.exists(scored["prediction_file_path"]):
+                    manifest["files"].append({"input_file_path": input_file_path, "status": "skipped",
+                                              "content_hash": content_hash,
+                                              "prediction_file_path": scored["prediction_file_path"]})
+                    continue
+                # inputs of different directories may share a name
+                output_name = os.path.basename(input_file_path)
+                while output_name in output_names:
+                    output_name = f"_{output_name}"
+                output_names.add(output_name)
+                futures[input_file_path] = executor.submit(_predict_file, input_file_path,
+                                                           os.path.join(run_dir, output_name), content_hash,
+                                                           chunk_size)
+            for input_file_path, future in futures.items():
+                try:
+                    result = future.result()
+                    manifest["files"].append(dict(result, status="scored"))
+                    scored_index[result["content_hash"]] = {"version_dir": version_dir,
+                                                            "prediction_file_path": result["prediction_file_path"]}
+                except Exception as e:
+                    # one broken input does not fail the other files of the run
+                    logging.info(f"Prediction of {input_file_path} failed: {e}")
+                    manifest["files"].append({"input_file_path": input_file_path, "status": "failed", "error": str(e)})
+
+        manifest["finished_at"] = datetime.now().isoformat()
+        for status in ["scored", "skipped", "failed"]:
+            manifest[status] = sum(1 for file in manifest["files"] if file["status"] == status)
+        manifest_file_path = os.path.join(run_dir, RUN_MANIFEST_FILE_NAME)
+        _write_json(manifest_file_path, manifest)
+        _write_json(scored_index_path, scored_index)
+        logging.info(f"Scored {manifest['scored']}, skipped {manifest['skipped']}, failed {manifest['failed']} files, "
+                     f"manifest: {manifest_file_path}")
+        return manifest_file_path
+    except Exception as e:
+        raise SensorException(e, sys)
+
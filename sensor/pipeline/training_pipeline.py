@@ -1,8 +1,12 @@
 import sys,os
+import inspect
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.utils import get_collection_as_dataframe
-from sensor.entity import config_entity
+from sensor.utils import get_collection_as_dataframe, write_yaml_file
+from sensor.artifact_cache import artifact_cache
+from sensor import cross_validation, drift, fused_transformer, resampling, tuning, xgb_training
+from sensor.stage_cache import StageCache
+from sensor.entity import config_entity, artifact_entity
 from sensor.components.data_ingestion import DataIngestion
 from sensor.components.data_validation import DataValidation
 from sensor.components.data_transformation import DataTransformation
@@ -15,43 +19,103 @@ def start_training_pipeline():
     try:
         # get_collection_as_dataframe(database_name="aps", collection_name="sensor")
         training_pipeline_config = config_entity.TrainingPipelineConfig()
+        artifact_cache.configure(enabled=training_pipeline_config.cache_artifacts,
+                                 background_writes=training_pipeline_config.background_artifact_writes)
+        artifact_cache.reset_io_report()
+        try:
+            run_training_stages(training_pipeline_config=training_pipeline_config)
+        finally:
+            # all artifact files have to be on disk before the run ends
+            artifact_cache.flush()
+            io_report = artifact_cache.io_report()
+            logging.info(f"Artifact I/O per stage: {io_report}")
+            write_yaml_file(file_path=training_pipeline_config.io_report_file_path, data=io_report)
+    except Exception as e:
+        raise SensorException(error_message=e, error_detail=sys)
+
+
+def run_training_stages(training_pipeline_config:config_entity.TrainingPipelineConfig):
+    try:
+        # ingestion, validation, transformation and training are skipped when an earlier run already produced
+        # their output from the same inputs, config and code
+        stage_cache = StageCache(cache_dir=training_pipeline_config.stage_cache_dir,
+                                 artifact_dir=training_pipeline_config.artifact_dir,
+                                 enabled=training_pipeline_config.reuse_stage_outputs)
 
         # data ingestion
-        data_ingestion_config  = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
-        print(data_ingestion_config.to_dict())
-        data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
-        data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
+        with artifact_cache.stage("data_ingestion"):
+            data_ingestion_config  = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
+            print(data_ingestion_config.to_dict())
+            data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
+            # source of this stage is the collection itself, so the document count and newest _id of the documents
+            # it reads are fingerprinted
+            collection_state = data_ingestion.get_collection_state()
+            data_ingestion_artifact = stage_cache.run(stage_name="data_ingestion", config=data_ingestion_config,
+                                                      artifact_cls=artifact_entity.DataIngestionArtifact,
+                                                      run_fn=data_ingestion.initiate_data_ingestion, input_paths=[],
+                                                      code_files=[inspect.getsourcefile(DataIngestion)],
+                                                      extra=collection_state)
 
         # data validation
-        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config = training_pipeline_config)
-        data_validation = DataValidation(data_validation_config=data_validation_config, 
-                                        data_ingestion_artifact=data_ingestion_artifact)
-        data_validation_artifact = data_validation.initiate_data_validation()
+        with artifact_cache.stage("data_validation"):
+            data_validation_config = config_entity.DataValidationConfig(training_pipeline_config = training_pipeline_config)
+            data_validation = DataValidation(data_validation_config=data_validation_config,
+                                            data_ingestion_artifact=data_ingestion_artifact)
+            # base dataset profile of the latest saved model, or the base dataset when the profile has to be built
+            data_validation_artifact = stage_cache.run(stage_name="data_validation", config=data_validation_config,
+                                                       artifact_cls=artifact_entity.DataValidationArtifact,
+                                                       run_fn=data_validation.initiate_data_validation,
+                                                       input_paths=[data_ingestion_artifact.train_file_path,
+                                                                    data_ingestion_artifact.test_file_path,
+                                                                    data_validation.get_base_profile_source()],
+                                                       code_files=[inspect.getsourcefile(DataValidation), drift.__file__])
 
         # data transformation
-        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
-        data_transformation = DataTransformation(data_transformation_config=data_transformation_config, 
-                                                data_ingestion_artifact=data_ingestion_artifact)
-        data_transformation_artifact = data_transformation.initiate_data_transformation()
+        with artifact_cache.stage("data_transformation"):
+            data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
+            data_transformation = DataTransformation(data_transformation_config=data_transformation_config,
+                                                    data_ingestion_artifact=data_ingestion_artifact)
+            data_transformation_artifact = stage_cache.run(stage_name="data_transformation",
+                                                           config=data_transformation_config,
+                                                           artifact_cls=artifact_entity.DataTransformationArtifact,
+                                                           run_fn=data_transformation.initiate_data_transformation,
+                                                           input_paths=[data_ingestion_artifact.train_file_path,
+                                                                        data_ingestion_artifact.test_file_path],
+                                                           code_files=[inspect.getsourcefile(DataTransformation),
+                                                                       fused_transformer.__file__, resampling.__file__])
 
         # model training
-        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
-        model_trainer = ModelTrainer(model_trainer_config=model_trainer_config, 
-                                    data_transformation_artifact=data_transformation_artifact)
-        model_trainer_artifact = model_trainer.initiate_model_trainer()
+        with artifact_cache.stage("model_trainer"):
+            model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
+            model_trainer = ModelTrainer(model_trainer_config=model_trainer_config,
+                                        data_transformation_artifact=data_transformation_artifact)
+            model_trainer_artifact = stage_cache.run(stage_name="model_trainer", config=model_trainer_config,
+                                                     artifact_cls=artifact_entity.ModelTrainerArtifact,
+                                                     run_fn=model_trainer.initiate_model_trainer,
+                                                     input_paths=[data_transformation_artifact.transformed_train_x_path,
+                                                                  data_transformation_artifact.transformed_train_y_path,
+                                                                  data_transformation_artifact.transformed_test_x_path,
+                                                                  data_transformation_artifact.transformed_test_y_path,
+                                                                  data_transformation_artifact.unsampled_train_x_path,
+                                                                  data_transformation_artifact.unsampled_train_y_path],
+                                                     code_files=[inspect.getsourcefile(ModelTrainer), tuning.__file__,
+                                                                 xgb_training.__file__, cross_validation.__file__])
 
         # model evaluation
-        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
-        model_evaluation = ModelEvaluation(model_eval_config=model_eval_config, data_ingestion_artifact=data_ingestion_artifact, 
-                                            data_transformation_artifact=data_transformation_artifact, 
-                                            model_trainer_artifact=model_trainer_artifact)
-        model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
+        with artifact_cache.stage("model_evaluation"):
+            model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
+            model_evaluation = ModelEvaluation(model_eval_config=model_eval_config, data_ingestion_artifact=data_ingestion_artifact,
+                                                data_transformation_artifact=data_transformation_artifact,
+                                                model_trainer_artifact=model_trainer_artifact)
+            model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
 
         # model pusher
-        model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
-        model_pusher = ModelPusher(model_pusher_config=model_pusher_config, 
-                                    data_transformation_artifact=data_transformation_artifact, 
-                                    model_trainer_artifact=model_trainer_artifact)
-        model_pusher_artifact = model_pusher.initiate_model_pusher()
+        with artifact_cache.stage("model_pusher"):
+            model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config=training_pipeline_config)
+            model_pusher = ModelPusher(model_pusher_config=model_pusher_config,
+                                        data_transformation_artifact=data_transformation_artifact,
+                                        model_trainer_artifact=model_trainer_artifact,
+                                        data_validation_artifact=data_validation_artifact)
+            model_pusher_artifact = model_pusher.initiate_model_pusher()
     except Exception as e:
-        raise SensorException(error_message=e, error_detail=sys)
\ No newline at end of file
+        raise SensorException(error_message=e, error_detail=sys)
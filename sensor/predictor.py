@@ -1,37 +1,77 @@
 # task is to read the latest model (currently being used for production) and make prediction
 
 import os, sys
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.entity.config_entity import MODEL_FILE_NAME, TRANSFORMER_OBJ_FILE_NAME, TARGET_ENCODER_OBJ_FILE_NAME
+from sensor.utils import load_object
+from sensor.fused_transformer import FusedTransformer, load_fused_transformer
+from sensor.model_registry import ModelRegistry
+from sensor.model_bundle import load_model_bundle
+from sensor.entity.config_entity import MODEL_FILE_NAME, TRANSFORMER_OBJ_FILE_NAME, TARGET_ENCODER_OBJ_FILE_NAME, BASE_PROFILE_FILE_NAME, FUSED_TRANSFORMER_FILE_NAME, MODEL_BUNDLE_FILE_NAME
 from glob import glob     # returns all the files that we have inside folder
 
+# loaded versions kept in memory per process, shared by every ModelResolver
+MAX_LOADED_VERSIONS = 2
+
+
+@dataclass(frozen=True)
+class LoadedArtifacts:
+    # deserialized objects of one saved version
+    version_dir:str
+    transformer:object
+    model:object
+    target_encoder:object
+    # version dir, size and mtime of the files, fused: a version is reloaded when this changes
+    key:tuple = None
+
+
+# (version dir, file signature, fused) -> LoadedArtifacts, least recently used first
+_loaded_versions = OrderedDict()
+_loaded_versions_lock = threading.Lock()
+# (registry, fused, bundle) -> [LoadedArtifacts currently served, time of the last check for a new version, reloading]
+_current_versions = dict()
+# guards the check and reload state of _current_versions, one thread checks and reloads at a time
+_current_versions_lock = threading.Lock()
+
 class ModelResolver:
 # will give latest locations for model object, transformer, target_encoder; load them and compare to our recently trained model for comparison
 
     def __init__(self, model_registry:str = "saved_models", transformer_dir_name = "transformer",
-                target_encoder_dir_name = "target_encoder", model_dir_name = "model"):
+                target_encoder_dir_name = "target_encoder", model_dir_name = "model", profile_dir_name = "profile",
+                bundle_dir_name = "bundle", use_bundle:bool = True):
         # will ask for saved model folder (model_registry) location
         logging.info(f"Entered Model Resolver class")
         self.model_registry = model_registry
-        os.makedirs(self.model_registry, exist_ok=True)      # creates directory named saved_models
+        # creates directory named saved_models, versions are looked up in its manifest
+        self.registry = ModelRegistry(registry_dir=self.model_registry)
         self.transformer_dir_name = transformer_dir_name
         self.target_encoder_dir_name = target_encoder_dir_name
         self.model_dir_name = model_dir_name
+        self.profile_dir_name = profile_dir_name
+        self.bundle_dir_name = bundle_dir_name
+        # with use_fused_transformer, load_artifacts reads the model bundle of a version when it has one (its
+        # transformer is the fused one), the pickles otherwise
+        self.use_bundle = use_bundle
     
-    # get path of latest folder location
+    # get path of latest folder location (the current version of the registry manifest)
     def get_latest_dir_path(self) -> Optional[str]:
         try:
-            dir_names = os.listdir(self.model_registry)
-            if len(dir_names) == 0:
+            latest_version = self.registry.get_current_version()
+            if latest_version is None:
                 return None
-            # the directory names are all in strings, we have to convert them to integer like '0' to 0, '1' to 1
-            dir_names = list(map(int, dir_names))
-            # to get the latest directory name
-            latest_dir_name = max(dir_names)
-            logging.info(f"Fetching latest directory path")
-            return os.path.join(self.model_registry, f"{latest_dir_name}")
+            return self.registry.get_version_dir(latest_version)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    # paths of all saved versions, oldest first
+    def get_dir_paths(self) -> list:
+        try:
+            return [self.registry.get_version_dir(version) for version in self.registry.get_versions()]
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -58,6 +98,16 @@ class ModelResolver:
         except Exception as e:
             raise e
 
+    def get_latest_fused_transformer_path(self):
+        # may not exist for models saved before the fused transformer, see load_fused_transformer
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Transformer is not available")
+            return os.path.join(latest_dir, self.transformer_dir_name, FUSED_TRANSFORMER_FILE_NAME)
+        except Exception as e:
+            raise e
+
     def get_latest_target_encoder_path(self):
         try:
             latest_dir = self.get_latest_dir_path()
@@ -67,23 +117,28 @@ class ModelResolver:
         except Exception as e:
             raise e
 
+    def get_latest_profile_path(self)->Optional[str]:
+        # base dataset profile of the latest model, None for registries or versions saved without a profile
+        try:
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                return None
+            profile_path = os.path.join(latest_dir, self.profile_dir_name, BASE_PROFILE_FILE_NAME)
+            if not os.path.exists(profile_path):
+                return None
+            return profile_path
+        except Exception as e:
+            raise e
+
     # we want to save our model after comparison into a new dir incremented by 1 from latest dir number
     # we will write functions which give path to the location in saved_models dir where we will move our generated models from artifact dir
     # as they will be utilised in the prediction pipeline
 
     def get_latest_save_dir_path(self)->str:
+        # next free version directory, a publisher running at the same time may take it: ModelPusher writes a
+        # staging directory and publishes it (ModelRegistry.publish) instead
         try:
-        
-            latest_dir = self.get_latest_dir_path()
-            # for first iteration, when there is no dir inside saved_models then we will pass first file number as 0
-            if latest_dir == None:
-                logging.info(f"As there is nothing present inside {self.model_registry}, so creating a folder {0}")
-                return os.path.join(self.model_registry, f"{0}")
-            # for saved_models/1 path, os.path.basename returns 1
-            latest_dir_num = int(os.path.basename(self.get_latest_dir_path()))
-            # for file already present inside saved_models then increment its basename by 1
-            return os.path.join(self.model_registry, f"{latest_dir_num+1}")
-            logging.info(f"Fetching path to save files after comparison (incrementing already present directory number)")
+            return self.registry.get_version_dir(self.registry.get_next_version())
         except Exception as e:
             raise e
 
@@ -103,6 +158,13 @@ class ModelResolver:
         except Exception as e:
             raise e
 
+    def get_latest_save_fused_transformer_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir, self.transformer_dir_name, FUSED_TRANSFORMER_FILE_NAME)
+        except Exception as e:
+            raise e
+
     def get_latest_save_target_encoder_path(self):
         try:
             latest_dir = self.get_latest_save_dir_path()
@@ -110,3 +172,138 @@ class ModelResolver:
             logging.info(f"Fetching location to store best target encoder after comparison")
         except Exception as e:
             raise e
+
+    def get_latest_save_profile_path(self):
+        try:
+            latest_dir = self.get_latest_save_dir_path()
+            return os.path.join(latest_dir, self.profile_dir_name, BASE_PROFILE_FILE_NAME)
+        except Exception as e:
+            raise e
+
+    def get_version_paths(self, version_dir:str)->dict:
+        # locations of every artifact inside a version (or staging) directory
+        return {"model": os.path.join(version_dir, self.model_dir_name, MODEL_FILE_NAME),
+                "transformer": os.path.join(version_dir, self.transformer_dir_name, TRANSFORMER_OBJ_FILE_NAME),
+                "fused_transformer": os.path.join(version_dir, self.transformer_dir_name, FUSED_TRANSFORMER_FILE_NAME),
+                "target_encoder": os.path.join(version_dir, self.target_encoder_dir_name, TARGET_ENCODER_OBJ_FILE_NAME),
+                "profile": os.path.join(version_dir, self.profile_dir_name, BASE_PROFILE_FILE_NAME),
+                "bundle": os.path.join(version_dir, self.bundle_dir_name, MODEL_BUNDLE_FILE_NAME)}
+
+    # loaded artifact api: the deserialized transformer, model and target encoder of a version are kept in a process
+    # wide lru of MAX_LOADED_VERSIONS versions, keyed by the version directory plus the size and mtime of its files,
+    # so repeated jobs in one process deserialize a version once and a rewritten version is loaded again
+
+    def _version_files(self, version_dir:str, use_fused_transformer:bool)->dict:
+        # files a version is loaded from: its bundle when the fused transformer is asked for and there is one, else
+        # the pickles, so the sklearn pipeline and the pickled model stay the default
+        paths = self.get_version_paths(version_dir)
+        if self.use_bundle and use_fused_transformer and os.path.exists(paths["bundle"]):
+            return {"bundle": paths["bundle"]}
+        files = {name: paths[name] for name in ["transformer", "model", "target_encoder"]}
+        if use_fused_transformer and os.path.exists(paths["fused_transformer"]):
+            files["fused_transformer"] = paths["fused_transformer"]
+        return files
+
+    def _version_key(self, version_dir:str, use_fused_transformer:bool)->tuple:
+        signature = []
+        for name, file_path in sorted(self._version_files(version_dir, use_fused_transformer).items()):
+            stat = os.stat(file_path)
+            signature.append((name, stat.st_size, stat.st_mtime_ns))
+        return os.path.abspath(version_dir), tuple(signature), use_fused_transformer
+
+    def load_artifacts(self, version_dir:Optional[str]=None, use_fused_transformer:bool=False)->LoadedArtifacts:
+        """
+        Loaded transformer, model and target encoder of a saved version, served from memory when loaded before
+        version_dir: saved_models/<version>, None for the latest version
+        use_fused_transformer: compiled float32 transformer instead of the sklearn pipeline
+        with use_fused_transformer, versions with a model bundle are loaded from it (its transformer is the fused one)
+        """
+        try:
+            if version_dir is None:
+                version_dir = self.get_latest_dir_path()
+                if version_dir is None:
+                    raise Exception(f"Model is not available")
+            key = self._version_key(version_dir, use_fused_transformer)
+            with _loaded_versions_lock:
+                artifacts = _loaded_versions.get(key)
+                if artifacts is not None:
+                    _loaded_versions.move_to_end(key)
+                    return artifacts
+            # loaded outside the lock, readers of other versions are never blocked by a load
+            logging.info(f"Loading model, transformer and target encoder of {version_dir}")
+            files = self._version_files(version_dir, use_fused_transformer)
+            if "bundle" in files:
+                transformer, model, target_encoder = load_model_bundle(file_path=files["bundle"])
+            else:
+                if "fused_transformer" in files:
+                    transformer = load_fused_transformer(file_path=files["fused_transformer"])
+                elif use_fused_transformer:
+                    # versions saved before the fused transformer, compiled from the pickled pipeline
+                    transformer = FusedTransformer.from_pipeline(load_object(file_path=files["transformer"]))
+                else:
+                    transformer = load_object(file_path=files["transformer"])
+                model = load_object(file_path=files["model"])
+                target_encoder = load_object(file_path=files["target_encoder"])
+            artifacts = LoadedArtifacts(version_dir=version_dir, transformer=transformer, model=model,
+                                        target_encoder=target_encoder, key=key)
+            with _loaded_versions_lock:
+                _loaded_versions[key] = artifacts
+                while len(_loaded_versions) > MAX_LOADED_VERSIONS:
+                    _loaded_versions.popitem(last=False)
+            return artifacts
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def preload(self, use_fused_transformer:bool=False)->LoadedArtifacts:
+        # loads the latest version at process start and makes it the served version of get_current_artifacts
+        try:
+            artifacts = self.load_artifacts(use_fused_transformer=use_fused_transformer)
+            _current_versions[(os.path.abspath(self.model_registry), use_fused_transformer, self.use_bundle)] = \
+                [artifacts, time.monotonic(), False]
+            return artifacts
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_current_artifacts(self, use_fused_transformer:bool=False, refresh_seconds:float=30.0)->LoadedArtifacts:
+        """
+        Artifacts of the served version for long running processes, never blocks on a reload
+        the registry is checked for a new (or rewritten) latest version at most every refresh_seconds, a new
+        version is loaded in a background thread and swapped in when loaded, callers get the served version meanwhile
+        """
+        try:
+            current_key = (os.path.abspath(self.model_registry), use_fused_transformer, self.use_bundle)
+            current = _current_versions.get(current_key)
+            if current is None:
+                return self.preload(use_fused_transformer=use_fused_transformer)
+            with _current_versions_lock:
+                artifacts, checked_at, reloading = current
+                if reloading or time.monotonic() - checked_at < refresh_seconds:
+                    return artifacts
+                # claimed by this thread, concurrent requests keep serving until the next refresh
+                current[1] = time.monotonic()
+            latest_dir = self.get_latest_dir_path()
+            if latest_dir is None:
+                return artifacts
+            if self._version_key(latest_dir, use_fused_transformer) == artifacts.key:
+                return artifacts
+            with _current_versions_lock:
+                if current[2]:
+                    return artifacts
+                current[2] = True
+
+            def reload():
+                try:
+                    # one dict assignment swaps the served version, readers get either version as a whole
+                    _current_versions[current_key] = [self.load_artifacts(version_dir=latest_dir,
+                                                                           use_fused_transformer=use_fused_transformer),
+                                                       time.monotonic(), False]
+                    logging.info(f"Swapped in {latest_dir}")
+                except Exception as e:
+                    logging.info(f"Reloading {latest_dir} failed, keeping {artifacts.version_dir}: {e}")
+                    with _current_versions_lock:
+                        current[2] = False
+            threading.Thread(target=reload, daemon=True).start()
+            return artifacts
+        except Exception as e:
+            raise SensorException(e, sys)
+
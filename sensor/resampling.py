@@ -0,0 +1,96 @@
+# class imbalance handling of the transformed train/test arrays
+# strategies:
+#   smote_tomek   -> SMOTETomek on the whole array as before, neighbour searches spread over n_jobs threads
+#   smote         -> SMOTE oversampling only, skips the Tomek links search over every row of the array
+#   chunked_smote -> SMOTETomek on stratified chunks of chunk_size rows, neighbour searches never span more than
+#                    one chunk so time grows linearly with rows (Tomek links across chunks are missed)
+#   class_weight  -> no resampling, the model weighs the minority class by scale_pos_weight (negatives/positives)
+
+import sys
+import numpy as np
+from typing import Optional
+from sklearn.neighbors import NearestNeighbors
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import TomekLinks
+from imblearn.combine import SMOTETomek
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+RESAMPLING_STRATEGIES = ["smote_tomek", "smote", "chunked_smote", "class_weight"]
+
+# neighbours used by SMOTE (the imblearn default of 5 plus the sample itself)
+SMOTE_NEIGHBORS = 6
+
+
+def get_resampler(strategy:str, n_jobs:int=1, random_state:Optional[int]=None):
+    """
+    Returns the imblearn sampler of a strategy, None when the strategy does not resample
+    """
+    try:
+        if strategy not in RESAMPLING_STRATEGIES:
+            raise Exception(f"Unsupported resampling strategy: {strategy}, choose one of {RESAMPLING_STRATEGIES}")
+        if strategy == "class_weight":
+            return None
+        # n_jobs only spreads the neighbour searches, samples are the same as with a single job
+        smote = SMOTE(k_neighbors=NearestNeighbors(n_neighbors=SMOTE_NEIGHBORS, n_jobs=n_jobs),
+                      random_state=random_state)
+        if strategy == "smote":
+            return smote
+        return SMOTETomek(smote=smote, tomek=TomekLinks(sampling_strategy="all", n_jobs=n_jobs),
+                          random_state=random_state)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_scale_pos_weight(y:np.ndarray)->float:
+    # weight of the positive class which balances it against the negative class
+    positives = int(np.sum(y == 1))
+    negatives = int(np.sum(y == 0))
+    if positives == 0:
+        return 1.0
+    return negatives / positives
+
+
+def _stratified_chunks(y:np.ndarray, chunk_size:int, random_state:Optional[int]):
+    # row indices of chunks of about chunk_size rows, every chunk keeps the class ratio of y
+    # every chunk needs enough minority samples for the SMOTE neighbour search
+    minority_count = int(np.unique(y, return_counts=True)[1].min())
+    n_chunks = max(1, min(int(np.ceil(y.shape[0] / chunk_size)), minority_count // SMOTE_NEIGHBORS))
+    rng = np.random.default_rng(random_state)
+    chunks = [[] for _ in range(n_chunks)]
+    for label in np.unique(y):
+        rows = rng.permutation(np.flatnonzero(y == label))
+        for index, part in enumerate(np.array_split(rows, n_chunks)):
+            chunks[index].append(part)
+    return [np.sort(np.concatenate(parts)) for parts in chunks]
+
+
+def resample(x:np.ndarray, y:np.ndarray, strategy:str="smote_tomek", n_jobs:int=1, chunk_size:int=20000,
+             random_state:Optional[int]=None):
+    """
+    x: input feature array
+    y: encoded target array
+    strategy: one of RESAMPLING_STRATEGIES
+    n_jobs: threads of the neighbour searches
+    chunk_size: rows per chunk of the chunked_smote strategy
+    ==============================================================
+    returns resampled x, y (unchanged for class_weight)
+    """
+    try:
+        sampler = get_resampler(strategy=strategy, n_jobs=n_jobs, random_state=random_state)
+        if sampler is None:
+            return x, y
+        logging.info(f"Before resampling ({strategy}) Input: {x.shape} Target: {y.shape}")
+        if strategy == "chunked_smote" and x.shape[0] > chunk_size:
+            x_parts, y_parts = [], []
+            for rows in _stratified_chunks(y=y, chunk_size=chunk_size, random_state=random_state):
+                x_part, y_part = sampler.fit_resample(x[rows], y[rows])
+                x_parts.append(x_part)
+                y_parts.append(y_part)
+            x, y = np.concatenate(x_parts), np.concatenate(y_parts)
+        else:
+            x, y = sampler.fit_resample(x, y)
+        logging.info(f"After resampling ({strategy}) Input: {x.shape} Target: {y.shape}")
+        return x, y
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -0,0 +1,74 @@
+# single description of the APS sensor dataset used by every reader of the pipeline
+# all readings are parsed as float32 with "na" treated as missing while the file is read,
+# so data lands typed in one pass instead of string columns being replaced and cast afterwards
+
+import numpy as np
+import pandas as pd
+from sensor.config import TARGET_COLUMN
+
+# string used in the raw sensor data for missing readings
+NA_VALUE = "na"
+NA_VALUES = [NA_VALUE]
+
+# every sensor reading is stored as float32, half the memory of the float64 pandas default
+FEATURE_DTYPE = np.float32
+
+# anonymized sensor columns of the APS failure dataset in file order
+FEATURE_COLUMNS = [
+    "aa_000", "ab_000", "ac_000", "ad_000", "ae_000", "af_000", "ag_000", "ag_001", "ag_002", "ag_003",
+    "ag_004", "ag_005", "ag_006", "ag_007", "ag_008", "ag_009", "ah_000", "ai_000", "aj_000", "ak_000",
+    "al_000", "am_0", "an_000", "ao_000", "ap_000", "aq_000", "ar_000", "as_000", "at_000", "au_000", "av_000",
+    "ax_000", "ay_000", "ay_001", "ay_002", "ay_003", "ay_004", "ay_005", "ay_006", "ay_007", "ay_008",
+    "ay_009", "az_000", "az_001", "az_002", "az_003", "az_004", "az_005", "az_006", "az_007", "az_008",
+    "az_009", "ba_000", "ba_001", "ba_002", "ba_003", "ba_004", "ba_005", "ba_006", "ba_007", "ba_008",
+    "ba_009", "bb_000", "bc_000", "bd_000", "be_000", "bf_000", "bg_000", "bh_000", "bi_000", "bj_000",
+    "bk_000", "bl_000", "bm_000", "bn_000", "bo_000", "bp_000", "bq_000", "br_000", "bs_000", "bt_000",
+    "bu_000", "bv_000", "bx_000", "by_000", "bz_000", "ca_000", "cb_000", "cc_000", "cd_000", "ce_000",
+    "cf_000", "cg_000", "ch_000", "ci_000", "cj_000", "ck_000", "cl_000", "cm_000", "cn_000", "cn_001",
+    "cn_002", "cn_003", "cn_004", "cn_005", "cn_006", "cn_007", "cn_008", "cn_009", "co_000", "cp_000",
+    "cq_000", "cr_000", "cs_000", "cs_001", "cs_002", "cs_003", "cs_004", "cs_005", "cs_006", "cs_007",
+    "cs_008", "cs_009", "ct_000", "cu_000", "cv_000", "cx_000", "cy_000", "cz_000", "da_000", "db_000",
+    "dc_000", "dd_000", "de_000", "df_000", "dg_000", "dh_000", "di_000", "dj_000", "dk_000", "dl_000",
+    "dm_000", "dn_000", "do_000", "dp_000", "dq_000", "dr_000", "ds_000", "dt_000", "du_000", "dv_000",
+    "dx_000", "dy_000", "dz_000", "ea_000", "eb_000", "ec_00", "ed_000", "ee_000", "ee_001", "ee_002",
+    "ee_003", "ee_004", "ee_005", "ee_006", "ee_007", "ee_008", "ee_009", "ef_000", "eg_000"
+]
+
+COLUMNS = [TARGET_COLUMN] + FEATURE_COLUMNS
+
+
+def get_dtypes(columns:list=None)->dict:
+    # explicit dtype of every sensor column, the target column is left to pandas (strings)
+    if columns is None:
+        columns = FEATURE_COLUMNS
+    feature_columns = set(FEATURE_COLUMNS)
+    return {column: FEATURE_DTYPE for column in columns if column in feature_columns}
+
+
+def read_csv(file_path:str, columns:list=None, **kwargs):
+    """
+    Reads a sensor csv file with the dataset schema applied at parse time
+    file_path: csv file to read
+    columns: optional list of columns to parse, other columns are skipped by the parser and columns
+             missing from the file are left out (e.g. the target column of a prediction input)
+    kwargs: passed on to pd.read_csv (e.g. chunksize)
+    return: pd.DataFrame (or a chunk iterator when chunksize is given), columns in file order
+    """
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda column: column in wanted
+    return pd.read_csv(file_path, usecols=usecols, na_values=NA_VALUES, dtype=get_dtypes(), **kwargs)
+
+
+def read_prediction_csv(file_path:str, **kwargs):
+    """
+    Reads a prediction input file, the schema is only applied to the sensor columns
+    every other column of the file (e.g. truck or date identifiers) is kept as pandas reads it, so it is carried
+    through to the prediction output unchanged
+    file_path: csv file to read
+    kwargs: passed on to pd.read_csv (e.g. chunksize)
+    return: pd.DataFrame (or a chunk iterator when chunksize is given), columns in file order
+    """
+    return pd.read_csv(file_path, na_values={column: NA_VALUES for column in FEATURE_COLUMNS}, dtype=get_dtypes(), 
+                       **kwargs)
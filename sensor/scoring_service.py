@@ -0,0 +1,254 @@
+# resident http scoring service of the latest saved model
+# the transformer, model and target encoder of the latest version in saved_models are loaded once and kept in
+# memory, a newer version is picked up within refresh_seconds without blocking requests. Concurrent single row
+# requests are coalesced into micro batches: the batcher waits at most max_wait_ms after the first queued row, or
+# until max_batch_size rows are queued, and calls predict once for the whole batch (in a worker thread, the event
+# loop keeps accepting requests meanwhile).
+# endpoints:
+#   POST /predict        -> one record {"aa_000": 76698, "ab_000": "na", ...}, micro batched
+#   POST /predict_batch  -> list of records, predicted directly as one batch
+#   POST /reload         -> loads the latest saved version right away
+#   GET  /metrics        -> p50/p99 latency, throughput and mean batch size of the last metrics_window requests
+#   GET  /health
+
+import sys
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Request
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.predictor import ModelResolver
+from sensor.schema import NA_VALUE, FEATURE_DTYPE, FEATURE_COLUMNS
+from sensor.entity.config_entity import ScoringServiceConfig
+
+
+def _to_float(value)->float:
+    # missing readings arrive as null, "na" or are left out of the record
+    if value is None or value == NA_VALUE:
+        return np.nan
+    return float(value)
+
+
+class LatencyMetrics:
+    # latencies and completion times of the last window requests
+
+    def __init__(self, window:int=10000):
+        self._latencies = deque(maxlen=window)
+        self._completed_at = deque(maxlen=window)
+        self._batch_sizes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def record(self, seconds:float)->None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self._completed_at.append(time.perf_counter())
+            self.requests += 1
+
+    def record_batch(self, size:int)->None:
+        with self._lock:
+            self._batch_sizes.append(size)
+
+    def snapshot(self)->dict:
+        with self._lock:
+            latencies = np.array(self._latencies)
+            completed_at = list(self._completed_at)
+            batch_sizes = list(self._batch_sizes)
+        snapshot = {"requests": self.requests, "p50_ms": None, "p99_ms": None, "throughput_rps": None,
+                    "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else None}
+        if latencies.shape[0] > 0:
+            snapshot["p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+            snapshot["p99_ms"] = float(np.percentile(latencies, 99) * 1000)
+        if len(completed_at) > 1 and completed_at[-1] > completed_at[0]:
+            snapshot["throughput_rps"] = (len(completed_at) - 1) / (completed_at[-1] - completed_at[0])
+        return snapshot
+
+
+class ScoringModel:
+    # serves the latest saved version through the loaded artifact api of ModelResolver: a new version is loaded in
+    # the background and swapped in atomically, requests are never blocked by a reload
+
+    def __init__(self, model_registry:str="saved_models", use_fused_transformer:bool=False,
+                 refresh_seconds:float=30.0, min_fields:int=1):
+        self.model_resolver = ModelResolver(model_registry=model_registry)
+        self.use_fused_transformer = use_fused_transformer
+        self.refresh_seconds = refresh_seconds
+        # a record with none of the schema fields would be scored on imputed values only
+        self.min_fields = max(1, min_fields)
+        self._loaded = False
+
+    def load(self)->str:
+        # loads the latest version right away (startup, POST /reload)
+        try:
+            artifacts = self.model_resolver.preload(use_fused_transformer=self.use_fused_transformer)
+            self._loaded = True
+            logging.info(f"Scoring service loaded {artifacts.version_dir}")
+            return artifacts.version_dir
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_artifacts(self):
+        return self.model_resolver.get_current_artifacts(use_fused_transformer=self.use_fused_transformer,
+                                                         refresh_seconds=self.refresh_seconds)
+
+    @property
+    def version_dir(self)->str:
+        return self.get_artifacts().version_dir if self._loaded else None
+
+    def to_row(self, record:dict)->np.ndarray:
+        # float32 row of every schema column, parsed per request so a bad record only fails its own request
+        n_fields = sum(1 for column in FEATURE_COLUMNS if column in record)
+        if n_fields < self.min_fields:
+            raise ValueError(f"Record has {n_fields} of the schema fields, at least {self.min_fields} are needed")
+        return np.array([_to_float(record.get(column)) for column in FEATURE_COLUMNS], dtype=FEATURE_DTYPE)
+
+    def predict_rows(self, rows:list)->list:
+        """
+        rows: list of rows made by to_row
+        ==================================
+        returns list of {"prediction": 0/1, "class": label} in the order of rows
+        """
+        if len(rows) == 0:
+            return []
+        # one reference to the artifacts, a reload during the call does not mix versions
+        artifacts = self.get_artifacts()
+        df = pd.DataFrame(np.vstack(rows), columns=FEATURE_COLUMNS)
+        input_arr = artifacts.transformer.transform(df[list(artifacts.transformer.feature_names_in_)])
+        prediction = artifacts.model.predict(input_arr)
+        categorical_prediction = artifacts.target_encoder.inverse_transform(prediction)
+        return [{"prediction": int(value), "class": str(label)}
+                for value, label in zip(prediction, categorical_prediction)]
+
+
+class MicroBatcher:
+
+    def __init__(self, predict, max_batch_size:int=64, max_wait_ms:float=2.0, metrics:LatencyMetrics=None):
+        """
+        predict: function of a list of rows returning a list of results in the same order
+        max_batch_size: rows per predict call at most
+        max_wait_ms: time the first queued row waits for more rows
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = metrics
+        self._queue = None
+        self._task = None
+        # one batch is predicted at a time, rows arriving meanwhile make up the next batch
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self)->None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self)->None:
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+    async def _next_batch(self)->list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self)->None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+            try:
+                results = await loop.run_in_executor(self._executor, self.predict, [row for row, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                logging.info(f"Micro batch of {len(batch)} rows failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+def create_app(config:ScoringServiceConfig=None)->FastAPI:
+    # artifacts are loaded when the server starts, importing the app stays cheap
+    config = config or ScoringServiceConfig()
+    app = FastAPI(title="APS sensor fault scoring service")
+    metrics = LatencyMetrics(window=config.metrics_window)
+    scoring_model = ScoringModel(model_registry=config.model_registry, use_fused_transformer=config.use_fused_transformer,
+                                 refresh_seconds=config.refresh_seconds, min_fields=config.min_fields)
+    batcher = MicroBatcher(predict=scoring_model.predict_rows, max_batch_size=config.max_batch_size,
+                           max_wait_ms=config.max_wait_ms, metrics=metrics)
+
+    @app.on_event("startup")
+    async def startup():
+        scoring_model.load()
+        await batcher.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await batcher.stop()
+
+    @app.post("/predict")
+    async def predict(request:Request):
+        start = time.perf_counter()
+        record = await request.json()
+        if not isinstance(record, dict):
+            raise HTTPException(status_code=400, detail="Expected one record as a json object")
+        try:
+            row = scoring_model.to_row(record)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        result = await batcher.submit(row)
+        metrics.record(time.perf_counter() - start)
+        return result
+
+    @app.post("/predict_batch")
+    async def predict_batch(request:Request):
+        start = time.perf_counter()
+        records = await request.json()
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise HTTPException(status_code=400, detail="Expected a json list of records")
+        try:
+            rows = [scoring_model.to_row(record) for record in records]
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        results = await asyncio.get_running_loop().run_in_executor(None, scoring_model.predict_rows, rows)
+        metrics.record(time.perf_counter() - start)
+        return results
+
+    @app.post("/reload")
+    async def reload():
+        version_dir = await asyncio.get_running_loop().run_in_executor(None, scoring_model.load)
+        return {"version_dir": version_dir}
+
+    @app.get("/metrics")
+    async def get_metrics():
+        return dict(metrics.snapshot(), version_dir=scoring_model.version_dir)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "version_dir": scoring_model.version_dir}
+
+    return app
@@ -0,0 +1,149 @@
+# memoization of pipeline stages across runs
+# every stage gets a fingerprint built from the content hashes of its input artifacts, its config, the source
+# code of the stage and the versions of the libraries doing the work. When a previous run already produced an
+# artifact for the same fingerprint (and its files are still under artifact/), the stage is skipped and that
+# artifact is reused, e.g. a rerun after the evaluation rejected a model does not ingest, resample and train again.
+
+import os, sys
+import json
+import hashlib
+import dataclasses
+from importlib import metadata
+from typing import Callable, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.artifact_cache import artifact_cache, file_hash
+from sensor import utils, storage, schema
+
+# libraries whose version changes the outputs of a stage
+LIBRARIES = ["numpy", "pandas", "scikit-learn", "scipy", "imbalanced-learn", "xgboost", "dill"]
+
+# helper modules every stage depends on
+SHARED_CODE_FILES = [utils.__file__, storage.__file__, schema.__file__]
+
+
+def get_library_versions()->dict:
+    versions = dict()
+    for library in LIBRARIES:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = None
+    return versions
+
+
+def _to_plain(value):
+    # numpy scalars (e.g. f1 scores) are stored as plain python numbers
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class StageCache:
+
+    def __init__(self, cache_dir:str, artifact_dir:str, enabled:bool=True):
+        self.cache_dir = cache_dir
+        # run specific artifact dir is masked in configs, so the same config of two runs gives the same fingerprint
+        self.artifact_dir = artifact_dir
+        self.enabled = enabled
+        self.library_versions = get_library_versions()
+
+    def _hash_path(self, path:str)->str:
+        if os.path.isdir(path):
+            hasher = hashlib.blake2b(digest_size=16)
+            for dir_path, dir_names, file_names in sorted(os.walk(path)):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(dir_path, file_name)
+                    hasher.update(os.path.relpath(file_path, path).encode())
+                    hasher.update(file_hash(file_path).encode())
+            return hasher.hexdigest()
+        content_hash = artifact_cache.get_content_hash(path)
+        # npy dataframes keep their column names in a schema sidecar
+        schema_file_path = storage.get_schema_file_path(path)
+        if path.endswith(storage.FILE_EXTENSIONS["npy"]) and os.path.exists(schema_file_path):
+            content_hash = f"{content_hash}:{file_hash(schema_file_path)}"
+        return content_hash
+
+    def _config_values(self, config:object)->dict:
+        values = dict()
+        for key, value in sorted(vars(config).items()):
+            if isinstance(value, str):
+                value = value.replace(self.artifact_dir, "<artifact_dir>")
+            elif not isinstance(value, (int, float, bool, type(None), list, tuple, dict)):
+                value = repr(value)
+            values[key] = value
+        return values
+
+    def fingerprint(self, stage_name:str, config:object, input_paths:list, code_files:list, extra:dict=None)->str:
+        """
+        stage_name: name of the stage
+        config: stage config object, artifact paths inside the run dir are masked
+        input_paths: files or directories the stage reads
+        code_files: source files of the stage
+        extra: any other value the stage output depends on (e.g. state of the source collection)
+        =========================================================================================
+        returns hex fingerprint of the stage
+        """
+        try:
+            description = {
+                "stage": stage_name,
+                "config": self._config_values(config),
+                "inputs": {os.path.basename(path): self._hash_path(path) for path in input_paths},
+                "code": {os.path.basename(path): file_hash(path) for path in list(code_files) + SHARED_CODE_FILES},
+                "libraries": self.library_versions,
+                "extra": extra,
+            }
+            encoded = json.dumps(description, sort_keys=True, default=str).encode()
+            return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def _index_file_path(self, stage_name:str, fingerprint:str)->str:
+        return os.path.join(self.cache_dir, stage_name, f"{fingerprint}.yaml")
+
+    def load(self, stage_name:str, fingerprint:str, artifact_cls:type)->Optional[object]:
+        # artifact of an earlier run with the same fingerprint, None when it is unknown or its files are gone
+        try:
+            index_file_path = self._index_file_path(stage_name, fingerprint)
+            if not os.path.exists(index_file_path):
+                return None
+            artifact = artifact_cls(**utils.read_yaml_file(file_path=index_file_path))
+            for value in dataclasses.asdict(artifact).values():
+                if isinstance(value, str) and os.path.isabs(value) and not os.path.exists(value):
+                    logging.info(f"Cached output {value} of {stage_name} no longer exists")
+                    return None
+            return artifact
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def save(self, stage_name:str, fingerprint:str, artifact:object)->None:
+        try:
+            # artifact files have to be on disk before other runs may reuse them
+            artifact_cache.flush()
+            index_file_path = self._index_file_path(stage_name, fingerprint)
+            data = {key: _to_plain(value) for key, value in dataclasses.asdict(artifact).items()}
+            utils.write_yaml_file(file_path=f"{index_file_path}.tmp", data=data)
+            os.replace(f"{index_file_path}.tmp", index_file_path)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def run(self, stage_name:str, config:object, artifact_cls:type, run_fn:Callable, input_paths:list,
+            code_files:list, extra:dict=None):
+        """
+        Returns the artifact of run_fn(), reusing the output of an earlier run with the same fingerprint
+        """
+        try:
+            if not self.enabled:
+                return run_fn()
+            fingerprint = self.fingerprint(stage_name=stage_name, config=config, input_paths=input_paths,
+                                           code_files=code_files, extra=extra)
+            artifact = self.load(stage_name=stage_name, fingerprint=fingerprint, artifact_cls=artifact_cls)
+            if artifact is not None:
+                logging.info(f"Reusing {stage_name} output of fingerprint {fingerprint}: {artifact}")
+                return artifact
+            artifact = run_fn()
+            self.save(stage_name=stage_name, fingerprint=fingerprint, artifact=artifact)
+            return artifact
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,197 @@
+# read/write helpers for the dataframes handed over between pipeline stages (feature store, train and test files)
+# supported formats:
+#   csv     -> plain text, parsed again on every read
+#   parquet -> columnar file, needs the optional pyarrow package
+#   npy     -> one float32 matrix stored column by column plus a yaml schema sidecar, read through a memory map
+
+import os, sys
+import numpy as np
+import pandas as pd
+import yaml
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import schema
+from sensor.artifact_cache import artifact_cache
+
+FILE_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "npy": ".npy"}
+SCHEMA_FILE_SUFFIX = ".schema.yaml"
+
+
+def get_file_name(file_name:str, storage_format:str)->str:
+    # sensor.csv -> sensor.npy for storage_format="npy"
+    try:
+        if storage_format not in FILE_EXTENSIONS:
+            raise Exception(f"Unsupported storage format: {storage_format}, choose one of {list(FILE_EXTENSIONS)}")
+        return f"{os.path.splitext(file_name)[0]}{FILE_EXTENSIONS[storage_format]}"
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_storage_format(file_path:str)->str:
+    extension = os.path.splitext(file_path)[1]
+    for storage_format, format_extension in FILE_EXTENSIONS.items():
+        if extension == format_extension:
+            return storage_format
+    raise Exception(f"Can not infer storage format of {file_path}")
+
+
+def get_schema_file_path(file_path:str)->str:
+    return f"{os.path.splitext(file_path)[0]}{SCHEMA_FILE_SUFFIX}"
+
+
+def save_dataframe(file_path:str, df:pd.DataFrame, cache:bool=True)->None:
+    """
+    Save dataframe in the format given by the file extension
+    file_path: str location of file to save
+    df: pd.DataFrame to save, kept in the artifact cache for later stages (must not be modified afterwards)
+    cache: False writes the file directly without keeping the dataframe in memory
+    """
+    try:
+        if cache:
+            artifact_cache.put(file_path, df, writer=_write_dataframe)
+        else:
+            _write_dataframe(file_path, df)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _write_dataframe(file_path:str, df:pd.DataFrame)->None:
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        storage_format = get_storage_format(file_path)
+        if storage_format == "csv":
+            df.to_csv(path_or_buf=file_path, index=False, header=True)
+        elif storage_format == "parquet":
+            df.to_parquet(file_path, index=False, engine="pyarrow")
+        else:
+            _save_npy(file_path=file_path, df=df)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def load_dataframe(file_path:str, columns:list=None)->pd.DataFrame:
+    """
+    Load dataframe saved by save_dataframe
+    file_path: str location of the file to load
+    columns: optional list of columns to read, other columns are never parsed
+    return: pd.DataFrame
+    """
+    try:
+        # a cached dataframe serves projected reads as well, partial reads are never cached themselves
+        df = artifact_cache.get(file_path, loader=lambda path: _read_dataframe(path, columns=columns), 
+                                keep=columns is None)
+        if columns is not None:
+            df = df[columns]
+        # callers may modify the dataframe, the cached one has to stay untouched
+        return df.copy()
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _read_dataframe(file_path:str, columns:list=None)->pd.DataFrame:
+    try:
+        storage_format = get_storage_format(file_path)
+        if storage_format == "csv":
+            return schema.read_csv(file_path, columns=columns)
+        elif storage_format == "parquet":
+            return pd.read_parquet(file_path, columns=columns, engine="pyarrow")
+        return _load_npy(file_path=file_path, columns=columns)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def iter_dataframe_chunks(file_path:str, chunk_size:int=50000, columns:list=None):
+    """
+    Reads a file saved by save_dataframe chunk by chunk, at most chunk_size rows are in memory at a time
+    the artifact cache is bypassed, so files larger than memory can be streamed
+    file_path: str location of the file to read
+    chunk_size: number of rows per chunk
+    columns: optional list of columns to read
+    yields: pd.DataFrame
+    """
+    try:
+        storage_format = get_storage_format(file_path)
+        # files written by a background writer have to be complete before they are streamed
+        artifact_cache.flush()
+        if storage_format == "csv":
+            yield from schema.read_csv(file_path, columns=columns, chunksize=chunk_size)
+        elif storage_format == "parquet":
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(file_path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            file_schema = _read_schema(file_path)
+            matrix = np.load(file_path, mmap_mode="r")
+            for start in range(0, matrix.shape[0], chunk_size):
+                yield _npy_frame(matrix[start:start + chunk_size], file_schema, columns, file_path)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def read_columns(file_path:str)->list:
+    # column names without reading the data
+    try:
+        storage_format = get_storage_format(file_path)
+        if storage_format == "csv":
+            return list(pd.read_csv(file_path, nrows=0).columns)
+        elif storage_format == "parquet":
+            import pyarrow.parquet as pq
+            return list(pq.read_schema(file_path).names)
+        return list(_read_schema(file_path)["columns"])
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _save_npy(file_path:str, df:pd.DataFrame)->None:
+    # non numeric columns (the target column) are stored as float32 category codes, NaN for missing values
+    categories = dict()
+    matrix = np.empty(df.shape, dtype=schema.FEATURE_DTYPE, order="F")
+    for index, column in enumerate(df.columns):
+        series = df[column]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            matrix[:, index] = series.to_numpy(dtype=schema.FEATURE_DTYPE, na_value=np.nan)
+        else:
+            codes, uniques = pd.factorize(series, sort=True)
+            codes = codes.astype(schema.FEATURE_DTYPE)
+            codes[codes < 0] = np.nan
+            matrix[:, index] = codes
+            categories[column] = [str(value) for value in uniques]
+    # fortran order keeps every column contiguous on disk, so projected reads touch only the needed columns
+    with open(file_path, "wb") as file_obj:
+        np.save(file_obj, matrix)
+    file_schema = {"columns": [str(column) for column in df.columns], "dtype": "float32", "categories": categories,
+                   "rows": int(df.shape[0])}
+    with open(get_schema_file_path(file_path), "w") as schema_file:
+        yaml.safe_dump(file_schema, schema_file)
+    logging.info(f"Saved {df.shape} float32 matrix to {file_path}")
+
+
+def _read_schema(file_path:str)->dict:
+    with open(get_schema_file_path(file_path), "r") as schema_file:
+        return yaml.safe_load(schema_file)
+
+
+def _load_npy(file_path:str, columns:list=None)->pd.DataFrame:
+    matrix = np.load(file_path, mmap_mode="r")
+    return _npy_frame(matrix, _read_schema(file_path), columns, file_path)
+
+
+def _npy_frame(matrix:np.ndarray, file_schema:dict, columns:list, file_path:str)->pd.DataFrame:
+    # dataframe of the given rows (a memory mapped matrix or a slice of it) with category codes decoded
+    all_columns = file_schema["columns"]
+    if columns is None:
+        columns = all_columns
+    column_index = {column: index for index, column in enumerate(all_columns)}
+    missing_columns = [column for column in columns if column not in column_index]
+    if len(missing_columns) > 0:
+        raise Exception(f"Columns {missing_columns} are not available in {file_path}")
+    data = dict()
+    for column in columns:
+        values = np.array(matrix[:, column_index[column]])
+        if column in file_schema["categories"]:
+            labels = np.array(file_schema["categories"][column] + [np.nan], dtype=object)
+            codes = np.where(np.isnan(values), -1, values).astype(np.int64)
+            values = labels[codes]
+        data[column] = values
+    return pd.DataFrame(data, columns=columns, copy=False)
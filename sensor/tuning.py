@@ -0,0 +1,218 @@
+# budgeted XGBoost hyperparameter search (successive halving) used by ModelTrainer.fine_tune
+# every round trains the remaining parameter sets with n_estimators = budget, keeps the best 1/eta of them and
+# multiplies the budget by eta. Trials run in a process pool, each trial with n_jobs threads so that
+# workers * n_jobs never exceeds the cores. The validation split is cut from the train arrays before resampling
+# and only its fit rows are resampled, so no synthetic row built from fit rows ends up in the validation rows.
+# The fit/validation matrix is copied once into shared memory and every worker maps it instead of receiving a
+# pickled copy per trial. Finished trials are stored in a yaml file: trials of the same data, validation split
+# (size and seed), resampling and parameters are never trained again, and the best parameters of earlier runs
+# seed the next search (warm start). Without a random_state every search draws a new split, so scores of
+# earlier runs are not comparable and only their parameters are reused.
+
+import os, sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional
+import numpy as np
+from xgboost import XGBClassifier
+from sklearn.metrics import f1_score
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import utils, resampling
+
+# parameter -> (kind, low, high), log scale for parameters spanning orders of magnitude
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 10),
+    "learning_rate": ("log", 0.01, 0.3),
+    "subsample": ("float", 0.6, 1.0),
+    "colsample_bytree": ("float", 0.5, 1.0),
+    "min_child_weight": ("log", 1.0, 10.0),
+    "reg_lambda": ("log", 0.1, 10.0),
+    "gamma": ("float", 0.0, 5.0),
+}
+
+# arrays of the running search, attached once per worker process
+_shared_arrays = dict()
+
+
+def sample_params(rng:np.random.Generator, search_space:dict=SEARCH_SPACE)->dict:
+    params = dict()
+    for name, (kind, low, high) in search_space.items():
+        if kind == "int":
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == "log":
+            params[name] = round(float(np.exp(rng.uniform(np.log(low), np.log(high)))), 6)
+        else:
+            params[name] = round(float(rng.uniform(low, high)), 6)
+    return params
+
+
+def params_key(params:dict)->str:
+    return json.dumps(params, sort_keys=True)
+
+
+def data_hash(x:np.ndarray, y:np.ndarray)->str:
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(x.shape).encode())
+    hasher.update(np.ascontiguousarray(x).data)
+    hasher.update(np.ascontiguousarray(y).data)
+    return hasher.hexdigest()
+
+
+class SharedArray:
+    # numpy array living in a shared memory block, created by the parent and mapped by the workers
+
+    def __init__(self, array:np.ndarray):
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)[...] = array
+
+    def descriptor(self)->tuple:
+        return self.shm.name, self.shape, self.dtype
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach_shared_arrays(descriptors:dict):
+    # process pool initializer, keeps the shared memory blocks open for the lifetime of the worker
+    for name, (shm_name, shape, dtype) in descriptors.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared_arrays[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _run_trial(params:dict, budget:int, n_fit:int, n_jobs:int, early_stopping_rounds:int,
+               scale_pos_weight:Optional[float]):
+    # fit rows come first in the shared matrix, the validation rows after them, so both are views
+    x, y = _shared_arrays["x"][1], _shared_arrays["y"][1]
+    x_fit, y_fit, x_val, y_val = x[:n_fit], y[:n_fit], x[n_fit:], y[n_fit:]
+    model = XGBClassifier(n_estimators=budget, n_jobs=n_jobs, early_stopping_rounds=early_stopping_rounds,
+                          scale_pos_weight=scale_pos_weight, **params)
+    model.fit(x_fit, y_fit, eval_set=[(x_val, y_val)], verbose=False)
+    score = f1_score(y_val, model.predict(x_val))
+    best_iteration = getattr(model, "best_iteration", None)
+    n_estimators = budget if best_iteration is None else int(best_iteration) + 1
+    return {"params": params, "budget": budget, "score": float(score), "n_estimators": n_estimators}
+
+
+class SuccessiveHalvingSearch:
+
+    def __init__(self, n_trials:int=27, min_budget:int=50, max_budget:int=450, eta:int=3, n_workers:int=1,
+                 validation_size:float=0.2, early_stopping_rounds:int=20, trials_file_path:str=None,
+                 random_state:Optional[int]=None):
+        self.n_trials = n_trials
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.eta = eta
+        self.n_workers = max(1, n_workers)
+        # threads per trial, workers * threads never oversubscribes the cores
+        self.n_jobs = max(1, (os.cpu_count() or 1) // self.n_workers)
+        self.validation_size = validation_size
+        self.early_stopping_rounds = early_stopping_rounds
+        self.trials_file_path = trials_file_path
+        self.random_state = random_state
+
+    def _load_trials(self)->list:
+        if self.trials_file_path is None or not os.path.exists(self.trials_file_path):
+            return []
+        return utils.read_yaml_file(self.trials_file_path) or []
+
+    def _save_trials(self, trials:list):
+        if self.trials_file_path is None:
+            return
+        utils.write_yaml_file(file_path=f"{self.trials_file_path}.tmp", data=trials)
+        os.replace(f"{self.trials_file_path}.tmp", self.trials_file_path)
+
+    def _initial_params(self, rng:np.random.Generator, previous_trials:list)->list:
+        # best parameters of earlier searches first, then random samples
+        candidates = []
+        for trial in sorted(previous_trials, key=lambda trial: (trial["budget"], trial["score"]), reverse=True):
+            if params_key(trial["params"]) not in {params_key(params) for params in candidates}:
+                candidates.append(trial["params"])
+            if len(candidates) >= max(1, self.n_trials // self.eta):
+                break
+        while len(candidates) < self.n_trials:
+            candidates.append(sample_params(rng))
+        return candidates
+
+    def search(self, x:np.ndarray, y:np.ndarray, scale_pos_weight:Optional[float]=None,
+               resampling_params:Optional[dict]=None)->dict:
+        """
+        x: input feature array, before resampling
+        y: encoded target array, before resampling
+        scale_pos_weight: positive class weight passed to every trial
+        resampling_params: resampling.resample parameters applied to the fit rows of the split, None for none
+        ============================================================
+        returns best trial {"params", "budget", "score", "n_estimators"}
+        """
+        try:
+            rng = np.random.default_rng(self.random_state)
+            # one stratified validation split, fit rows first
+            validation_rows = []
+            for label in np.unique(y):
+                rows = rng.permutation(np.flatnonzero(y == label))
+                validation_rows.append(rows[:int(round(rows.shape[0] * self.validation_size))])
+            is_validation = np.zeros(y.shape[0], dtype=bool)
+            is_validation[np.concatenate(validation_rows)] = True
+            fit_rows, validation_rows = np.flatnonzero(~is_validation), np.flatnonzero(is_validation)
+            x_fit, y_fit = x[fit_rows], y[fit_rows]
+            if resampling_params is not None:
+                x_fit, y_fit = resampling.resample(x=x_fit, y=y_fit, n_jobs=os.cpu_count() or 1, **resampling_params)
+            n_fit = y_fit.shape[0]
+
+            trials = self._load_trials()
+            current_hash = data_hash(x, y)
+            known = dict()
+            if self.random_state is not None:
+                known = {(params_key(trial["params"]), trial["budget"]): trial for trial in trials
+                         if trial.get("data_hash") == current_hash and trial.get("validation_size") == self.validation_size
+                         and trial.get("random_state") == self.random_state
+                         and trial.get("resampling") == resampling_params}
+            candidates = self._initial_params(rng, trials)
+            logging.info(f"Successive halving over {len(candidates)} parameter sets with {self.n_workers} workers "
+                         f"x {self.n_jobs} threads, {len(known)} trials known from earlier runs")
+
+            x_shared = SharedArray(np.concatenate([x_fit, x[validation_rows]]).astype(np.float32, copy=False))
+            y_shared = SharedArray(np.concatenate([y_fit, y[validation_rows]]).astype(np.int8, copy=False))
+            try:
+                descriptors = {"x": x_shared.descriptor(), "y": y_shared.descriptor()}
+                with ProcessPoolExecutor(max_workers=self.n_workers, initializer=_attach_shared_arrays,
+                                         initargs=(descriptors,)) as executor:
+                    budget = self.min_budget
+                    best_trial = None
+                    while True:
+                        results = []
+                        futures = []
+                        for params in candidates:
+                            trial = known.get((params_key(params), budget))
+                            if trial is not None:
+                                results.append(trial)
+                            else:
+                                futures.append(executor.submit(_run_trial, params, budget, n_fit, self.n_jobs,
+                                                               self.early_stopping_rounds, scale_pos_weight))
+                        for future in futures:
+                            trial = future.result()
+                            trial.update({"data_hash": current_hash, "validation_size": self.validation_size,
+                                          "random_state": self.random_state, "resampling": resampling_params})
+                            trials.append(trial)
+                            known[(params_key(trial["params"]), budget)] = trial
+                            results.append(trial)
+                        self._save_trials(trials)
+                        results.sort(key=lambda trial: trial["score"], reverse=True)
+                        best_trial = results[0]
+                        logging.info(f"Budget {budget}: best f1 {best_trial['score']} of {len(results)} trials")
+                        if budget >= self.max_budget or len(results) == 1:
+                            break
+                        candidates = [trial["params"] for trial in results[:max(1, len(results) // self.eta)]]
+                        budget = min(budget * self.eta, self.max_budget)
+            finally:
+                x_shared.close()
+                y_shared.close()
+            logging.info(f"Best trial: {best_trial}")
+            return best_trial
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -4,35 +4,248 @@ import pandas as pd
 import yaml
 from sensor.logger import logging
 from sensor.exception import SensorException
-from sensor.config import mongo_client
+from sensor.config import mongo_client, env_var, TARGET_COLUMN
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import dill
+from sensor.schema import NA_VALUE, FEATURE_DTYPE, COLUMNS
+from sensor.artifact_cache import artifact_cache
 
 
-def get_collection_as_dataframe(database_name:str,collection_name:str)->pd.DataFrame:
+def get_collection_as_dataframe(database_name:str,collection_name:str, batch_size:int=5000, n_workers:int=1, 
+                                executor:str="process")->pd.DataFrame:
     """
     Description: This function return collection as dataframe
     =========================================================
     Params:
     database_name: database name
     collection_name: collection name
+    batch_size: number of documents fetched from mongodb per round trip
+    n_workers: number of _id range partitions read concurrently (1 reads through a single cursor)
+    executor: "process" to read partitions in a process pool, "thread" to share the current mongo client
     =========================================================
     return Pandas dataframe of a collection
     """
     try:
         logging.info(f"Reading data from database: {database_name} and collection: {collection_name}")
-        df = pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
-        # find() gives records of all documents inside collection but is a generator which is passed to the list and converted to dataframe
+        # documents are streamed straight into typed column buffers instead of building list(find()) first
+        if n_workers > 1:
+            columns = get_collection_as_arrays_partitioned(database_name=database_name, 
+                                                           collection_name=collection_name, batch_size=batch_size, 
+                                                           n_workers=n_workers, executor=executor)
+        else:
+            columns = get_collection_as_arrays(database_name=database_name, collection_name=collection_name, 
+                                               batch_size=batch_size)
+        df = pd.DataFrame(columns, copy=False)
         logging.info(f"Found columns: {df.columns}")
-        # we know that mongodb has an unecessary _id column which is not important and need to be dropped
-        if "_id" in df.columns:
-            logging.info(f"Dropping column: _id")
-            df.drop("_id", axis=1, inplace=True)
         logging.info(f"Rows and cols in df: {df.shape}")
         return df
     except Exception as e:
         raise SensorException(e, sys)
 
 
+def get_collection_as_arrays(database_name:str, collection_name:str, batch_size:int=5000, 
+                             string_columns:list=None, query:dict=None, client=None)->dict:
+    """
+    Description: This function streams a collection into preallocated column arrays
+    =========================================================
+    Params:
+    database_name: database name
+    collection_name: collection name
+    batch_size: number of documents fetched from mongodb per round trip
+    string_columns: columns kept as object arrays, every other column is parsed as float32 (schema.FEATURE_DTYPE)
+    query: optional filter, documents are then returned in _id order
+    client: mongo client to read with, defaults to the shared client of sensor.config
+    =========================================================
+    return dictionary of column name -> numpy array (in collection order)
+    """
+    try:
+        if string_columns is None:
+            string_columns = [TARGET_COLUMN]
+        if client is None:
+            client = mongo_client
+        collection = client[database_name][collection_name]
+        if query is None:
+            # estimated count is read from collection metadata, buffers are grown later if more documents arrive
+            expected_rows = collection.estimated_document_count()
+            # _id is excluded on the server side so it never reaches python
+            cursor = collection.find({}, projection={"_id": 0}, batch_size=batch_size)
+        else:
+            expected_rows = collection.count_documents(query)
+            cursor = collection.find(query, projection={"_id": 0}, batch_size=batch_size).sort("_id", 1)
+        return read_cursor_as_arrays(cursor=cursor, expected_rows=expected_rows, batch_size=batch_size, 
+                                     string_columns=string_columns)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_collection_as_arrays_partitioned(database_name:str, collection_name:str, batch_size:int=5000, 
+                                         n_workers:int=2, executor:str="process", string_columns:list=None)->dict:
+    """
+    Description: This function reads a collection as _id range partitions in parallel
+    =========================================================
+    Params:
+    database_name: database name
+    collection_name: collection name
+    batch_size: number of documents fetched from mongodb per round trip
+    n_workers: number of partitions and concurrent readers
+    executor: "process" (every worker opens its own client) or "thread" (workers share the current client,
+              useful with an in-memory mongomock client)
+    string_columns: columns kept as object arrays, every other column is parsed as float32
+    =========================================================
+    return dictionary of column name -> numpy array, partitions stitched back in _id order
+    """
+    try:
+        if string_columns is None:
+            string_columns = [TARGET_COLUMN]
+        queries = get_id_range_queries(database_name=database_name, collection_name=collection_name, 
+                                       n_partitions=n_workers)
+        logging.info(f"Reading {len(queries)} partitions of {collection_name} with {n_workers} {executor} workers")
+        if executor == "process":
+            pool = ProcessPoolExecutor(max_workers=n_workers)
+            read_fn = _read_partition_in_process
+            extra_args = [None] * len(queries)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=n_workers)
+            read_fn = _read_partition
+            extra_args = [mongo_client] * len(queries)
+        else:
+            raise Exception(f"Unknown executor: {executor}, expected 'process' or 'thread'")
+        with pool:
+            # map keeps submission order, so partitions are stitched deterministically
+            partitions = list(pool.map(read_fn, [database_name] * len(queries), [collection_name] * len(queries), 
+                                       queries, [batch_size] * len(queries), [string_columns] * len(queries), 
+                                       extra_args))
+        partitions = [partition for partition in partitions if len(partition) > 0]
+        if len(partitions) == 0:
+            return dict()
+        # partitions may see different fields, every column of any partition is kept (filled with NaN where a
+        # partition did not have it), in the same order as the single cursor read
+        columns = _order_columns(dict.fromkeys(column for partition in partitions for column in partition))
+        return {column: np.concatenate([_get_partition_column(partition, column, string_columns)
+                                        for partition in partitions]) for column in columns}
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def _order_columns(columns)->list:
+    # schema columns in schema order, fields outside the schema after them in order of first appearance
+    schema_order = {column: index for index, column in enumerate(COLUMNS)}
+    return sorted(columns, key=lambda column: schema_order.get(column, len(schema_order)))
+
+
+def _get_partition_column(partition:dict, column:str, string_columns:list)->np.ndarray:
+    if column in partition:
+        return partition[column]
+    n_rows = len(next(iter(partition.values())))
+    return np.full(n_rows, np.nan, dtype=object if column in string_columns else FEATURE_DTYPE)
+
+
+def get_id_range_queries(database_name:str, collection_name:str, n_partitions:int)->list:
+    # splits the collection into contiguous _id ranges of (roughly) equal document count
+    collection = mongo_client[database_name][collection_name]
+    total_rows = collection.count_documents({})
+    partition_size = -(-total_rows // n_partitions) if total_rows > 0 else 0
+    boundaries = []
+    for partition in range(1, n_partitions):
+        offset = partition * partition_size
+        if offset >= total_rows:
+            break
+        document = next(collection.find({}, projection={"_id": 1}).sort("_id", 1).skip(offset).limit(1), None)
+        if document is not None:
+            boundaries.append(document["_id"])
+    queries = []
+    lower = None
+    for upper in boundaries + [None]:
+        id_range = dict()
+        if lower is not None:
+            id_range["$gte"] = lower
+        if upper is not None:
+            id_range["$lt"] = upper
+        queries.append({"_id": id_range} if len(id_range) > 0 else {})
+        lower = upper
+    return queries
+
+
+def _read_partition(database_name:str, collection_name:str, query:dict, batch_size:int, 
+                    string_columns:list, client)->dict:
+    return get_collection_as_arrays(database_name=database_name, collection_name=collection_name, 
+                                    batch_size=batch_size, string_columns=string_columns, query=query, 
+                                    client=client)
+
+
+def _read_partition_in_process(database_name:str, collection_name:str, query:dict, batch_size:int, 
+                               string_columns:list, client=None)->dict:
+    # mongo clients are not fork safe, so every worker process opens its own connection
+    import pymongo
+    client = pymongo.MongoClient(env_var.mongo_db_url)
+    try:
+        return _read_partition(database_name, collection_name, query, batch_size, string_columns, client)
+    finally:
+        client.close()
+
+
+def read_cursor_as_arrays(cursor, expected_rows:int, batch_size:int, string_columns:list)->dict:
+    # fills one buffer per column chunk by chunk, so only batch_size documents are alive at any time
+    columns = None
+    buffers = dict()
+    n_rows = 0
+    capacity = max(int(expected_rows), 0)
+    chunk = []
+    for document in cursor:
+        chunk.append(document)
+        if len(chunk) < batch_size:
+            continue
+        columns, capacity = _fill_buffers(chunk, buffers, columns, n_rows, capacity, string_columns)
+        n_rows += len(chunk)
+        chunk = []
+    if len(chunk) > 0:
+        columns, capacity = _fill_buffers(chunk, buffers, columns, n_rows, capacity, string_columns)
+        n_rows += len(chunk)
+    if columns is None:
+        return dict()
+    # trim the unused tail when the collection shrank after counting
+    return {column: buffers[column][:n_rows] for column in _order_columns(columns)}
+
+
+def _fill_buffers(chunk:list, buffers:dict, columns:list, start:int, capacity:int, string_columns:list):
+    # documents may have different fields, the columns are the union of the keys of every document read so far
+    if columns is None:
+        columns = []
+    # the union of the chunk's keys is taken in C, first appearance order is only looked up for new fields
+    if not set().union(*chunk).issubset(buffers.keys()):
+        columns = columns + list(dict.fromkeys(key for document in chunk for key in document
+                                               if key not in buffers))
+    end = start + len(chunk)
+    if end > capacity:
+        # more documents than counted, grow buffers geometrically
+        capacity = max(end, 2 * capacity)
+    for column in columns:
+        is_string = column in string_columns
+        buffer = buffers.get(column)
+        if buffer is None:
+            # rows read before the field first appeared are missing values
+            buffer = np.empty(capacity, dtype=object if is_string else FEATURE_DTYPE)
+            buffer[:start] = np.nan
+            buffers[column] = buffer
+        elif buffer.shape[0] < capacity:
+            grown = np.empty(capacity, dtype=buffer.dtype)
+            grown[:start] = buffer[:start]
+            buffer = grown
+            buffers[column] = buffer
+        if is_string:
+            buffer[start:end] = [document.get(column, np.nan) for document in chunk]
+        else:
+            buffer[start:end] = _parse_float_values([document.get(column) for document in chunk])
+    return columns, capacity
+
+
+def _parse_float_values(values:list)->np.ndarray:
+    # "na" sentinel and missing keys become NaN, numeric strings are parsed on the fly
+    parsed = np.array(values, dtype=object)
+    parsed[(parsed == NA_VALUE) | pd.isna(parsed)] = np.nan
+    return parsed.astype(FEATURE_DTYPE)
+
+
 def write_yaml_file(file_path, data:dict):
     # to save report in yaml format
     try:
@@ -44,32 +257,83 @@ def write_yaml_file(file_path, data:dict):
         raise SensorException(e, sys)
 
 
+def read_yaml_file(file_path:str)->dict:
+    try:
+        with open(file_path, "rb") as yaml_file:
+            return yaml.safe_load(yaml_file)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_latest_document_id(database_name:str, collection_name:str, before_id=None):
+    # _id of the most recently inserted document (ObjectIds grow with insert time), None for an empty collection
+    # before_id: only documents with a smaller _id are considered
+    try:
+        query = {} if before_id is None else {"_id": {"$lt": before_id}}
+        document = mongo_client[database_name][collection_name].find_one(query, projection={"_id": 1}, 
+                                                                        sort=[("_id", -1)])
+        if document is None:
+            return None
+        return document["_id"]
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_collection_state(database_name:str, collection_name:str, before_id=None)->dict:
+    # cheap summary of a collection which changes whenever documents are inserted or deleted
+    # before_id: only documents with a smaller _id are summarized
+    try:
+        query = {} if before_id is None else {"_id": {"$lt": before_id}}
+        latest_id = get_latest_document_id(database_name=database_name, collection_name=collection_name, 
+                                           before_id=before_id)
+        return {"documents": mongo_client[database_name][collection_name].count_documents(query), 
+                "latest_id": str(latest_id)}
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
 def convert_columns_to_float(df:pd.DataFrame, exclude_columns:list)->pd.DataFrame:
     try:
-        for column in df.columns:
-            if column not in exclude_columns:
-                df[column] = df[column].astype('float')
-        return df
+        # one astype call for all columns which are not float32 yet, typed readers usually leave nothing to do
+        dtypes = {column: FEATURE_DTYPE for column in df.columns 
+                  if column not in exclude_columns and df[column].dtype != FEATURE_DTYPE}
+        if len(dtypes) == 0:
+            return df
+        return df.astype(dtypes)
     except Exception as e:
         raise SensorException(e, sys)
 
 def save_object(file_path:str, obj:object) -> None:
     try:
         logging.info("Entered the save_object method of the utils class")
-        os.makedirs(os.path.dirname(file_path), exist_ok = True)
-        with open(file_path, "wb") as file_obj:
-            dill.dump(obj, file_obj)
-            # dill also saves object in a pickle file
+        # object stays in the artifact cache, so the next stage loading it skips the dill round trip
+        artifact_cache.put(file_path, obj, writer=_write_object)
         logging.info("Exited the save_object method of the utils class")
     except Exception as e:
         raise SensorException(e, sys) from e
 
+def _write_object(file_path:str, obj:object) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok = True)
+    with open(file_path, "wb") as file_obj:
+        dill.dump(obj, file_obj)
+        # dill also saves object in a pickle file
+
 def load_object(file_path:str,) -> object:
     try:
-        if not os.path.exists(file_path):
-            raise Exception(f"The given {file_path} does not exist")
-        with open(file_path, "rb") as file_obj:
-            return dill.load(file_obj)
+        return artifact_cache.get(file_path, loader=_read_object)
+    except Exception as e:
+        raise SensorException(e, sys) from e
+
+def _read_object(file_path:str) -> object:
+    if not os.path.exists(file_path):
+        raise Exception(f"The given {file_path} does not exist")
+    with open(file_path, "rb") as file_obj:
+        return dill.load(file_obj)
+
+def copy_object(src_file_path:str, dst_file_path:str) -> None:
+    # copies a saved artifact file without loading and dumping it again
+    try:
+        artifact_cache.copy(src_file_path, dst_file_path)
     except Exception as e:
         raise SensorException(e, sys) from e
 
@@ -83,21 +347,34 @@ def save_numpy_array_data(file_path:str, array:np.array):
     array: np.array data to save
     """
     try:
-        dir_path = os.path.dirname(file_path)
-        os.makedirs(dir_path, exist_ok = True)
-        with open(file_path, "wb") as file_obj:
-            np.save(file_obj, array)
+        artifact_cache.put(file_path, array, writer=_write_numpy_array)
     except Exception as e:
         raise SensorException(e, sys) from e
 
-def load_numpy_array_data(file_path:str) -> np.array:
+def _write_numpy_array(file_path:str, array:np.array):
+    dir_path = os.path.dirname(file_path)
+    os.makedirs(dir_path, exist_ok = True)
+    with open(file_path, "wb") as file_obj:
+        np.save(file_obj, array)
+
+def load_numpy_array_data(file_path:str, mmap_mode:str=None) -> np.array:
     """
     Loads numpy array data from file
     file_path: str location of the file to load
+    mmap_mode: "r" maps the file instead of reading it, pages are read when they are accessed
     return: np.array of loaded data
     """
     try:
-        with open(file_path, "rb") as file_obj:
-            return np.load(file_obj)
+        array = artifact_cache.get(file_path, loader=lambda path: _read_numpy_array(path, mmap_mode=mmap_mode))
+        # the cached array is shared between stages, so callers get a read-only view of it
+        array = array.view()
+        array.flags.writeable = False
+        return array
     except Exception as e:
-        raise SensorException(e, sys)
\ No newline at end of file
+        raise SensorException(e, sys)
+
+def _read_numpy_array(file_path:str, mmap_mode:str=None) -> np.array:
+    if mmap_mode is not None:
+        return np.load(file_path, mmap_mode=mmap_mode)
+    with open(file_path, "rb") as file_obj:
+        return np.load(file_obj)
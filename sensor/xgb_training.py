@@ -0,0 +1,208 @@
+# histogram based xgboost training on quantized matrices
+# modes:
+#   quantile        -> the transformed arrays are quantized once into QuantileDMatrix objects (max_bin buckets per
+#                      feature, 1 byte per value instead of the float array xgboost copies otherwise)
+#   external_memory -> the transformed array files are streamed in chunks of external_memory_chunk_rows rows through a
+#                      DataIter, xgboost keeps its quantized pages under a cache prefix on disk, so the training data
+#                      never has to fit in memory
+# matrices are keyed by the content hash of the input feature file: a matrix built once in a process is reused by training
+# and by both predict calls. External memory pages are written to a new <dmatrix_cache_dir>/<hash>_<random>/
+# directory per matrix, so concurrent training runs and CV workers never share or remove each other's pages. The
+# directory is removed once its matrix is freed (or when the process exits), xgboost can not save quantized
+# matrices for another process to load.
+# QuantileDMatrix needs xgboost>=1.7, ExtMemQuantileDMatrix (used when available) xgboost>=2.1.
+
+import os, sys
+import gc
+import atexit
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+import numpy as np
+import xgboost as xgb
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.artifact_cache import artifact_cache
+from sensor.utils import load_numpy_array_data
+
+TRAINING_MODES = ["default", "quantile", "external_memory"]
+
+# matrices kept per process, a train and a test matrix per training run
+MAX_CACHED_MATRICES = 4
+
+# sklearn wrapper parameter names and their native booster names
+SKLEARN_PARAM_NAMES = {"learning_rate": "eta", "reg_lambda": "lambda", "reg_alpha": "alpha", "n_jobs": "nthread"}
+
+_matrix_cache = OrderedDict()
+# external memory page directories of this process -> weak reference to the matrix owning them
+_page_dirs = dict()
+
+
+class ArrayFileIter(xgb.DataIter):
+    # yields chunks of rows of the saved input feature and target arrays, read through memory maps
+
+    def __init__(self, x_file_path:str, y_file_path:str, chunk_rows:int, cache_prefix:str=None):
+        self.x_file_path = x_file_path
+        self.y_file_path = y_file_path
+        self.chunk_rows = chunk_rows
+        self._position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data)->int:
+        x = np.load(self.x_file_path, mmap_mode="r")
+        if self._position >= x.shape[0]:
+            return 0
+        y = np.load(self.y_file_path, mmap_mode="r")
+        rows = slice(self._position, self._position + self.chunk_rows)
+        input_data(data=np.asarray(x[rows]), label=np.asarray(y[rows]))
+        self._position += self.chunk_rows
+        return 1
+
+    def reset(self)->None:
+        self._position = 0
+
+
+class BoosterClassifier:
+    """
+    Binary classifier around a trained booster, with the predict api of XGBClassifier
+    predict takes arrays and dataframes (predicted in place, without building a DMatrix) or a DMatrix
+    """
+
+    def __init__(self, booster:xgb.Booster, nthread:int=None):
+        self.booster = booster
+        if nthread is not None:
+            self.booster.set_param({"nthread": nthread})
+
+    def predict_proba(self, X)->np.ndarray:
+        if isinstance(X, xgb.DMatrix):
+            positive = self.booster.predict(X)
+        else:
+            positive = self.booster.inplace_predict(X)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X)->np.ndarray:
+        # same decision rule as XGBClassifier for binary:logistic
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(np.int64)
+
+
+def booster_params(params:dict=None, max_bin:int=256, nthread:int=None)->dict:
+    # XGBClassifier style parameters -> native training parameters of the hist tree method
+    booster_params = {"objective": "binary:logistic", "tree_method": "hist", "max_bin": max_bin,
+                      "eval_metric": "logloss"}
+    if nthread is not None:
+        booster_params["nthread"] = nthread
+    for name, value in (params or {}).items():
+        if name == "n_estimators" or value is None:
+            continue
+        booster_params[SKLEARN_PARAM_NAMES.get(name, name)] = value
+    return booster_params
+
+
+def _cache_matrix(key:tuple, build):
+    matrix = _matrix_cache.get(key)
+    if matrix is None:
+        matrix = build()
+        _matrix_cache[key] = matrix
+        while len(_matrix_cache) > MAX_CACHED_MATRICES:
+            _matrix_cache.popitem(last=False)
+    else:
+        logging.info(f"Reusing quantized matrix of {key[0]}")
+    _matrix_cache.move_to_end(key)
+    return matrix
+
+
+def _remove_page_dir(page_dir:str):
+    _page_dirs.pop(page_dir, None)
+    shutil.rmtree(page_dir, ignore_errors=True)
+
+
+@atexit.register
+def _free_matrices():
+    # cached matrices are freed before the interpreter shuts down, so xgboost removes the page files before their
+    # directories go, directories of matrices still referenced at exit are removed as well
+    _matrix_cache.clear()
+    gc.collect()
+    for page_dir in list(_page_dirs):
+        _remove_page_dir(page_dir)
+
+
+def _page_dir(cache_dir:str, content_hash:str)->str:
+    # directory owned by one matrix of this process, other processes building pages of the same data get their own
+    os.makedirs(cache_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{content_hash}_", dir=cache_dir)
+
+
+def _content_hash(x_file_path:str, y_file_path:str)->str:
+    return f"{artifact_cache.get_content_hash(x_file_path)}{artifact_cache.get_content_hash(y_file_path)}"
+
+
+def get_quantile_matrix(x_file_path:str, y_file_path:str, max_bin:int=256, nthread:int=None,
+                        ref_file_paths:tuple=None)->xgb.DMatrix:
+    """
+    QuantileDMatrix of the saved input feature and target arrays
+    ref_file_paths: (x, y) arrays whose bucket boundaries are used (the train arrays, for the test matrix)
+    """
+    try:
+        if not hasattr(xgb, "QuantileDMatrix"):
+            raise Exception(f"training_mode 'quantile' needs xgboost>=1.7, installed is {xgb.__version__}")
+        ref, ref_hash = None, None
+        if ref_file_paths is not None:
+            ref = get_quantile_matrix(*ref_file_paths, max_bin=max_bin, nthread=nthread)
+            ref_hash = _content_hash(*ref_file_paths)
+        content_hash = _content_hash(x_file_path, y_file_path)
+        key = (content_hash, "quantile", max_bin, ref_hash)
+
+        def build():
+            x = load_numpy_array_data(file_path=x_file_path, mmap_mode="r")
+            y = load_numpy_array_data(file_path=y_file_path, mmap_mode="r")
+            return xgb.QuantileDMatrix(x, label=y, max_bin=max_bin, nthread=nthread, ref=ref)
+        return _cache_matrix(key, build)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def get_external_memory_matrix(x_file_path:str, y_file_path:str, cache_dir:str, chunk_rows:int=100000,
+                               max_bin:int=256, nthread:int=None, ref_file_paths:tuple=None)->xgb.DMatrix:
+    """
+    External memory matrix of the saved input feature and target arrays, streamed in chunk_rows chunks
+    cache_dir: directory of the quantized pages, one sub directory per data hash
+    ref_file_paths: (x, y) arrays whose bucket boundaries are used (the train arrays, for the test matrix)
+    """
+    try:
+        ref, ref_hash = None, None
+        if ref_file_paths is not None:
+            ref = get_external_memory_matrix(*ref_file_paths, cache_dir=cache_dir, chunk_rows=chunk_rows,
+                                             max_bin=max_bin, nthread=nthread)
+            ref_hash = _content_hash(*ref_file_paths)
+        content_hash = _content_hash(x_file_path, y_file_path)
+        key = (content_hash, "external_memory", max_bin, ref_hash)
+
+        def build():
+            page_dir = _page_dir(cache_dir, content_hash)
+            try:
+                data_iter = ArrayFileIter(x_file_path=x_file_path, y_file_path=y_file_path, chunk_rows=chunk_rows,
+                                          cache_prefix=os.path.join(page_dir, "pages"))
+                if hasattr(xgb, "ExtMemQuantileDMatrix"):
+                    matrix = xgb.ExtMemQuantileDMatrix(data_iter, max_bin=max_bin, nthread=nthread, ref=ref)
+                else:
+                    matrix = xgb.DMatrix(data_iter, nthread=nthread)
+            except Exception:
+                shutil.rmtree(page_dir, ignore_errors=True)
+                raise
+            # the pages live as long as the matrix, xgboost removes its page files when the matrix is freed
+            _page_dirs[page_dir] = weakref.ref(matrix, lambda _, page_dir=page_dir: _remove_page_dir(page_dir))
+            return matrix
+        return _cache_matrix(key, build)
+    except Exception as e:
+        raise SensorException(e, sys)
+
+
+def train_booster(dtrain:xgb.DMatrix, params:dict=None, max_bin:int=256, nthread:int=None)->BoosterClassifier:
+    try:
+        num_boost_round = (params or {}).get("n_estimators") or 100
+        booster = xgb.train(booster_params(params=params, max_bin=max_bin, nthread=nthread), dtrain,
+                            num_boost_round=num_boost_round)
+        return BoosterClassifier(booster=booster)
+    except Exception as e:
+        raise SensorException(e, sys)
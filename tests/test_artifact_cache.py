@@ -0,0 +1,87 @@
+import os
+from sensor.artifact_cache import ArtifactCache, file_hash
+
+
+def write_text(file_path:str, text:str):
+    with open(file_path, "w") as file_obj:
+        file_obj.write(text)
+
+
+def read_text(file_path:str)->str:
+    with open(file_path) as file_obj:
+        return file_obj.read()
+
+
+def test_saved_artifact_is_served_from_memory(tmp_path):
+    cache = ArtifactCache()
+    file_path = os.path.join(tmp_path, "artifact.txt")
+    cache.put(file_path, "first", writer=write_text)
+    assert read_text(file_path) == "first"
+    assert cache.get(file_path, loader=lambda path: "loaded") == "first"
+    assert cache.io_report()["unknown"]["cache_hits"] == 1
+
+
+def test_file_rewritten_outside_the_cache_is_read_again(tmp_path):
+    cache = ArtifactCache()
+    file_path = os.path.join(tmp_path, "artifact.txt")
+    cache.put(file_path, "first", writer=write_text)
+
+    # different size
+    write_text(file_path, "second version")
+    assert cache.get(file_path, loader=read_text) == "second version"
+    # same size, different mtime
+    write_text(file_path, "third  version")
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert cache.get(file_path, loader=read_text) == "third  version"
+    # the loaded object is cached for the file as it is now
+    assert cache.get(file_path, loader=lambda path: "loaded") == "third  version"
+
+
+def test_content_hash_is_computed_lazily_per_written_version(tmp_path, monkeypatch):
+    from sensor import artifact_cache as artifact_cache_module
+    hashed = []
+    monkeypatch.setattr(artifact_cache_module, "file_hash",
+                        lambda file_path: hashed.append(file_path) or file_hash(file_path))
+    cache = ArtifactCache()
+    file_path = os.path.join(tmp_path, "artifact.txt")
+    cache.put(file_path, "first", writer=write_text)
+    # writes never read their file back
+    assert hashed == []
+    first_hash = cache.get_content_hash(file_path)
+    assert cache.get_content_hash(file_path) == first_hash and len(hashed) == 1
+
+    cache.put(file_path, "second version", writer=write_text)
+    assert cache.get_content_hash(file_path) != first_hash and len(hashed) == 2
+
+
+def test_background_writes_are_flushed(tmp_path):
+    cache = ArtifactCache(background_writes=True)
+    file_paths = [os.path.join(tmp_path, f"artifact_{index}.txt") for index in range(5)]
+    for index, file_path in enumerate(file_paths):
+        cache.put(file_path, f"value {index}", writer=write_text)
+    # pending writes are served from memory and hashed once written
+    assert cache.get(file_paths[0], loader=lambda path: "loaded") == "value 0"
+    assert cache.get_content_hash(file_paths[1]) == file_hash(file_paths[1])
+    cache.flush()
+    assert [read_text(file_path) for file_path in file_paths] == [f"value {index}" for index in range(5)]
+
+
+def test_copy_eviction_and_disabled_cache(tmp_path):
+    cache = ArtifactCache(max_items=2)
+    src_file_path = os.path.join(tmp_path, "src.txt")
+    dst_file_path = os.path.join(tmp_path, "copy", "dst.txt")
+    cache.put(src_file_path, "value", writer=write_text)
+    cache.copy(src_file_path, dst_file_path)
+    assert read_text(dst_file_path) == "value"
+    assert cache.get(dst_file_path, loader=lambda path: "loaded") == "value"
+
+    # least recently used entries are dropped first
+    cache.put(os.path.join(tmp_path, "other.txt"), "other", writer=write_text)
+    assert cache.get(src_file_path, loader=lambda path: "loaded") == "loaded"
+
+    cache.configure(enabled=False)
+    file_path = os.path.join(tmp_path, "uncached.txt")
+    cache.put(file_path, "value", writer=write_text)
+    assert cache.get(file_path, loader=read_text) == "value"
+    assert cache.get(file_path, loader=lambda path: "loaded") == "loaded"
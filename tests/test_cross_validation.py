@@ -0,0 +1,36 @@
+import os
+import numpy as np
+from sklearn.metrics import f1_score
+from sensor import cross_validation
+
+
+def save_arrays(tmp_path, rows:int=600):
+    # imbalanced like the APS data, one positive for nine negatives
+    rng = np.random.default_rng(0)
+    y = (rng.random(rows) < 0.1).astype(np.int8)
+    x = (rng.normal(size=(rows, 6)) + y[:, None] * 1.5).astype(np.float32)
+    x_file_path, y_file_path = os.path.join(tmp_path, "x.npy"), os.path.join(tmp_path, "y.npy")
+    np.save(x_file_path, x)
+    np.save(y_file_path, y)
+    return x_file_path, y_file_path, x, y
+
+
+def test_fold_scores_are_taken_on_rows_before_resampling(tmp_path):
+    x_file_path, y_file_path, x, y = save_arrays(tmp_path)
+    train_rows, validation_rows = np.arange(0, 450), np.arange(450, 600)
+    result = cross_validation._train_fold(x_file_path, y_file_path, train_rows, validation_rows,
+                                          params={"n_estimators": 20}, n_jobs=1, keep_model=True,
+                                          resampling_params={"strategy": "smote", "random_state": 0})
+    model = result["model"]
+    assert result["f1_train"] == f1_score(y[train_rows], model.predict(x[train_rows]))
+    assert result["f1_validation"] == f1_score(y[validation_rows], model.predict(x[validation_rows]))
+
+
+def test_cross_validate_returns_one_score_per_fold(tmp_path):
+    x_file_path, y_file_path, _, _ = save_arrays(tmp_path)
+    scores = cross_validation.cross_validate(x_file_path, y_file_path, n_folds=3, n_workers=1,
+                                             params={"n_estimators": 20}, keep_models=True, random_state=0,
+                                             resampling_params={"strategy": "smote", "random_state": 0})
+    assert len(scores["f1_train"]) == len(scores["f1_validation"]) == len(scores["models"]) == 3
+    ensemble = cross_validation.FoldEnsembleClassifier(models=scores["models"])
+    assert ensemble.predict(np.load(x_file_path)).shape == (600,)
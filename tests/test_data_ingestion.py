@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta, timezone
+import mongomock
+import pytest
+from bson import ObjectId
+from sensor import utils
+from sensor.entity import config_entity
+from sensor.components.data_ingestion import DataIngestion
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    # in-memory stand-in for the shared client of sensor.config, persistent feature store under tmp_path
+    monkeypatch.chdir(tmp_path)
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(utils, "mongo_client", client)
+    return client
+
+
+def get_data_ingestion(lag_seconds:int=300) -> DataIngestion:
+    config = config_entity.DataIngestionConfig(training_pipeline_config=config_entity.TrainingPipelineConfig())
+    config.ingestion_mode = "incremental"
+    config.ingestion_lag_seconds = lag_seconds
+    return DataIngestion(data_ingestion_config=config)
+
+
+def insert_documents(client, n_documents:int, seconds_ago:int, start:int=0):
+    # _ids carry the insert time like the ObjectIds made by the clients
+    timestamp = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)).binary[:4]
+    client["aps"]["sensor"].insert_many([{"_id": ObjectId(timestamp + (start + row).to_bytes(8, "big")),
+                                          "class": "neg", "aa_000": float(start + row)}
+                                         for row in range(n_documents)])
+
+
+def test_new_documents_are_appended_as_parts(client):
+    insert_documents(client, 30, seconds_ago=3600)
+    assert get_data_ingestion().export_new_documents() == 30
+    insert_documents(client, 20, seconds_ago=1800, start=30)
+    data_ingestion = get_data_ingestion()
+    assert data_ingestion.export_new_documents() == 20
+    assert get_data_ingestion().export_new_documents() == 0
+
+    part_file_names = [os.path.basename(file_path) for file_path in data_ingestion.get_feature_store_part_paths()]
+    assert part_file_names == ["part-00000.npy", "part-00001.npy"]
+    watermark = data_ingestion.read_watermark()
+    assert watermark["parts"] == {"part-00000.npy": 30, "part-00001.npy": 20}
+    df = data_ingestion.load_feature_store()
+    assert df["aa_000"].tolist() == [float(row) for row in range(50)]
+
+
+def test_documents_inside_the_lag_window_wait_for_a_later_run(client):
+    insert_documents(client, 10, seconds_ago=3600)
+    insert_documents(client, 5, seconds_ago=60, start=10)
+    data_ingestion = get_data_ingestion()
+    state = data_ingestion.get_collection_state()
+    assert state["documents"] == 10
+    assert data_ingestion.export_new_documents() == 10
+    assert get_data_ingestion().get_collection_state() == state
+
+    # once the documents aged past the lag the fingerprint changes and they are ingested
+    data_ingestion = get_data_ingestion(lag_seconds=30)
+    assert data_ingestion.get_collection_state()["documents"] == 15
+    assert data_ingestion.export_new_documents() == 5
+    assert data_ingestion.load_feature_store().shape[0] == 15
+
+
+def test_load_feature_store_checks_the_watermark_history(client):
+    insert_documents(client, 10, seconds_ago=3600)
+    get_data_ingestion().export_new_documents()
+    insert_documents(client, 5, seconds_ago=1800, start=10)
+    data_ingestion = get_data_ingestion()
+    data_ingestion.export_new_documents()
+    # a part missing from the store would silently drop its rows from training
+    os.remove(data_ingestion.get_feature_store_part_paths()[0])
+    with pytest.raises(Exception):
+        data_ingestion.load_feature_store()
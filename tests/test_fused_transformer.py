@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sensor import utils
+from sensor.schema import FEATURE_COLUMNS
+from sensor.components.data_transformation import DataTransformation
+from sensor.fused_transformer import FusedTransformer, save_fused_transformer, load_fused_transformer
+
+COLUMNS = FEATURE_COLUMNS[:20]
+
+
+def make_dataset(rows:int, seed:int)->pd.DataFrame:
+    # skewed sensor like readings with missing values, a constant column and an all missing column
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=3.0, sigma=2.0, size=(rows, len(COLUMNS))).astype(np.float32)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[:, 1] = 5.0
+    values[:, 2] = np.nan
+    return pd.DataFrame(values, columns=COLUMNS)
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = DataTransformation.get_data_transformer_object()
+    pipeline.fit(make_dataset(2000, seed=1))
+    return pipeline
+
+
+def assert_same_transform(fused:FusedTransformer, pipeline, df:pd.DataFrame):
+    expected = pipeline.transform(df)
+    result = fused.transform(df)
+    assert result.dtype == np.float32
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_matches_pipeline(pipeline):
+    fused = FusedTransformer.from_pipeline(pipeline)
+    assert list(fused.feature_names_out_) == [str(name) for name in pipeline[0].get_feature_names_out()]
+    df = make_dataset(3000, seed=2)
+    assert_same_transform(fused, pipeline, df)
+    # arrays are transformed like dataframes, in place when asked for
+    np.testing.assert_array_equal(fused.transform(df.to_numpy()), fused.transform(df))
+    # the all missing column is dropped by the imputer, in place needs exactly the output columns
+    arr = np.ascontiguousarray(df[list(fused.feature_names_out_)].to_numpy(dtype=np.float32))
+    result = fused.transform(arr, copy=False)
+    assert result is arr
+    np.testing.assert_array_equal(result, fused.transform(df))
+
+
+def test_save_load_round_trip(pipeline, tmp_path):
+    fused = FusedTransformer.from_pipeline(pipeline)
+    file_path = os.path.join(tmp_path, "fused_transformer.npz")
+    fused.save(file_path)
+    loaded = FusedTransformer.load(file_path)
+    assert list(loaded.feature_names_in_) == list(fused.feature_names_in_)
+    assert list(loaded.feature_names_out_) == list(fused.feature_names_out_)
+    df = make_dataset(500, seed=3)
+    np.testing.assert_array_equal(loaded.transform(df), fused.transform(df))
+    assert_same_transform(loaded, pipeline, df)
+
+
+def test_load_falls_back_to_pipeline(pipeline, tmp_path):
+    transformer_path = os.path.join(tmp_path, "transformer.pkl")
+    utils.save_object(file_path=transformer_path, obj=pipeline)
+    df = make_dataset(500, seed=4)
+
+    # models saved before the fused transformer existed only have the pickled pipeline
+    fused = load_fused_transformer(file_path=os.path.join(tmp_path, "missing.npz"), transformer_path=transformer_path)
+    assert_same_transform(fused, pipeline, df)
+    fused = load_fused_transformer(file_path=None, transformer_path=transformer_path)
+    assert_same_transform(fused, pipeline, df)
+
+    # a saved fused transformer is preferred over the pipeline
+    file_path = os.path.join(tmp_path, "fused_transformer.npz")
+    save_fused_transformer(file_path=file_path, transformer=FusedTransformer.from_pipeline(pipeline))
+    assert_same_transform(load_fused_transformer(file_path=file_path, transformer_path=transformer_path), pipeline, df)
+
+    with pytest.raises(Exception):
+        load_fused_transformer(file_path=os.path.join(tmp_path, "missing.npz"))
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+import pytest
+from sensor.components import model_evaluation
+from sensor.model_registry import ModelRegistry
+
+
+class FakeEvaluationEngine:
+    # scores the challenger above every champion and records which candidates were scored
+    scored = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def score(self, candidates:list)->dict:
+        FakeEvaluationEngine.scored.append([candidate.name for candidate in candidates])
+        return {candidate.name: 1.0 if candidate.name == "current" else 0.5 for candidate in candidates}
+
+
+@pytest.fixture
+def model_eval(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(model_evaluation, "EvaluationEngine", FakeEvaluationEngine)
+    FakeEvaluationEngine.scored = []
+    registry = ModelRegistry("saved_models")
+    for _ in range(4):
+        registry.publish(registry.create_staging_dir())
+    config = SimpleNamespace(champion_versions=1, score_cache_file_path=None, evaluation_workers=1,
+                             use_fused_transformer=False)
+    return registry, model_evaluation.ModelEvaluation(
+        model_eval_config=config, data_ingestion_artifact=SimpleNamespace(test_file_path="test.npy"),
+        data_transformation_artifact=SimpleNamespace(transform_object_path="transformer.pkl",
+                                                     target_encoder_path="target_encoder.pkl",
+                                                     fused_transform_object_path=None),
+        model_trainer_artifact=SimpleNamespace(model_path="model.pkl"))
+
+
+def test_current_version_is_always_a_champion(model_eval):
+    registry, evaluation = model_eval
+    assert evaluation.initiate_model_evaluation().is_model_accepted
+    # after a rollback the serving version is scored next to the latest one
+    registry.set_current_version(1)
+    evaluation.initiate_model_evaluation()
+    assert FakeEvaluationEngine.scored == [["3", "current"], ["1", "3", "current"]]
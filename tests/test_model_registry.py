@@ -0,0 +1,70 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sensor.model_registry import ModelRegistry, MANIFEST_FILE_NAME, STAGING_DIR_PREFIX
+
+
+def publish_version(registry:ModelRegistry, content:str, make_current:bool=True)->str:
+    staging_dir = registry.create_staging_dir()
+    with open(os.path.join(staging_dir, "model.txt"), "w") as file_obj:
+        file_obj.write(content)
+    return registry.publish(staging_dir, make_current=make_current)
+
+
+def test_publish_records_versions_in_the_manifest(tmp_path):
+    registry = ModelRegistry(registry_dir=os.path.join(tmp_path, "saved_models"))
+    assert registry.get_versions() == [] and registry.get_current_version() is None
+
+    assert publish_version(registry, "a") == registry.get_version_dir(0)
+    assert publish_version(registry, "b") == registry.get_version_dir(1)
+    assert registry.get_versions() == [0, 1] and registry.get_current_version() == 1
+    with open(os.path.join(registry.get_version_dir(1), "model.txt")) as file_obj:
+        assert file_obj.read() == "b"
+    # staging directories are renamed, nothing half written is left behind
+    assert not any(name.startswith(STAGING_DIR_PREFIX) for name in os.listdir(registry.registry_dir))
+
+    # a version published without becoming current leaves the served one alone
+    publish_version(registry, "c", make_current=False)
+    assert registry.get_versions() == [0, 1, 2] and registry.get_current_version() == 1
+    with open(registry.manifest_file_path) as manifest_file:
+        assert json.load(manifest_file) == {"format": 1, "versions": [0, 1, 2], "current": 1}
+
+
+def test_concurrent_publishers_get_distinct_versions(tmp_path):
+    registry_dir = os.path.join(tmp_path, "saved_models")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        version_dirs = list(executor.map(lambda index: publish_version(ModelRegistry(registry_dir), f"{index}"),
+                                         range(16)))
+    assert len(set(version_dirs)) == 16
+    assert ModelRegistry(registry_dir).get_versions() == list(range(16))
+
+
+def test_rollback_to_a_published_version(tmp_path):
+    registry = ModelRegistry(registry_dir=os.path.join(tmp_path, "saved_models"))
+    for content in ["a", "b", "c"]:
+        publish_version(registry, content)
+    registry.set_current_version(0)
+    assert registry.get_current_version() == 0
+    # the next version is numbered after every published one, also after a rollback
+    assert publish_version(registry, "d") == registry.get_version_dir(3)
+    assert registry.get_current_version() == 3
+    with pytest.raises(Exception):
+        registry.set_current_version(7)
+    assert registry.get_current_version() == 3
+
+
+def test_registry_without_manifest_is_indexed_from_its_directories(tmp_path):
+    # saved_models written before the manifest: numeric version directories next to stray entries
+    registry_dir = os.path.join(tmp_path, "saved_models")
+    for name in ["0", "1", "3", "notes", ".staging-old"]:
+        os.makedirs(os.path.join(registry_dir, name))
+    with open(os.path.join(registry_dir, "2"), "w") as file_obj:
+        file_obj.write("not a version directory")
+    registry = ModelRegistry(registry_dir=registry_dir)
+    assert not os.path.exists(os.path.join(registry_dir, MANIFEST_FILE_NAME))
+    assert registry.get_versions() == [0, 1, 3] and registry.get_current_version() == 3
+
+    # the first publish writes the manifest, numbered above the legacy directories
+    assert publish_version(registry, "new") == registry.get_version_dir(4)
+    assert registry.get_versions() == [0, 1, 3, 4] and registry.get_current_version() == 4
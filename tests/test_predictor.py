@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder
+from xgboost import XGBClassifier
+from sensor import utils
+from sensor.components.data_transformation import DataTransformation
+from sensor.fused_transformer import FusedTransformer, save_fused_transformer
+from sensor.model_bundle import save_model_bundle
+from sensor.predictor import ModelResolver
+from sensor.schema import FEATURE_COLUMNS
+from sensor.xgb_training import BoosterClassifier
+
+COLUMNS = FEATURE_COLUMNS[:10]
+
+
+@pytest.fixture
+def resolver(monkeypatch, tmp_path):
+    # one published version with the pickles, the fused transformer and the model bundle, as the pusher saves it
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.lognormal(size=(400, len(COLUMNS))).astype(np.float32), columns=COLUMNS)
+    labels = np.where(df[COLUMNS[0]] > 1.0, "pos", "neg")
+    transformer = DataTransformation.get_data_transformer_object().fit(df)
+    target_encoder = LabelEncoder().fit(labels)
+    model = XGBClassifier(n_estimators=10).fit(transformer.transform(df), target_encoder.transform(labels))
+    fused_transformer = FusedTransformer.from_pipeline(transformer)
+
+    resolver = ModelResolver(model_registry="saved_models")
+    staging_dir = resolver.registry.create_staging_dir()
+    paths = resolver.get_version_paths(staging_dir)
+    utils.save_object(file_path=paths["transformer"], obj=transformer)
+    utils.save_object(file_path=paths["model"], obj=model)
+    utils.save_object(file_path=paths["target_encoder"], obj=target_encoder)
+    save_fused_transformer(file_path=paths["fused_transformer"], transformer=fused_transformer)
+    save_model_bundle(file_path=paths["bundle"], model=model, transformer=fused_transformer,
+                      target_encoder=target_encoder)
+    resolver.registry.publish(staging_dir)
+    return resolver, df
+
+
+def test_load_artifacts_honours_use_fused_transformer(resolver):
+    resolver, df = resolver
+    # the sklearn pipeline and the pickled model stay the default even when the version has a bundle
+    artifacts = resolver.load_artifacts(use_fused_transformer=False)
+    assert isinstance(artifacts.transformer, Pipeline)
+    assert isinstance(artifacts.model, XGBClassifier)
+    expected = artifacts.model.predict(artifacts.transformer.transform(df))
+
+    # the bundle is read when the fused transformer is asked for
+    artifacts = resolver.load_artifacts(use_fused_transformer=True)
+    assert isinstance(artifacts.transformer, FusedTransformer)
+    assert isinstance(artifacts.model, BoosterClassifier)
+    np.testing.assert_array_equal(artifacts.model.predict(artifacts.transformer.transform(df)), expected)
+
+    # without the bundle the fused transformer is loaded next to the pickled model
+    artifacts = ModelResolver(model_registry="saved_models", use_bundle=False).load_artifacts(
+        use_fused_transformer=True)
+    assert isinstance(artifacts.transformer, FusedTransformer)
+    assert isinstance(artifacts.model, XGBClassifier)
+    np.testing.assert_array_equal(artifacts.model.predict(artifacts.transformer.transform(df)), expected)
@@ -0,0 +1,20 @@
+import numpy as np
+from sensor import schema
+
+
+def test_read_prediction_csv_keeps_columns_outside_the_schema(tmp_path):
+    file_path = tmp_path / "input.csv"
+    file_path.write_text("truck_id,aa_000,date,ab_000,note\n"
+                         "T-001,1.5,2024-01-02,na,na\n"
+                         "T-002,na,2024-01-03,7,ok\n")
+    df = schema.read_prediction_csv(file_path)
+    assert list(df.columns) == ["truck_id", "aa_000", "date", "ab_000", "note"]
+    assert df["aa_000"].dtype == schema.FEATURE_DTYPE and df["ab_000"].dtype == schema.FEATURE_DTYPE
+    np.testing.assert_array_equal(df["aa_000"], np.array([1.5, np.nan], dtype=np.float32))
+    # the missing reading sentinel only applies to sensor columns
+    assert df["truck_id"].tolist() == ["T-001", "T-002"]
+    assert df["date"].tolist() == ["2024-01-02", "2024-01-03"]
+    assert df["note"].tolist() == ["na", "ok"]
+
+    chunks = list(schema.read_prediction_csv(file_path, chunksize=1))
+    assert [chunk.shape for chunk in chunks] == [(1, 5), (1, 5)]
@@ -0,0 +1,68 @@
+import asyncio
+import numpy as np
+import pytest
+from sensor.scoring_service import LatencyMetrics, MicroBatcher, ScoringModel
+from sensor.schema import FEATURE_COLUMNS
+
+
+def run_requests(batcher:MicroBatcher, rows:list)->list:
+    # rows submitted by concurrent requests, results (or exceptions) in request order
+    async def main():
+        await batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.submit(row) for row in rows], return_exceptions=True)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_are_coalesced_into_batches():
+    batches = []
+
+    def predict(rows:list)->list:
+        batches.append(len(rows))
+        return [row * 10 for row in rows]
+
+    metrics = LatencyMetrics()
+    batcher = MicroBatcher(predict=predict, max_batch_size=8, max_wait_ms=50, metrics=metrics)
+    assert run_requests(batcher, list(range(20))) == [row * 10 for row in range(20)]
+    # every row is predicted once, in batches of at most max_batch_size rows
+    assert sum(batches) == 20 and max(batches) == 8 and len(batches) < 20
+    assert metrics.snapshot()["mean_batch_size"] == pytest.approx(20 / len(batches))
+
+
+def test_failed_batch_fails_its_own_requests_only():
+    calls = []
+
+    def predict(rows:list)->list:
+        calls.append(list(rows))
+        if len(calls) == 1:
+            raise ValueError("model failed")
+        return rows
+
+    async def main():
+        batcher = MicroBatcher(predict=predict, max_batch_size=4, max_wait_ms=20)
+        await batcher.start()
+        try:
+            first = await asyncio.gather(*[batcher.submit(row) for row in range(3)], return_exceptions=True)
+            second = await asyncio.gather(*[batcher.submit(row) for row in range(3, 6)], return_exceptions=True)
+            return first, second
+        finally:
+            await batcher.stop()
+
+    first, second = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in first)
+    assert second == [3, 4, 5]
+
+
+def test_records_without_schema_fields_are_rejected(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    scoring_model = ScoringModel(model_registry="saved_models")
+    row = scoring_model.to_row({"aa_000": 5, "ab_000": "na", "unknown": 1})
+    assert row.shape == (len(FEATURE_COLUMNS),)
+    assert row[0] == 5 and np.isnan(row[1:]).all()
+    for record in [{}, {"unknown": 1}]:
+        with pytest.raises(ValueError):
+            scoring_model.to_row(record)
+    with pytest.raises(ValueError):
+        ScoringModel(model_registry="saved_models", min_fields=2).to_row({"aa_000": 5})
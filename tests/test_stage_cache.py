@@ -0,0 +1,92 @@
+import os
+from dataclasses import dataclass
+from sensor.stage_cache import StageCache
+
+
+@dataclass
+class OutputArtifact:
+    output_file_path:str
+    rows:int
+
+
+class StageConfig:
+
+    def __init__(self, artifact_dir:str, threshold:float=0.5):
+        self.output_file_path = os.path.join(artifact_dir, "stage", "output.txt")
+        self.threshold = threshold
+
+
+class CountingStage:
+    # writes its output under the run's artifact dir and counts how often it really ran
+
+    def __init__(self, config:StageConfig, input_file_path:str):
+        self.config = config
+        self.input_file_path = input_file_path
+        self.calls = 0
+
+    def run(self)->OutputArtifact:
+        self.calls += 1
+        with open(self.input_file_path) as file_obj:
+            lines = file_obj.read().splitlines()
+        os.makedirs(os.path.dirname(self.config.output_file_path), exist_ok=True)
+        with open(self.config.output_file_path, "w") as file_obj:
+            file_obj.write("\n".join(lines))
+        return OutputArtifact(output_file_path=self.config.output_file_path, rows=len(lines))
+
+
+def write_input(file_path:str, rows:int):
+    with open(file_path, "w") as file_obj:
+        file_obj.write("\n".join(f"row {row}" for row in range(rows)))
+
+
+def run_stage(tmp_path, run_name:str, input_file_path:str, threshold:float=0.5, extra:dict=None,
+              enabled:bool=True):
+    # every run has its own artifact dir, the index is shared
+    artifact_dir = os.path.join(tmp_path, "artifact", run_name)
+    stage_cache = StageCache(cache_dir=os.path.join(tmp_path, "artifact", "stage_cache"), artifact_dir=artifact_dir,
+                             enabled=enabled)
+    stage = CountingStage(config=StageConfig(artifact_dir, threshold=threshold), input_file_path=input_file_path)
+    artifact = stage_cache.run(stage_name="stage", config=stage.config, artifact_cls=OutputArtifact, run_fn=stage.run,
+                               input_paths=[input_file_path], code_files=[__file__], extra=extra)
+    return artifact, stage.calls
+
+
+def test_unchanged_stage_reuses_the_output_of_an_earlier_run(tmp_path):
+    input_file_path = os.path.join(tmp_path, "input.txt")
+    write_input(input_file_path, rows=3)
+    first, calls = run_stage(tmp_path, "run_1", input_file_path)
+    assert calls == 1 and first.rows == 3
+    # the run specific artifact dir inside the config does not change the fingerprint
+    second, calls = run_stage(tmp_path, "run_2", input_file_path)
+    assert calls == 0 and second == first
+    _, calls = run_stage(tmp_path, "run_3", input_file_path, enabled=False)
+    assert calls == 1
+
+
+def test_changed_inputs_config_or_extra_run_the_stage_again(tmp_path):
+    input_file_path = os.path.join(tmp_path, "input.txt")
+    write_input(input_file_path, rows=3)
+    run_stage(tmp_path, "run_1", input_file_path, extra={"documents": 3})
+
+    write_input(input_file_path, rows=5)
+    artifact, calls = run_stage(tmp_path, "run_2", input_file_path, extra={"documents": 3})
+    assert calls == 1 and artifact.rows == 5
+    _, calls = run_stage(tmp_path, "run_3", input_file_path, threshold=0.7, extra={"documents": 3})
+    assert calls == 1
+    _, calls = run_stage(tmp_path, "run_4", input_file_path, extra={"documents": 5})
+    assert calls == 1
+    _, calls = run_stage(tmp_path, "run_5", input_file_path, extra={"documents": 5})
+    assert calls == 0
+
+
+def test_missing_output_runs_the_stage_again(tmp_path):
+    input_file_path = os.path.join(tmp_path, "input.txt")
+    write_input(input_file_path, rows=3)
+    first, _ = run_stage(tmp_path, "run_1", input_file_path)
+    # e.g. old run directories were cleaned up
+    os.remove(first.output_file_path)
+    second, calls = run_stage(tmp_path, "run_2", input_file_path)
+    assert calls == 1 and os.path.exists(second.output_file_path)
+    assert second.output_file_path != first.output_file_path
+    _, calls = run_stage(tmp_path, "run_3", input_file_path)
+    assert calls == 0
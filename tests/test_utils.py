@@ -0,0 +1,76 @@
+import mongomock
+import numpy as np
+import pytest
+from sensor import utils
+
+DATABASE_NAME = "aps"
+COLLECTION_NAME = "sensor"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # in-memory stand-in for the shared client of sensor.config
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(utils, "mongo_client", client)
+    return client
+
+
+def insert_documents(client, documents:list):
+    client[DATABASE_NAME][COLLECTION_NAME].insert_many(documents)
+
+
+def test_partitioned_read_matches_single_cursor(client):
+    rng = np.random.default_rng(0)
+    documents = []
+    for row in range(1000):
+        documents.append({"class": "pos" if row % 7 == 0 else "neg",
+                          "aa_000": float(rng.normal()), "ab_000": "na" if row % 5 == 0 else str(row),
+                          "ac_000": float(row)})
+    insert_documents(client, documents)
+
+    expected = utils.get_collection_as_arrays(DATABASE_NAME, COLLECTION_NAME, batch_size=64, client=client)
+    for n_workers in [2, 3, 8]:
+        columns = utils.get_collection_as_arrays_partitioned(DATABASE_NAME, COLLECTION_NAME, batch_size=64,
+                                                             n_workers=n_workers, executor="thread")
+        assert list(columns.keys()) == list(expected.keys())
+        for column in expected:
+            np.testing.assert_array_equal(columns[column], expected[column])
+    # row order is the insertion (_id) order
+    np.testing.assert_array_equal(columns["ac_000"], np.arange(1000, dtype=np.float32))
+
+
+def test_partitioned_read_keeps_columns_of_every_partition(client):
+    # the first half of the collection has no ac_000, the second half an extra field outside the schema
+    documents = [{"class": "neg", "aa_000": float(row), "ab_000": 1.0} for row in range(50)]
+    documents += [{"extra": 3.0, "class": "pos", "ac_000": float(row), "aa_000": float(row), "ab_000": 2.0}
+                  for row in range(50, 100)]
+    insert_documents(client, documents)
+
+    columns = utils.get_collection_as_arrays_partitioned(DATABASE_NAME, COLLECTION_NAME, batch_size=16,
+                                                         n_workers=2, executor="thread")
+    assert list(columns.keys()) == ["class", "aa_000", "ab_000", "ac_000", "extra"]
+    assert all(len(values) == 100 for values in columns.values())
+    np.testing.assert_array_equal(columns["aa_000"], np.arange(100, dtype=np.float32))
+    assert np.isnan(columns["ac_000"][:50]).all()
+    np.testing.assert_array_equal(columns["ac_000"][50:], np.arange(50, 100, dtype=np.float32))
+    assert np.isnan(columns["extra"][:50]).all()
+    assert (columns["extra"][50:] == 3.0).all()
+
+
+def test_single_cursor_and_partitioned_reads_keep_fields_of_later_documents(client):
+    # ac_000 first appears in the middle of a batch, the target is missing from a few documents
+    documents = [{"class": "neg", "aa_000": float(row)} for row in range(70)]
+    documents += [{"class": "pos", "aa_000": float(row), "ac_000": float(row)} for row in range(70, 100)]
+    for row in [3, 90]:
+        del documents[row]["class"]
+    insert_documents(client, documents)
+
+    frames = [utils.get_collection_as_dataframe(DATABASE_NAME, COLLECTION_NAME, batch_size=16, n_workers=n_workers,
+                                                executor="thread") for n_workers in [1, 2, 3]]
+    for df in frames:
+        assert list(df.columns) == ["class", "aa_000", "ac_000"]
+        assert df.shape == (100, 3)
+        assert df["ac_000"].iloc[:70].isna().all()
+        np.testing.assert_array_equal(df["ac_000"].iloc[70:], np.arange(70, 100, dtype=np.float32))
+        assert df["class"].isna().sum() == 2
+        assert df.equals(frames[0])
@@ -0,0 +1,33 @@
+import gc
+import os
+import numpy as np
+from sensor import xgb_training
+
+
+def test_external_memory_pages_are_owned_by_their_matrix(tmp_path, monkeypatch):
+    monkeypatch.setattr(xgb_training, "_matrix_cache", xgb_training.OrderedDict())
+    rng = np.random.default_rng(0)
+    x_file_path, y_file_path = os.path.join(tmp_path, "x.npy"), os.path.join(tmp_path, "y.npy")
+    np.save(x_file_path, rng.normal(size=(500, 4)).astype(np.float32))
+    np.save(y_file_path, (rng.random(500) < 0.3).astype(np.int8))
+    cache_dir = os.path.join(tmp_path, "dmatrix")
+    # a page directory of another run reading the same data is left alone
+    other_dir = os.path.join(cache_dir, "other_run")
+    os.makedirs(other_dir)
+
+    matrix = xgb_training.get_external_memory_matrix(x_file_path, y_file_path, cache_dir=cache_dir, chunk_rows=128)
+    model = xgb_training.train_booster(dtrain=matrix, params={"n_estimators": 5})
+    assert model.predict(matrix).shape == (500,)
+    page_dirs = sorted(os.listdir(cache_dir))
+    assert len(page_dirs) == 2 and "other_run" in page_dirs
+
+    # a second matrix of the same data gets its own directory
+    xgb_training._matrix_cache.clear()
+    second = xgb_training.get_external_memory_matrix(x_file_path, y_file_path, cache_dir=cache_dir, chunk_rows=128)
+    assert len(os.listdir(cache_dir)) == 3
+
+    # freed matrices remove their pages
+    xgb_training._matrix_cache.clear()
+    del matrix, second, model
+    gc.collect()
+    assert os.listdir(cache_dir) == ["other_run"]